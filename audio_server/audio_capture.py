@@ -45,6 +45,15 @@ class AudioCapture:
         self.channel_manager = None
         self.master_client_id = None
 
+        # ✅ NUEVO: Motor de mezcla matricial (todas las mezclas en servidor por bloque)
+        self.mix_engine = None
+
+        # ✅ NUEVO: Instante (time.monotonic_ns) en que el ADC capturó la primera muestra
+        # del bloque actual, anclado a time_info.inputBufferAdcTime de PortAudio
+        self.current_block_adc_ns = None
+        self.adc_to_callback_ms = 0.0
+        self.adc_time_supported = None  # None = aún no se sabe
+
         
 
         # 🎚️ VU METERS: Sistema de análisis de niveles
@@ -236,6 +245,11 @@ class AudioCapture:
         self.audio_mixer = mixer
         print(f"[AudioCapture] 🎛️ AudioMixer conectado")
     
+    def set_mix_engine(self, engine):
+        """✅ NUEVO: Conectar motor de mezcla matricial"""
+        self.mix_engine = engine
+        print(f"[AudioCapture] 🎛️ Motor de mezcla conectado")
+
     def set_channel_manager(self, channel_manager):
         """✅ NUEVO: Conectar ChannelManager"""
         self.channel_manager = channel_manager
@@ -559,15 +573,26 @@ class AudioCapture:
 
             print(f"[RF] ⚠️ Status: {status}")
 
+        # ✅ NUEVO: Marca de tiempo ADC del bloque en el reloj monótono del servidor
+        self.current_block_adc_ns = self._block_adc_ns(time_info, frames)
         
+        # ✅ Vista ndarray del bloque (sin copia), compartida por motor de mezcla y mixer
+        if isinstance(indata, memoryview):
+            audio_array = np.frombuffer(indata, dtype=np.float32).reshape(-1, self.actual_channels)
+        else:
+            audio_array = indata
+
+        # ✅ NUEVO: Todas las mezclas del servidor en una sola matmul, antes de los consumidores
+        if self.mix_engine:
+            try:
+                self.mix_engine.process(audio_array)
+            except Exception as e:
+                if config.DEBUG:
+                    print(f"[RF] ⚠️ Error motor de mezcla: {e}")
+
         # ✅ Procesar audio para cliente maestro
         if self.audio_mixer and self.channel_manager and self.master_client_id:
             try:
-                if isinstance(indata, memoryview):
-                    audio_array = np.frombuffer(indata, dtype=np.float32).reshape(-1, self.actual_channels)
-                else:
-                    audio_array = indata
-                
                 self.audio_mixer.process_and_broadcast(
                     audio_array,
                     self.channel_manager,
@@ -666,6 +691,31 @@ class AudioCapture:
 
     
 
+    def _block_adc_ns(self, time_info, frames):
+        """
+        ✅ NUEVO: Convertir inputBufferAdcTime (reloj del stream de PortAudio) a
+        time.monotonic_ns: ahora_monotónico - (currentTime - inputBufferAdcTime).
+        Si el host API no da marcas ADC, se estima con la duración del bloque.
+        """
+        now_ns = time.monotonic_ns()
+        try:
+            adc_time = time_info.inputBufferAdcTime
+            current_time = time_info.currentTime
+        except AttributeError:
+            adc_time = current_time = 0.0
+        
+        delay = current_time - adc_time
+        if adc_time > 0 and current_time > 0 and 0.0 <= delay < 1.0:
+            self.adc_time_supported = True
+        else:
+            if self.adc_time_supported is None:
+                print("[RF] ⚠️ inputBufferAdcTime no disponible: marca ADC estimada por tamaño de bloque")
+            self.adc_time_supported = False
+            delay = frames / config.SAMPLE_RATE
+        
+        self.adc_to_callback_ms = delay * 1000
+        return now_ns - int(delay * 1e9)
+
     def stop_capture(self):
 
         """Detener captura de audio"""
@@ -748,6 +798,10 @@ class AudioCapture:
 
             'vu_enabled': self.vu_callback is not None,
 
-            'vu_update_interval': self.vu_update_interval
+            'vu_update_interval': self.vu_update_interval,
+
+            'adc_time_supported': self.adc_time_supported,  # ✅ NUEVO
+
+            'adc_to_callback_ms': round(self.adc_to_callback_ms, 3)
 
         }
\ No newline at end of file
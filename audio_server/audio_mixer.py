@@ -6,6 +6,8 @@ import logging
 import time
 from threading import Lock
 
+from audio_server.mix_engine import get_mix_engine
+
 logger = logging.getLogger(__name__)
 
 _audio_mixer_instance = None
@@ -49,41 +51,20 @@ class AudioMixer:
             if not self.broadcast_callback or not audio_data.size:
                 return
             
-            # Obtener suscripción del maestro
-            subscription = channel_manager.get_client_subscription(master_client_id)
-            if not subscription:
-                return
-            
-            channels = subscription.get('channels', [])
-            if not channels:
+            # ✅ OPTIMIZACIÓN: Debouncing ANTES de mezclar (no más de un envío cada 50ms)
+            current_time = time.time()
+            if current_time - self.last_broadcast_time < self.min_broadcast_interval:
                 return
             
-            gains = subscription.get('gains', {})
-            pans = subscription.get('pans', {})
-            master_gain = subscription.get('master_gain', 1.0)
-            
-            # Convertir audio a float32 si es necesario
-            if audio_data.dtype != np.float32:
-                audio_data = audio_data.astype(np.float32)
-            
-            num_samples = audio_data.shape[0]
-            
-            # ✅ MONO OUTPUT: Crear buffer mono de salida
-            output_mono = np.zeros(num_samples, dtype=np.float32)
-            
-            # Mezclar canales activos en MONO (ignorar panorama)
-            for ch in channels:
-                if ch >= audio_data.shape[1]:
-                    continue
-                
-                # ✅ ZERO-COPY: Sin .copy() - acceso directo con slice
-                channel_data = audio_data[:, ch]
-                
-                # Aplicar ganancia individual (sin panorama para mono)
-                gain = gains.get(ch, 1.0) * master_gain
-                
-                # ✅ ZERO-COPY: Operación directa sin buffers intermedios
-                np.add(output_mono, channel_data * gain, out=output_mono)
+            # ✅ NUEVO: Columna mono (sin pan) ya calculada por el motor matricial en este bloque
+            engine = get_mix_engine()
+            mono = engine.get_mono(master_client_id) if engine else None
+            if mono is not None:
+                output_mono = mono.copy()  # Vista del buffer del motor: no modificar en sitio
+            else:
+                output_mono = self._mix_mono(audio_data, channel_manager, master_client_id)
+                if output_mono is None:
+                    return
             
             # Limitar para evitar clipping (in-place)
             np.clip(output_mono, -1.0, 1.0, out=output_mono)
@@ -93,19 +74,52 @@ class AudioMixer:
             audio_int16 = output_mono.astype(np.int16)  # Conversión directa
             audio_bytes = audio_int16.tobytes()
             
-            # Debouncing: no enviar más de una vez cada 50ms
-            current_time = time.time()
-            if current_time - self.last_broadcast_time >= self.min_broadcast_interval:
-                self.broadcast_callback(
-                    audio_bytes,
-                    self.sample_rate,
-                    1,  # ✅ MONO (APK lo convertirá a estéreo)
-                    master_client_id
-                )
-                self.last_broadcast_time = current_time
+            self.broadcast_callback(
+                audio_bytes,
+                self.sample_rate,
+                1,  # ✅ MONO (APK lo convertirá a estéreo)
+                master_client_id
+            )
+            self.last_broadcast_time = current_time
         
         except Exception as e:
             logger.error(f"[AudioMixer] ❌ Error procesando audio: {e}")
+    
+    @staticmethod
+    def _mix_mono(audio_data, channel_manager, master_client_id):
+        """Fallback sin motor de mezcla: mezcla mono canal a canal"""
+        # Obtener suscripción del maestro
+        subscription = channel_manager.get_client_subscription(master_client_id)
+        if not subscription:
+            return None
+        
+        channels = subscription.get('channels', [])
+        if not channels:
+            return None
+        
+        gains = subscription.get('gains', {})
+        mutes = subscription.get('mutes', {})
+        master_gain = subscription.get('master_gain', 1.0)
+        
+        # Convertir audio a float32 si es necesario
+        if audio_data.dtype != np.float32:
+            audio_data = audio_data.astype(np.float32)
+        
+        # ✅ MONO OUTPUT: Crear buffer mono de salida
+        output_mono = np.zeros(audio_data.shape[0], dtype=np.float32)
+        
+        # Mezclar canales activos en MONO (ignorar panorama)
+        for ch in channels:
+            if ch >= audio_data.shape[1] or mutes.get(ch, False):
+                continue
+            
+            # Aplicar ganancia individual (sin panorama para mono)
+            gain = gains.get(ch, 1.0) * master_gain
+            
+            # ✅ ZERO-COPY: Operación directa sin buffers intermedios
+            np.add(output_mono, audio_data[:, ch] * gain, out=output_mono)
+        
+        return output_mono
 
 
 def init_audio_mixer(sample_rate=48000, buffer_size=2048):
@@ -6,11 +6,51 @@ import logging
 
 import time
 
+import threading
+
+import numpy as np
+
+from collections import namedtuple, deque
+
+from types import MappingProxyType
+
+from audio_server.mix_arrays import MixArrays
+
 
 
 logger = logging.getLogger(__name__)
 
 
+class RoutingEntry(namedtuple('RoutingEntry', (
+        'client_id', 'client_type', 'device_uuid', 'channels', 'gains', 'pans', 'mutes',
+        'master_gain', 'mix_mode', 'is_master'))):
+    """✅ NUEVO: Ruta inmutable de un cliente tal como la ve el hilo de audio"""
+    __slots__ = ()
+
+    def get(self, key, default=None):
+        """Mismo acceso que una suscripción (dict) para el código existente"""
+        return getattr(self, key, default)
+
+
+# version: contador monótono | clients: {client_id: RoutingEntry} | active: entradas con canales
+RoutingSnapshot = namedtuple('RoutingSnapshot', ('version', 'clients', 'active'))
+
+# ✅ NUEVO: Eventos tipados de cambio de suscripción
+CLIENT_ADDED = 'client_added'
+CLIENT_REMOVED = 'client_removed'
+CHANNELS_CHANGED = 'channels_changed'
+MIX_CHANGED = 'mix_changed'          # gains / pans / mutes / master_gain / mix_mode
+EVENT_KINDS = (CLIENT_ADDED, CLIENT_REMOVED, CHANNELS_CHANGED, MIX_CHANGED)
+
+# Campos de la ruta que se comparan para decidir qué cambió
+_MIX_FIELDS = ('gains', 'pans', 'mutes', 'master_gain', 'mix_mode')
+
+# version: versión de la tabla de rutas tras el cambio (monótona, sin huecos entre eventos
+# publicados) | changed: frozenset de campos | route / previous: RoutingEntry nueva / anterior
+SubscriptionEvent = namedtuple('SubscriptionEvent', (
+    'version', 'kind', 'client_id', 'changed', 'route', 'previous'))
+
+
 
 class ChannelManager:
 
@@ -32,6 +72,8 @@ class ChannelManager:
 
     """
 
+    MIX_MODES = ('channels', 'stereo')  # ✅ NUEVO: Modos de mezcla de clientes nativos
+
     def __init__(self, num_channels):
         # Usar el número de canales real de la interfaz
         self.num_channels = num_channels
@@ -55,8 +97,32 @@ class ChannelManager:
         self.device_channel_map = {}  # device_uuid -> {'start_channel': int, 'num_channels': int, 'physical_channels': int}
         self.next_available_channel = 0  # Próximo canal disponible para asignar
         
+        # ✅ NUEVO: Canales operacionales cacheados (máscara + set); solo se recalculan
+        # cuando register_device_to_channels cambia device_channel_map
+        self._operational_mask = np.zeros(num_channels, dtype=bool)
+        self._operational_channels = frozenset()
+        
         # ✅ NUEVO: Cliente Maestro (Sonidista Web Monitor)
         self.master_client_id = None
+
+        # ✅ NUEVO: Bus de eventos de suscripción: [(callback(event), kinds | None)]
+        self._event_listeners = []
+        self._event_log = deque(maxlen=getattr(config, 'SUBSCRIPTION_EVENT_LOG_SIZE', 512))
+        self.events_published = 0
+
+        # ✅ NUEVO: Tabla de rutas inmutable y versionada (copy-on-write).
+        # El audio la lee con una sola carga de atributo; se reemplaza entera en cada cambio.
+        self.routing = RoutingSnapshot(0, MappingProxyType({}), ())
+        self._routing_lock = threading.Lock()
+
+        # ✅ NUEVO: Gains/pans/mutes densos (clientes × canales) para consumidores vectorizados
+        self.mix_arrays = MixArrays(num_channels)
+
+        # ✅ NUEVO: Cache de info de registry por cliente (modelo, nombres, activo);
+        # se invalida por eventos de suscripción y cambios del DeviceRegistry
+        self._client_registry_info = {}
+        self.add_event_listener(self._invalidate_client_info)
+
         if getattr(config, 'MASTER_CLIENT_ENABLED', True):
             self._init_master_client()
 
@@ -86,6 +152,8 @@ class ChannelManager:
         
         self.client_types[master_uuid] = 'master'
         self.device_client_map[master_uuid] = master_uuid
+        self._publish_route(master_uuid)
+        self.mix_arrays.update(master_uuid, self.subscriptions[master_uuid])
         
         logger.info(f"[ChannelManager] 🎧 Cliente Maestro inicializado: {master_name}")
 
@@ -149,6 +217,7 @@ class ChannelManager:
                     pass
 
             subscription['last_update'] = time.time()
+            self.notify_subscription_changed(self.master_client_id)
             logger.info(
                 f"[ChannelManager] 💾 Estado maestro restaurado: {len(subscription['channels'])} canales"
             )
@@ -174,9 +243,128 @@ class ChannelManager:
 
         logger.info("[ChannelManager] ✅ SocketIO registrado")
     
+    def add_event_listener(self, callback, kinds=None):
+        """
+        ✅ NUEVO: Suscribirse al bus de cambios.
+        callback(SubscriptionEvent) se llama en el hilo que hizo el cambio (dos
+        hilos de control pueden entregar fuera de orden: usar event.version);
+        kinds: tupla de tipos (CLIENT_ADDED, ...) o None para todos.
+        """
+        kinds = frozenset(kinds) if kinds else None
+        with self._routing_lock:
+            if not any(cb == callback for cb, _ in self._event_listeners):
+                # Lista nueva (no append): quien esté despachando sigue con la anterior
+                self._event_listeners = self._event_listeners + [(callback, kinds)]
+
+    def remove_event_listener(self, callback):
+        with self._routing_lock:
+            self._event_listeners = [(cb, k) for cb, k in self._event_listeners if cb != callback]
+
+    def events_since(self, version):
+        """
+        ✅ NUEVO: Eventos con versión > `version` (para sincronizar cachés incrementalmente).
+        Devuelve None si el log ya no los contiene (el consumidor debe reconstruir).
+        """
+        events = list(self._event_log)
+        if version >= self.routing.version:
+            return []
+        if not events or events[0].version > version + 1:
+            return None
+        return [event for event in events if event.version > version]
+
+    def notify_subscription_changed(self, client_id):
+        """
+        ✅ NUEVO: Avisar a los listeners que la suscripción de un cliente cambió.
+        Los handlers que modifican la suscripción directamente deben llamarlo.
+        Solo se publica un evento si cambió algo que afecte al audio.
+        
+        Returns:
+            SubscriptionEvent publicado, o None si no hubo cambios
+        """
+        event = self._publish_route(client_id)
+        if event is None:
+            return None
+        self.mix_arrays.update(client_id, self.subscriptions.get(client_id))
+        for callback, kinds in self._event_listeners:
+            if kinds is not None and event.kind not in kinds:
+                continue
+            try:
+                callback(event)
+            except Exception as e:
+                logger.debug(f"[ChannelManager] Listener de eventos falló ({event.kind}): {e}")
+        return event
+
+    def _publish_route(self, client_id):
+        """
+        ✅ NUEVO: Publicar nueva versión de la tabla de rutas con la entrada del cliente.
+        Devuelve el SubscriptionEvent resultante, o None si la ruta no cambió.
+        """
+        with self._routing_lock:
+            current = self.routing
+            clients = dict(current.clients)
+            previous = clients.get(client_id)
+            subscription = self.subscriptions.get(client_id)
+            if subscription is None:
+                if previous is None:
+                    return None
+                del clients[client_id]
+                route = None
+                kind = CLIENT_REMOVED
+                changed = frozenset(('channels',) + _MIX_FIELDS)
+            else:
+                route = self._route_for(client_id, subscription)
+                if previous is None:
+                    kind = CLIENT_ADDED
+                    changed = frozenset(('channels',) + _MIX_FIELDS)
+                else:
+                    changed = frozenset(
+                        field for field in ('channels',) + _MIX_FIELDS
+                        if getattr(route, field) != getattr(previous, field)
+                    )
+                    if not changed and route == previous:
+                        return None
+                    kind = CHANNELS_CHANGED if 'channels' in changed else MIX_CHANGED
+                clients[client_id] = route
+            version = current.version + 1
+            active = tuple(entry for entry in clients.values() if entry.channels)
+            # Intercambio atómico: los lectores ven la versión vieja o la nueva, nunca una mezcla
+            self.routing = RoutingSnapshot(version, MappingProxyType(clients), active)
+            event = SubscriptionEvent(version, kind, client_id, changed, route, previous)
+            self._event_log.append(event)
+            self.events_published += 1
+            return event
+
+    def _route_for(self, client_id, subscription) -> RoutingEntry:
+        channels = tuple(sorted(
+            ch for ch in set(subscription.get('channels', [])) if 0 <= ch < self.num_channels
+        ))
+        return RoutingEntry(
+            client_id=client_id,
+            client_type=subscription.get('client_type', self.client_types.get(client_id, 'web')),
+            device_uuid=subscription.get('device_uuid'),
+            channels=channels,
+            gains=MappingProxyType(dict(subscription.get('gains', {}))),
+            pans=MappingProxyType(dict(subscription.get('pans', {}))),
+            mutes=MappingProxyType(dict(subscription.get('mutes', {}))),
+            master_gain=subscription.get('master_gain', 1.0),
+            mix_mode=subscription.get('mix_mode', 'channels'),
+            is_master=bool(subscription.get('is_master', False))
+        )
+
+    def get_routing(self) -> RoutingSnapshot:
+        """✅ NUEVO: Snapshot inmutable actual de la tabla de rutas"""
+        return self.routing
+
+    def get_mix_arrays(self):
+        """✅ NUEVO: Vistas de solo lectura (clientes × canales) + índice client_id -> fila"""
+        return self.mix_arrays.view()
+
     def set_device_registry(self, device_registry):
         """✅ NUEVO: Inyectar device registry"""
         self.device_registry = device_registry
+        self._client_registry_info.clear()
+        if hasattr(device_registry, 'add_change_listener'):
+            device_registry.add_change_listener(self._on_device_changed)
         logger.info("[ChannelManager] ✅ Device Registry registrado")
         self._restore_master_persistent_state()
 
@@ -231,6 +419,7 @@ class ChannelManager:
         
         self.device_channel_map[device_uuid] = mapping
         self.next_available_channel += channels_needed
+        self._rebuild_operational_channels()
         
         logger.info(
             f"[ChannelManager] 🔗 Dispositivo mapeado: {device_uuid[:12]} "
@@ -265,20 +454,65 @@ class ChannelManager:
             'operacional': False
         })
     
-    def get_operational_channels(self) -> set:
+    def _rebuild_operational_channels(self):
+        """✅ NUEVO: Recalcular máscara de canales operacionales desde device_channel_map"""
+        mask = np.zeros(self.num_channels, dtype=bool)
+        for mapping in self.device_channel_map.values():
+            if mapping.get('operacional'):
+                start = max(0, mapping['start_channel'])
+                mask[start:start + mapping['num_channels']] = True
+        mask.flags.writeable = False
+        # Reemplazo (no mutación): los lectores concurrentes ven la máscara vieja o la nueva
+        self._operational_channels = frozenset(np.flatnonzero(mask).tolist())
+        self._operational_mask = mask
+    
+    def get_operational_channels(self) -> frozenset:
         """
         ✅ NUEVO: Obtener conjunto de canales que tienen dispositivos físicos asignados
         Útil para marcar canales operacionales en la UI
+        ✅ OPTIMIZACIÓN: Cacheado, se recalcula solo al mapear dispositivos
         """
-        operational = set()
-        for mapping in self.device_channel_map.values():
-            if mapping.get('operacional'):
-                start = mapping['start_channel']
-                num = mapping['num_channels']
-                operational.update(range(start, start + num))
-        return operational
-
+        return self._operational_channels
+    
+    def get_operational_mask(self) -> np.ndarray:
+        """✅ NUEVO: Máscara bool (solo lectura) de canales operacionales"""
+        return self._operational_mask
+    
+    def is_operational(self, channel) -> bool:
+        """✅ NUEVO: Consulta O(1) de un canal"""
+        return channel in self._operational_channels
     
+    def validate_channels(self, channels):
+        """
+        ✅ NUEVO: Filtrar canales contra los operacionales cacheados.
+        
+        Listas (lo que llega del navegador/Android, a veces strings): set cacheado,
+        sin reconstruirlo. ndarray de enteros: máscara vectorizada.
+        
+        Returns:
+            (canales válidos en el orden recibido, set de inválidos)
+        """
+        if isinstance(channels, np.ndarray):
+            mask = self._operational_mask
+            requested = channels.astype(np.int64, copy=False)
+            in_range = (requested >= 0) & (requested < mask.shape[0])
+            keep = in_range.copy()
+            keep[in_range] = mask[requested[in_range]]
+            if keep.all():
+                return requested.tolist(), set()
+            return requested[keep].tolist(), set(requested[~keep].tolist())
+        
+        if not channels:
+            return [], set()
+        try:
+            requested = list(map(int, channels))
+        except (ValueError, TypeError):
+            return [], set()
+        operational = self._operational_channels
+        valid = [ch for ch in requested if ch in operational]
+        if len(valid) == len(requested):
+            return valid, set()
+        return valid, set(requested).difference(operational)
 
     def subscribe_client(self, client_id, channels, gains=None, pans=None, client_type="web", device_uuid=None):
 
@@ -350,6 +584,8 @@ class ChannelManager:
 
             'master_gain': 1.0,
 
+            'mix_mode': 'channels',  # ✅ NUEVO: 'channels' (N canales) o 'stereo' (mezcla en servidor)
+
             'client_type': client_type,
             'device_uuid': device_uuid,  # ✅ NUEVO
 
@@ -384,6 +620,8 @@ class ChannelManager:
         
         if device_uuid:
             logger.info(f"   Device UUID: {device_uuid[:12]}")
+
+        self.notify_subscription_changed(client_id)
         
         return True
 
@@ -415,6 +653,8 @@ class ChannelManager:
 
             self.client_types.pop(client_id, None)
 
+            self.notify_subscription_changed(client_id)
+
             logger.info(f"[ChannelManager] 📡 Cliente {client_id[:8]} ({client_type}) desuscrito ({channels_count} canales)")
     
     def get_client_by_device_uuid(self, device_uuid):
@@ -440,12 +680,15 @@ class ChannelManager:
 
     def update_client_mix(self, client_id, channels=None, gains=None, pans=None, 
 
-                          mutes=None, master_gain=None):
+                          mutes=None, master_gain=None, publish=True):
 
         """
 
         ✅ MEJORADO: Actualizar mezcla de un cliente con validaciones
 
+        publish=False: solo aplica la mezcla; quien agrupa por ventana (LatencyOptimizer)
+        persiste y emite mix_updated una vez en su flush con publish_client_mix()
+
         """
 
         if client_id not in self.subscriptions:
@@ -464,18 +707,10 @@ class ChannelManager:
 
         if channels is not None:
 
-            # ✅ NUEVO: Convertir a int si vienen como strings
-            try:
-                channels = [int(ch) for ch in channels]
-            except (ValueError, TypeError):
-                channels = []
+            # ✅ NUEVO: Validar contra operacionales (máscara cacheada, convierte strings a int)
+            valid_channels, invalid = self.validate_channels(channels)
             
-            # ✅ NUEVO: Validar contra operacionales
-            operational = self.get_operational_channels()
-            valid_channels = [ch for ch in channels if ch in operational]
-            
-            if len(valid_channels) < len(channels):
-                invalid = set(channels) - set(valid_channels)
+            if invalid:
                 logger.warning(f"[ChannelManager] ⚠️ Canales inválidos ignorados: {invalid}")
 
             sub['channels'] = valid_channels
@@ -561,10 +796,34 @@ class ChannelManager:
 
         sub['last_update'] = time.time()
 
+        # ✅ NUEVO: Recalcular columnas de mezcla en servidor (solo este cliente)
+        event = self.notify_subscription_changed(client_id)
+
+        if config.DEBUG:
+
+            logger.debug(f"[ChannelManager] Mezcla actualizada para {client_id[:8]}")
+
+        if publish:
+            # ✅ Persistencia solo si algo cambió de verdad
+            self.publish_client_mix(client_id, persist=event is not None)
+
+        return True
+
+    
+
+    def publish_client_mix(self, client_id, persist=True):
+        """
+        ✅ NUEVO: Persistir la configuración y emitir mix_updated con el estado actual.
+        Inmediato desde update_client_mix, o una vez por ventana desde los flush.
+        """
+        sub = self.subscriptions.get(client_id)
+        if not sub:
+            return
+
         # ✅ Persistencia: guardar configuración para sobrevivir reinicios del servidor
         device_uuid = sub.get('device_uuid')
         is_master = sub.get('is_master', False)
-        if device_uuid and self.device_registry and not is_master:
+        if persist and device_uuid and self.device_registry and not is_master:
             try:
                 self.device_registry.update_configuration(
                     device_uuid,
@@ -574,6 +833,7 @@ class ChannelManager:
                         'pans': sub.get('pans', {}),
                         'mutes': sub.get('mutes', {}),
                         'master_gain': sub.get('master_gain', 1.0),
+                        'mix_mode': sub.get('mix_mode', 'channels'),
                         'timestamp': int(time.time() * 1000)
                     }
                 )
@@ -581,45 +841,37 @@ class ChannelManager:
             except Exception as e:
                 logger.debug(f"[ChannelManager] Persist config failed: {e}")
 
-        
-
-        if config.DEBUG:
-
-            logger.debug(f"[ChannelManager] Mezcla actualizada para {client_id[:8]}")
-
-        
-
-# ✅ CORREGIDO: Emitir sin 'broadcast' parameter
-
+        # ✅ CORREGIDO: Emitir sin 'broadcast' parameter
         if self.socketio:
-
             try:
-
                 self.socketio.emit('mix_updated', {
-
                     'client_id': client_id,
-
                     'channels': sub['channels'],
-
                     'gains': sub['gains'],
-
                     'pans': sub['pans'],
-
                     'mutes': sub['mutes'],
-
-                    'master_gain': sub['master_gain']
-
+                    'master_gain': sub['master_gain'],
+                    'mix_mode': sub.get('mix_mode', 'channels')
                 })  # ✅ SIN broadcast=True
-
             except Exception as e:
-
                 logger.error(f"[ChannelManager] Error emitiendo mix_updated: {e}")
 
-        
-
-        return True
-
-    
+    def set_client_mix_mode(self, client_id, mix_mode):
+        """
+        ✅ NUEVO: Cambiar modo de mezcla de un cliente nativo
+        'channels' = N canales crudos (mezcla en el teléfono)
+        'stereo'   = el servidor aplica gains/pans/mutes/master_gain y envía 2 canales
+        """
+        if mix_mode not in self.MIX_MODES:
+            logger.warning(f"[ChannelManager] Modo de mezcla inválido: {mix_mode}")
+            return False
+        sub = self.subscriptions.get(client_id)
+        if not sub:
+            return False
+        sub['mix_mode'] = mix_mode
+        logger.info(f"[ChannelManager] 🎛️ Cliente {client_id[:8]} modo de mezcla: {mix_mode}")
+        # Persistir y notificar por el mismo camino que el resto de la mezcla
+        return self.update_client_mix(client_id)
 
     def get_client_subscription(self, client_id):
 
@@ -709,72 +961,111 @@ class ChannelManager:
 
     
 
+    def _invalidate_client_info(self, event):
+        self._client_registry_info.pop(event.client_id, None)
+
+    def _on_device_changed(self, device_uuid):
+        """Listener del DeviceRegistry: solo se invalida el cliente de ese dispositivo"""
+        client_id = self.device_client_map.get(device_uuid)
+        if client_id is not None:
+            self._client_registry_info.pop(client_id, None)
+
+    def _registry_info_for(self, client_id, device_uuid):
+        """(device_model, custom_name, device_name, registry_active) cacheado por cliente"""
+        info = self._client_registry_info.get(client_id)
+        if info is not None and info[0] == device_uuid:
+            return info[1]
+        device_model = None
+        custom_name = None
+        device_name = None
+        registry_active = False
+        try:
+            device_info = self.device_registry.get_device(device_uuid)
+            if device_info:
+                device_model = device_info.get('device_info', {}).get('model') or \
+                              device_info.get('device_info', {}).get('device_model')
+                custom_name = device_info.get('custom_name')  # SIEMPRE tomar el más reciente
+                device_name = device_info.get('name')
+                registry_active = device_info.get('active', False)
+        except Exception as e:
+            logger.debug(f"[ChannelManager] Error getting device info: {e}")
+            return (device_model, custom_name, device_name, registry_active)
+        result = (device_model, custom_name, device_name, registry_active)
+        self._client_registry_info[client_id] = (device_uuid, result)
+        return result
+
     def get_all_clients_info(self):
         """
         ✅ NUEVO: Obtener info de todos los clientes
         ✅ MEJORADO: Incluye cliente maestro con flag especial
+        ✅ OPTIMIZACIÓN: Datos del DeviceRegistry cacheados por cliente (sin lock por cliente)
         """
-        clients_info = []
+        return [self._client_info(client_id, sub) for client_id, sub in list(self.subscriptions.items())]
 
-        # Obtener clientes nativos conectados (si hay native_server)
-        # Considerar nativos y android conectados si están en subscriptions
-        connected_native_ids = set(
-            client_id for client_id, t in self.client_types.items() if t in ('native', 'android')
-        )
-        # Los clientes web activos se consideran conectados si están en subscriptions
-        connected_web_ids = set(
-            client_id for client_id, t in self.client_types.items() if t == 'web'
-        )
+    def get_client_info(self, client_id):
+        """✅ NUEVO: Info de un solo cliente (misma forma que get_all_clients_info) o None"""
+        sub = self.subscriptions.get(client_id)
+        if sub is None:
+            return None
+        return self._client_info(client_id, sub)
 
-        for client_id, sub in self.subscriptions.items():
-            client_type = self.client_types.get(client_id, "unknown")
-            device_uuid = sub.get('device_uuid')
-            is_master = sub.get('is_master', False)
-
-            # ✅ Obtener device_model y custom_name desde device_registry
-            device_model = None
-            custom_name = None  # SIEMPRE tomar desde DeviceRegistry si existe
-            device_name = None
-            if device_uuid and self.device_registry and not is_master:
-                try:
-                    device_info = self.device_registry.get_device(device_uuid)
-                    if device_info:
-                        device_model = device_info.get('device_info', {}).get('model') or \
-                                      device_info.get('device_info', {}).get('device_model')
-                        custom_name = device_info.get('custom_name')  # SIEMPRE tomar el más reciente
-                        device_name = device_info.get('name')
-                except Exception as e:
-                    logger.debug(f"[ChannelManager] Error getting device info: {e}")
-            else:
-                custom_name = sub.get('custom_name')
-
-            # Determinar si está conectado
-            connected = False
-            if is_master:
-                connected = True  # ✅ El cliente maestro siempre está "conectado"
-            elif client_type in ('native', 'android'):
-                connected = client_id in connected_native_ids
-            elif client_type == 'web':
-                connected = client_id in connected_web_ids
-
-            clients_info.append({
-                'id': client_id,
-                'type': client_type,
-                'device_uuid': device_uuid,
-                'device_model': device_model,
-                'custom_name': custom_name,
-                'device_name': device_name,
-                'channels': sub['channels'],
-                'gains': sub['gains'],
-                'pans': sub['pans'],
-                'active_channels': len(sub['channels']),
-                'master_gain': sub.get('master_gain', 1.0),
-                'last_activity': sub.get('last_update', 0),  # ✅ RENOMBRADO: last_update -> last_activity
-                'last_update': sub.get('last_update', 0),     # ✅ Mantener para compatibilidad
-                'connected': connected,
-                'is_master': is_master  # ✅ NUEVO: Flag para identificar cliente maestro
-            })
-        return clients_info
+    def _client_info(self, client_id, sub):
+        client_type = self.client_types.get(client_id, "unknown")
+        device_uuid = sub.get('device_uuid')
+        is_master = sub.get('is_master', False)
+
+        # ✅ Obtener device_model y custom_name desde device_registry
+        device_model = None
+        custom_name = None  # SIEMPRE tomar desde DeviceRegistry si existe
+        device_name = None
+        registry_active = True
+        if device_uuid and self.device_registry and not is_master:
+            device_model, custom_name, device_name, registry_active = self._registry_info_for(
+                client_id, device_uuid
+            )
+        else:
+            custom_name = sub.get('custom_name')
+
+        # Determinar si está conectado: nativos/android y web activos están en client_types
+        if is_master:
+            connected = True  # ✅ El cliente maestro siempre está "conectado"
+        else:
+            connected = client_type in ('native', 'android', 'web')
+
+        # ✅ NUEVO: Codificación actual y transiciones por congestión (nativos)
+        congestion = None
+        mixdown_supported = False
+        native_server = getattr(self, 'native_server', None)
+        if client_type in ('native', 'android') and native_server is not None:
+            try:
+                congestion = native_server.get_client_congestion(client_id)
+                mixdown_supported = native_server.client_supports_mixdown(client_id)
+            except Exception as e:
+                logger.debug(f"[ChannelManager] Error getting congestion: {e}")
+
+        return {
+            'id': client_id,
+            'type': client_type,
+            'device_uuid': device_uuid,
+            'device_model': device_model,
+            'custom_name': custom_name,
+            'device_name': device_name,
+            # Copias: la suscripción se modifica en sitio y la vista de deltas guarda esta info
+            'channels': list(sub['channels']),
+            'gains': dict(sub['gains']),
+            'pans': dict(sub['pans']),
+            'active_channels': len(sub['channels']),
+            'master_gain': sub.get('master_gain', 1.0),
+            'last_activity': sub.get('last_update', 0),  # ✅ RENOMBRADO: last_update -> last_activity
+            'last_update': sub.get('last_update', 0),     # ✅ Mantener para compatibilidad
+            'connected': connected,
+            'registry_active': registry_active,
+            'is_master': is_master,  # ✅ NUEVO: Flag para identificar cliente maestro
+            'mix_mode': sub.get('mix_mode', 'channels'),
+            'mixdown_supported': mixdown_supported,  # ✅ NUEVO: El teléfono acepta la mezcla estéreo
+            'encoding': congestion['encoding'] if congestion else None,
+            'congestion': congestion
+        }
 
     
 
@@ -812,4 +1103,44 @@ class ChannelManager:
 
             'available_channels': self.num_channels
 
-        }
\ No newline at end of file
+        }
+
+if __name__ == '__main__':
+    # Benchmark: validación de canales (128 canales, 8 interfaces de 16) - máscara
+    # cacheada frente a reconstruir el set desde device_channel_map en cada llamada
+    import timeit
+
+    logging.disable(logging.INFO)
+    manager = ChannelManager(128)
+    for i in range(8):
+        manager.register_device_to_channels(f'interface-{i:02d}', 16)
+
+    def _old_operational():
+        operational = set()
+        for mapping in manager.device_channel_map.values():
+            if mapping.get('operacional'):
+                start = mapping['start_channel']
+                operational.update(range(start, start + mapping['num_channels']))
+        return operational
+
+    def _old_validate(channels):
+        channels = [int(ch) for ch in channels]
+        operational = _old_operational()
+        valid = [ch for ch in channels if ch in operational]
+        invalid = set(channels) - set(valid)
+        return valid, invalid
+
+    runs = 20000
+    for size in (1, 8, 32, 128):
+        request = [str(ch) for ch in range(0, 2 * size, 2)][:size]  # Strings como llegan del navegador
+        as_array = np.array(request, dtype=np.int64)
+        assert _old_validate(request) == manager.validate_channels(request) == manager.validate_channels(as_array)
+        old_us = timeit.timeit(lambda: _old_validate(request), number=runs) / runs * 1e6
+        new_us = timeit.timeit(lambda: manager.validate_channels(request), number=runs) / runs * 1e6
+        mask_us = timeit.timeit(lambda: manager.validate_channels(as_array), number=runs) / runs * 1e6
+        print(f"{size:3d} canales | set reconstruido: {old_us:7.2f} µs | set cacheado: {new_us:7.2f} µs | "
+              f"máscara (ndarray): {mask_us:7.2f} µs")
+
+    old_us = timeit.timeit(lambda: 77 in _old_operational(), number=runs) / runs * 1e6
+    new_us = timeit.timeit(lambda: manager.is_operational(77), number=runs) / runs * 1e6
+    print(f"un canal    | set reconstruido: {old_us:7.2f} µs | is_operational: {new_us:7.2f} µs")
@@ -0,0 +1,143 @@
+"""
+congestion.py - Control de congestión por cliente nativo (TCP)
+✅ Muestrea la ocupación de la cola de envío del kernel (SIOCOUTQ en Linux)
+✅ Escalera de codificación: float32 → int16 → int16+zlib → int16+zlib en lotes
+✅ Baja rápido al congestionarse, sube despacio cuando la cola se vacía (histéresis)
+"""
+
+import time
+import struct
+import logging
+from collections import deque
+
+import config
+
+try:
+    import fcntl
+    import termios
+    _SIOCOUTQ = getattr(termios, 'TIOCOUTQ', None)  # SIOCOUTQ == TIOCOUTQ en Linux
+except ImportError:  # Windows
+    fcntl = None
+    _SIOCOUTQ = None
+
+logger = logging.getLogger(__name__)
+
+LADDER = ('float32', 'int16', 'int16_zlib', 'int16_zlib_batched')
+
+
+def read_send_queue_bytes(sock):
+    """
+    Bytes pendientes en la cola de envío del kernel, o None si no se puede
+    medir en esta plataforma (entonces el controlador usa solo los drops).
+    """
+    if _SIOCOUTQ is None or sock is None:
+        return None
+    try:
+        raw = fcntl.ioctl(sock.fileno(), _SIOCOUTQ, b'\0\0\0\0')
+        return struct.unpack('i', raw)[0]
+    except (OSError, ValueError):
+        return None
+
+
+class CongestionController:
+    """
+    Escalera de codificación de un cliente.
+
+    `sample()` se llama cada N bloques desde el hilo de captura. Bajar un
+    escalón exige `down_samples` muestras seguidas sobre el umbral alto (o
+    drops nuevos); subir exige `up_samples` muestras seguidas bajo el umbral
+    bajo, para no oscilar.
+    """
+
+    def __init__(self, sndbuf: int, start_level: int = 1, max_level: int = 1):
+        self.sndbuf = max(1, sndbuf)
+        self.max_level = max(0, min(max_level, len(LADDER) - 1))
+        self.min_level = min(start_level, self.max_level)
+        self.level = self.min_level
+        self.high = getattr(config, 'NATIVE_CONGESTION_HIGH', 0.5)
+        self.low = getattr(config, 'NATIVE_CONGESTION_LOW', 0.1)
+        self.down_samples = getattr(config, 'NATIVE_CONGESTION_DOWN_SAMPLES', 2)
+        self.up_samples = getattr(config, 'NATIVE_CONGESTION_UP_SAMPLES', 24)
+
+        self._above = 0
+        self._below = 0
+        self._last_dropped = 0
+        self.last_occupancy = 0.0
+        self.max_occupancy = 0.0
+        self.steps_down = 0
+        self.steps_up = 0
+        self.transitions = deque(maxlen=16)
+
+    @property
+    def encoding(self) -> str:
+        return LADDER[self.level]
+
+    @property
+    def batched(self) -> bool:
+        return self.encoding.endswith('_batched')
+
+    @property
+    def wire_encoding(self) -> str:
+        """Codificación del paquete (sin el modo de lotes)"""
+        return self.encoding.replace('_batched', '')
+
+    def sample(self, queued_bytes, packets_dropped: int) -> int:
+        """
+        Registrar una muestra.
+
+        Returns:
+            -1 si bajó un escalón, +1 si subió, 0 si no cambió
+        """
+        new_drops = packets_dropped - self._last_dropped
+        self._last_dropped = packets_dropped
+
+        if queued_bytes is None:
+            occupancy = 1.0 if new_drops > 0 else 0.0
+        else:
+            occupancy = queued_bytes / self.sndbuf
+        self.last_occupancy = occupancy
+        if occupancy > self.max_occupancy:
+            self.max_occupancy = occupancy
+
+        if occupancy >= self.high or new_drops > 0:
+            self._above += 1
+            self._below = 0
+            if self._above >= self.down_samples and self.level < self.max_level:
+                return self._step(+1, occupancy)
+        elif occupancy <= self.low:
+            self._below += 1
+            self._above = 0
+            if self._below >= self.up_samples and self.level > self.min_level:
+                return self._step(-1, occupancy)
+        else:
+            self._above = 0
+            self._below = 0
+        return 0
+
+    def _step(self, direction: int, occupancy: float) -> int:
+        previous = self.encoding
+        self.level += direction
+        self._above = 0
+        self._below = 0
+        self.transitions.append({
+            'time': time.time(),
+            'from': previous,
+            'to': self.encoding,
+            'occupancy': round(occupancy, 3)
+        })
+        if direction > 0:
+            self.steps_down += 1
+            return -1
+        self.steps_up += 1
+        return 1
+
+    def get_stats(self) -> dict:
+        return {
+            'encoding': self.encoding,
+            'level': self.level,
+            'queue_occupancy': round(self.last_occupancy, 3),
+            'max_queue_occupancy': round(self.max_occupancy, 3),
+            'steps_down': self.steps_down,
+            'steps_up': self.steps_up,
+            'transitions': list(self.transitions)
+        }
@@ -0,0 +1,157 @@
+"""
+control_dispatch.py - Despacho de mensajes de control nativos fuera del hilo de lectura
+✅ Pool pequeño de workers persistentes, cada uno con su cola acotada
+✅ Cada conexión pertenece a UN worker: el orden de sus mensajes se conserva
+✅ El hilo de lectura solo enmarca y encola (los heartbeats se descartan si no hay sitio)
+"""
+
+import queue
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ControlWorker:
+    """Hilo de control persistente con cola FIFO acotada"""
+
+    def __init__(self, index: int, queue_depth: int, handler):
+        self.index = index
+        self.queue = queue.Queue(maxsize=max(1, queue_depth))
+        self.handler = handler
+        self.running = False
+        self.thread = None
+
+        self.stats_lock = threading.Lock()
+        self.handled = 0
+        self.errors = 0
+        self.max_wait_ms = 0.0
+        self.max_handle_ms = 0.0
+        self._wait_total_ms = 0.0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(
+            target=self._run, daemon=True, name=f'native-control-{self.index}'
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        if self.thread:
+            self.thread.join(timeout=1.0)
+
+    def _run(self):
+        while self.running:
+            job = self.queue.get()
+            if job is None:
+                break
+
+            enqueued_at, client, message = job
+            started = time.perf_counter()
+            wait_ms = (started - enqueued_at) * 1000
+            failed = False
+            try:
+                self.handler(client, message)
+            except Exception as e:
+                failed = True
+                logger.error(f"[ControlDispatch] ❌ {message.get('type', '?')}: {e}")
+            handle_ms = (time.perf_counter() - started) * 1000
+
+            with self.stats_lock:
+                self.handled += 1
+                if failed:
+                    self.errors += 1
+                self._wait_total_ms += wait_ms
+                if wait_ms > self.max_wait_ms:
+                    self.max_wait_ms = wait_ms
+                if handle_ms > self.max_handle_ms:
+                    self.max_handle_ms = handle_ms
+
+    def get_stats(self) -> dict:
+        with self.stats_lock:
+            handled = self.handled
+            return {
+                'worker': self.index,
+                'backlog': self.queue.qsize(),
+                'handled': handled,
+                'errors': self.errors,
+                'avg_wait_ms': round(self._wait_total_ms / handled, 3) if handled else 0.0,
+                'max_wait_ms': round(self.max_wait_ms, 3),
+                'max_handle_ms': round(self.max_handle_ms, 3)
+            }
+
+
+class ControlDispatcher:
+    """
+    ✅ Reparte los mensajes de control entre N workers.
+
+    El worker se fija en el objeto conexión en su primer mensaje (no por su
+    client_id, que cambia de temporal a persistente en el handshake), así que
+    todos los mensajes de una conexión pasan por el mismo worker en orden.
+
+    Con la cola del worker llena, los mensajes descartables (heartbeat) se
+    tiran y el resto espera hasta `put_timeout`: el único hilo que se frena
+    es el de lectura de esa conexión, nunca el de captura.
+    """
+
+    DROPPABLE = frozenset(('heartbeat',))
+
+    def __init__(self, num_workers: int, queue_depth: int, handler, put_timeout: float = 2.0):
+        self.put_timeout = put_timeout
+        self.workers = [ControlWorker(i, queue_depth, handler) for i in range(max(1, num_workers))]
+        self._next_worker = 0
+        self.stats_lock = threading.Lock()
+        self.submitted = 0
+        self.dropped = 0
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        logger.info(f"[ControlDispatch] ✅ {len(self.workers)} workers de control activos")
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+
+    def worker_for(self, client) -> ControlWorker:
+        """Worker de la conexión (asignación round-robin estable)"""
+        worker = getattr(client, 'control_worker', None)
+        if worker is None:
+            with self.stats_lock:
+                worker = self.workers[self._next_worker % len(self.workers)]
+                self._next_worker += 1
+            client.control_worker = worker
+        return worker
+
+    def submit(self, client, message: dict) -> bool:
+        """Encolar un mensaje (llamado desde el hilo de lectura del cliente)"""
+        worker = self.worker_for(client)
+        job = (time.perf_counter(), client, message)
+        try:
+            if message.get('type') in self.DROPPABLE:
+                worker.queue.put_nowait(job)
+            else:
+                worker.queue.put(job, timeout=self.put_timeout)
+        except queue.Full:
+            with self.stats_lock:
+                self.dropped += 1
+            return False
+        with self.stats_lock:
+            self.submitted += 1
+        return True
+
+    def get_stats(self) -> dict:
+        with self.stats_lock:
+            submitted = self.submitted
+            dropped = self.dropped
+        return {
+            'submitted': submitted,
+            'dropped': dropped,
+            'workers': [worker.get_stats() for worker in self.workers]
+        }
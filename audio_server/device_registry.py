@@ -9,6 +9,9 @@ import uuid as uuid_module
 from typing import Dict, Optional, List
 
 import config
+from audio_server.device_store import SqliteDeviceStore
+from audio_server.persistence import get_persistence_service
+from audio_server.ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
@@ -49,24 +52,57 @@ class DeviceRegistry:
     """
     
     def __init__(self, persistence_file: str = "config/devices.json"):
-        self.devices: Dict[str, dict] = {}
+        self.cleanup_interval = 3600  # Limpiar cada hora
+        self.max_devices = 500
+        self.device_cache_timeout = 604800  # 7 días
+        # ✅ OPTIMIZACIÓN: TTL/LRU por last_seen (limpieza sin ordenar todos los dispositivos)
+        self.devices: TTLCache = TTLCache(ttl=self.device_cache_timeout, max_entries=self.max_devices)
         self.device_lock = threading.RLock()
+        
+        # ✅ NUEVO: Índices secundarios (bajo device_lock) para búsquedas O(1) en handshakes.
+        # Valor: dict ordenado {uuid: None} (varios dispositivos pueden compartir IP/MAC)
+        self._ip_type_index: Dict[tuple, Dict[str, None]] = {}
+        self._mac_index: Dict[str, Dict[str, None]] = {}
+        
+        # ✅ NUEVO: Listeners de cambios de dispositivo: callback(device_uuid), bajo device_lock
+        self._change_listeners = []
         self.persistence_file = persistence_file
         self.persistence_lock = threading.Lock()
         # ✅ Sesión actual del servidor (cambia en cada arranque)
         self.server_session_id: Optional[str] = None
-        self.cleanup_interval = 3600  # Limpiar cada hora
-        self.max_devices = 500
-        self.device_cache_timeout = 604800  # 7 días
         
         # ✅ NUEVO: Estado global de canales (persistente entre reinicios)
         self.channels_state_file = os.path.join(os.path.dirname(persistence_file) or '.', 'channels_state.json')
         self.channels_state = {}  # {channel: {active, gains, pans} para cada cliente}
         self.channels_state_lock = threading.Lock()
+
+        # ✅ NUEVO: Guardado write-behind en el servicio de persistencia compartido
+        # (handshakes/updates solo marcan "sucio"; el hilo escritor reescribe el JSON)
+        self.persistence = get_persistence_service()
         
         # Crear directorio si no existe
         os.makedirs(os.path.dirname(persistence_file) or '.', exist_ok=True)
         
+        # ✅ NUEVO: Backend SQLite opcional (upserts por fila en vez de reescribir el JSON)
+        self.store: Optional[SqliteDeviceStore] = None
+        if getattr(config, 'DEVICE_REGISTRY_BACKEND', 'json') == 'sqlite':
+            db_path = os.path.splitext(persistence_file)[0] + '.db'
+            try:
+                store = SqliteDeviceStore(db_path)
+                store.import_json(persistence_file)
+                store.start()
+                self.store = store
+            except Exception as e:
+                logger.error(f"[Device Registry] ❌ SQLite no disponible ({e}), se usa JSON")
+        if self.store is None:
+            self.persistence.register_file(
+                'devices', self.persistence_file, self._devices_snapshot,
+                window=getattr(config, 'DEVICE_REGISTRY_SAVE_DELAY', 1.0), indent=2
+            )
+        self.persistence.register_file(
+            'channels_state', self.channels_state_file, self._channels_state_snapshot, indent=2
+        )
+        
         # Cargar desde disco
         self.load_from_disk()
         self.load_channels_state()
@@ -110,15 +146,20 @@ class DeviceRegistry:
                 # Actualizar dispositivo existente
                 device = self.devices[device_uuid]
                 device['last_seen'] = current_time
+                self.devices.touch(device_uuid, current_time)
                 device['reconnections'] = device.get('reconnections', 0) + 1
                 device['active'] = True
                 
+                # ✅ NUEVO: Sacar de los índices antes de cambiar IP/MAC
+                self._unindex_device(device_uuid, device)
+                
                 # Actualizar info si es más nueva
                 if device_info.get('mac_address') and not device.get('mac_address'):
                     device['mac_address'] = device_info.get('mac_address')
                 
                 device['primary_ip'] = device_info.get('primary_ip')
                 device['device_info'].update(device_info)
+                self._index_device(device_uuid, device)
                 
                 logger.info(f"[Device Registry] 🔄 Dispositivo actualizado: {device_uuid[:12]} "
                            f"(Reconexión #{device['reconnections']})")
@@ -138,13 +179,15 @@ class DeviceRegistry:
                     'tags': [],
                     'active': True
                 }
-                self.devices[device_uuid] = device
+                self.devices.set(device_uuid, device, stamp=current_time)
+                self._index_device(device_uuid, device)
                 
                 logger.info(f"[Device Registry] ✅ Nuevo dispositivo registrado: {device_uuid[:12]} "
                            f"({device['type']}) - {device.get('name')}")
             
-            # Guardar a disco
-            self.save_to_disk()
+            # ✅ Guardar a disco (diferido, fuera del hilo que llama)
+            self._persist_device(device_uuid)
+            self._notify_change(device_uuid)
             
             return self.devices[device_uuid]
     
@@ -169,11 +212,7 @@ class DeviceRegistry:
             return None
         
         with self.device_lock:
-            for device in self.devices.values():
-                if device.get('mac_address') == mac_address:
-                    return device
-        
-        return None
+            return self._first_indexed(self._mac_index.get(mac_address))
     
     def find_device_by_ip_and_type(self, ip: str, device_type: str) -> Optional[dict]:
         """Buscar dispositivo por IP y tipo (secundario)."""
@@ -181,16 +220,71 @@ class DeviceRegistry:
             return None
         
         with self.device_lock:
-            candidates = [
-                d for d in self.devices.values()
-                if d.get('primary_ip') == ip and d.get('type') == device_type
-            ]
-            
-            if candidates:
-                return candidates[0]
-        
+            return self._first_indexed(self._ip_type_index.get((ip, device_type)))
+    
+    def add_change_listener(self, callback):
+        """✅ NUEVO: callback(device_uuid) cuando cambia un dispositivo (para invalidar cachés)"""
+        with self.device_lock:
+            if callback not in self._change_listeners:
+                self._change_listeners.append(callback)
+    
+    def _notify_change(self, device_uuid: str):
+        for callback in self._change_listeners:
+            try:
+                callback(device_uuid)
+            except Exception as e:
+                logger.debug(f"[Device Registry] Listener de cambios falló: {e}")
+    
+    # ========================================================================
+    # ÍNDICES SECUNDARIOS (llamar con device_lock tomado)
+    # ========================================================================
+    
+    def _first_indexed(self, uuids: Optional[Dict[str, None]]) -> Optional[dict]:
+        if not uuids:
+            return None
+        for device_uuid in uuids:
+            device = self.devices.get(device_uuid)
+            if device is not None:
+                return device
         return None
     
+    def _index_device(self, device_uuid: str, device: dict):
+        ip = device.get('primary_ip')
+        if ip:
+            self._ip_type_index.setdefault((ip, device.get('type')), {})[device_uuid] = None
+        mac = device.get('mac_address')
+        if mac:
+            self._mac_index.setdefault(mac, {})[device_uuid] = None
+    
+    def _unindex_device(self, device_uuid: str, device: dict):
+        key = (device.get('primary_ip'), device.get('type'))
+        uuids = self._ip_type_index.get(key)
+        if uuids is not None:
+            uuids.pop(device_uuid, None)
+            if not uuids:
+                del self._ip_type_index[key]
+        mac = device.get('mac_address')
+        uuids = self._mac_index.get(mac) if mac else None
+        if uuids is not None:
+            uuids.pop(device_uuid, None)
+            if not uuids:
+                del self._mac_index[mac]
+    
+    def _replace_devices(self, devices_data: dict):
+        """✅ NUEVO: Reemplazar el registro (carga) con su last_seen como marca de expiración"""
+        self.devices.clear()
+        for device_uuid, device in devices_data.items():
+            stamp = device.get('last_seen') if isinstance(device, dict) else None
+            self.devices.set(device_uuid, device, stamp=stamp or 0)
+        self._rebuild_indexes()
+    
+    def _rebuild_indexes(self):
+        self._ip_type_index = {}
+        self._mac_index = {}
+        for device_uuid, device in self.devices.items():
+            if isinstance(device, dict):
+                self._index_device(device_uuid, device)
+    
     def update_configuration(self, device_uuid: str, config: dict, session_id: Optional[str] = None) -> bool:
         """
         Guardar/actualizar configuración de dispositivo.
@@ -215,8 +309,13 @@ class DeviceRegistry:
             if session_id is not None:
                 self.devices[device_uuid]['configuration_session_id'] = session_id
             self.devices[device_uuid]['last_seen'] = time.time()
+            self.devices.touch(device_uuid, self.devices[device_uuid]['last_seen'])
             
-            self.save_to_disk()
+            if self.store is not None:
+                self.store.upsert_configuration(
+                    device_uuid, config, self.devices[device_uuid].get('configuration_session_id')
+                )
+            self._persist_device(device_uuid)
             logger.debug(f"[Device Registry] 💾 Config guardada: {device_uuid[:12]}")
             
             return True
@@ -243,7 +342,8 @@ class DeviceRegistry:
         with self.device_lock:
             if device_uuid in self.devices:
                 self.devices[device_uuid]['active'] = False
-                self.save_to_disk()
+                self._persist_device(device_uuid)
+                self._notify_change(device_uuid)
                 logger.debug(f"[Device Registry] 📌 Dispositivo marcado inactivo: {device_uuid[:12]}")
     
     def add_tag(self, device_uuid: str, tag: str):
@@ -253,7 +353,10 @@ class DeviceRegistry:
                 tags = self.devices[device_uuid].get('tags', [])
                 if tag not in tags:
                     tags.append(tag)
-                    self.save_to_disk()
+                    if self.store is not None:
+                        self.store.add_tag(device_uuid, tag)
+                    else:
+                        self.save_to_disk()
     
     def set_custom_name(self, device_uuid: str, custom_name: str) -> bool:
         """✅ NUEVO: Guardar nombre personalizado de dispositivo."""
@@ -263,7 +366,9 @@ class DeviceRegistry:
             
             self.devices[device_uuid]['custom_name'] = custom_name
             self.devices[device_uuid]['last_seen'] = time.time()
-            self.save_to_disk()
+            self.devices.touch(device_uuid, self.devices[device_uuid]['last_seen'])
+            self._persist_device(device_uuid, immediate=True)
+            self._notify_change(device_uuid)
             
             logger.info(f"[Device Registry] 📝 Nombre personalizado guardado: {device_uuid[:12]} = {custom_name}")
             return True
@@ -315,50 +420,80 @@ class DeviceRegistry:
                 'active_devices': active,
                 'by_type': by_type,
                 'max_devices': self.max_devices,
-                'persistence_file': self.persistence_file
+                'device_cache': self.devices.get_stats(),
+                'persistence_file': self.persistence_file,
+                'indexed_ips': len(self._ip_type_index),
+                'indexed_macs': len(self._mac_index),
+                'backend': 'sqlite' if self.store is not None else 'json',
+                'store': self.store.get_stats() if self.store is not None else None,
+                'persistence': self.persistence.get_stats()
             }
     
     # ========================================================================
     # PERSISTENCIA
     # ========================================================================
     
+    def _persist_device(self, device_uuid: str, immediate: bool = False):
+        """✅ NUEVO: Persistir un dispositivo (upsert de su fila en SQLite, o JSON completo)"""
+        if self.store is not None:
+            self.store.upsert_device(self.devices[device_uuid])
+        else:
+            self.schedule_save(delay=0.0 if immediate else None)
+    
+    def schedule_save(self, delay: Optional[float] = None):
+        """
+        ✅ NUEVO: Programar guardado diferido.
+        
+        Todos los cambios dentro de DEVICE_REGISTRY_SAVE_DELAY se escriben en
+        una sola pasada desde el hilo de persistencia; quien llama nunca espera al disco.
+        """
+        if self.store is not None:
+            return  # ✅ SQLite: cada cambio ya se encoló como upsert de su fila
+        if delay is None and getattr(config, 'DEVICE_REGISTRY_SAVE_DELAY', 1.0) <= 0:
+            delay = 0.0
+        self.persistence.mark_dirty('devices', delay=delay)
+    
+    def flush(self):
+        """✅ NUEVO: Escribir ya los cambios pendientes (apagado)"""
+        if self.store is not None:
+            self.store.flush()
+        else:
+            self.persistence.flush('devices')
+        self.persistence.flush('channels_state')
+    
     def save_to_disk(self):
-        """Guardar registro a archivo JSON."""
-        with self.persistence_lock:
-            try:
-                # Crear diccionario serializable
-                devices_data = {}
-                with self.device_lock:
-                    for uuid, device in self.devices.items():
-                        devices_data[uuid] = {
-                            'uuid': device['uuid'],
-                            'type': device['type'],
-                            'name': device['name'],
-                            'custom_name': device.get('custom_name'),
-                            'mac_address': device.get('mac_address'),
-                            'primary_ip': device.get('primary_ip'),
-                            'device_info': device.get('device_info', {}),
-                            'first_seen': device.get('first_seen'),
-                            'last_seen': device.get('last_seen'),
-                            'reconnections': device.get('reconnections', 0),
-                            'configuration': device.get('configuration', {}),
-                            'configuration_session_id': device.get('configuration_session_id'),
-                            'tags': device.get('tags', []),
-                            'active': device.get('active', False)
-                        }
-                
-                os.makedirs(os.path.dirname(self.persistence_file) or '.', exist_ok=True)
-                
-                with open(self.persistence_file, 'w') as f:
-                    json.dump(devices_data, f, indent=2)
-                
-                logger.debug(f"[Device Registry] 💾 Guardado a {self.persistence_file}")
-                
-            except Exception as e:
-                logger.error(f"[Device Registry] ❌ Error guardando a disco: {e}")
+        """Guardar registro a archivo JSON (sin esperar: el escritor lo hace en cuanto puede)."""
+        self.schedule_save(delay=0.0)
+    
+    def _devices_snapshot(self) -> dict:
+        """✅ NUEVO: Copia serializable del registro (hilo de persistencia)"""
+        devices_data = {}
+        with self.device_lock:
+            for uuid, device in self.devices.items():
+                devices_data[uuid] = {
+                    'uuid': device['uuid'],
+                    'type': device['type'],
+                    'name': device['name'],
+                    'custom_name': device.get('custom_name'),
+                    'mac_address': device.get('mac_address'),
+                    'primary_ip': device.get('primary_ip'),
+                    'device_info': dict(device.get('device_info', {})),
+                    'first_seen': device.get('first_seen'),
+                    'last_seen': device.get('last_seen'),
+                    'reconnections': device.get('reconnections', 0),
+                    'configuration': dict(device.get('configuration', {})),
+                    'configuration_session_id': device.get('configuration_session_id'),
+                    'tags': list(device.get('tags', [])),
+                    'active': device.get('active', False)
+                }
+        logger.debug(f"[Device Registry] 💾 Guardando {len(devices_data)} dispositivos en {self.persistence_file}")
+        return devices_data
     
     def load_from_disk(self):
         """Cargar registro desde archivo JSON."""
+        if self.store is not None:
+            self._load_from_store()
+            return
         if not os.path.exists(self.persistence_file):
             logger.info(f"[Device Registry] 📄 Archivo no existe: {self.persistence_file}")
             return
@@ -373,48 +508,55 @@ class DeviceRegistry:
                     master_uuid = getattr(config, 'MASTER_CLIENT_UUID', '__master_server_client__')
                     if isinstance(devices_data, dict) and master_uuid in devices_data:
                         devices_data.pop(master_uuid, None)
-                        try:
-                            with open(self.persistence_file, 'w') as wf:
-                                json.dump(devices_data, wf, indent=2)
-                        except Exception:
-                            pass
+                        self.schedule_save()
                 
                 with self.device_lock:
-                    self.devices = devices_data
+                    self._replace_devices(devices_data)
                 
                 logger.info(f"[Device Registry] ✅ Cargados {len(self.devices)} dispositivos")
                 
             except Exception as e:
                 logger.error(f"[Device Registry] ❌ Error cargando desde disco: {e}")
     
+    def _load_from_store(self):
+        """✅ NUEVO: Cargar registro desde SQLite"""
+        try:
+            devices_data = self.store.load()
+        except Exception as e:
+            logger.error(f"[Device Registry] ❌ Error cargando desde SQLite: {e}")
+            return
+        
+        # ✅ Si el cliente maestro está deshabilitado, eliminarlo de persistencia
+        if not getattr(config, 'MASTER_CLIENT_ENABLED', False):
+            master_uuid = getattr(config, 'MASTER_CLIENT_UUID', '__master_server_client__')
+            if devices_data.pop(master_uuid, None) is not None:
+                self.store.delete_device(master_uuid)
+        
+        with self.device_lock:
+            self._replace_devices(devices_data)
+        
+        logger.info(f"[Device Registry] ✅ Cargados {len(self.devices)} dispositivos (SQLite)")
+    
     # ========================================================================
     # PERSISTENCIA DE ESTADO DE CANALES
     # ========================================================================
     
     def save_channels_state(self) -> bool:
-        """✅ NUEVO: Guardar estado de canales a disco."""
+        """✅ NUEVO: Programar guardado del estado de canales (write-behind)."""
+        self.persistence.mark_dirty('channels_state')
+        return True
+    
+    def _channels_state_snapshot(self) -> dict:
+        """✅ NUEVO: Copia serializable del estado de canales (hilo de persistencia)"""
         with self.channels_state_lock:
-            try:
-                os.makedirs(os.path.dirname(self.channels_state_file) or '.', exist_ok=True)
-                
-                # Preparar datos para guardar
-                state_data = {
-                    'timestamp': int(time.time()),
-                    'channels_state': self.channels_state
-                }
-                
-                # Guardar con archivo temporal para evitar corrupción
-                tmp_path = self.channels_state_file + '.tmp'
-                with open(tmp_path, 'w') as f:
-                    json.dump(state_data, f, indent=2)
-                os.replace(tmp_path, self.channels_state_file)
-                
-                logger.debug(f"[Device Registry] 💾 Estado de canales guardado")
-                return True
-                
-            except Exception as e:
-                logger.error(f"[Device Registry] ❌ Error guardando estado de canales: {e}")
-                return False
+            channels_state = {
+                client_id: dict(state) if isinstance(state, dict) else state
+                for client_id, state in self.channels_state.items()
+            }
+        return {
+            'timestamp': int(time.time()),
+            'channels_state': channels_state
+        }
     
     def load_channels_state(self) -> bool:
         """✅ NUEVO: Cargar estado de canales desde disco."""
@@ -434,14 +576,7 @@ class DeviceRegistry:
                     master_uuid = getattr(config, 'MASTER_CLIENT_UUID', '__master_server_client__')
                     if isinstance(channels_state, dict) and master_uuid in channels_state:
                         channels_state.pop(master_uuid, None)
-                        try:
-                            state_data['channels_state'] = channels_state
-                            tmp_path = self.channels_state_file + '.tmp'
-                            with open(tmp_path, 'w') as wf:
-                                json.dump(state_data, wf, indent=2)
-                            os.replace(tmp_path, self.channels_state_file)
-                        except Exception:
-                            pass
+                        self.persistence.mark_dirty('channels_state')
 
                 self.channels_state = channels_state
                 
@@ -472,9 +607,8 @@ class DeviceRegistry:
                 'timestamp': int(time.time() * 1000)
             }
         
-        # Guardar a disco de forma async para no bloquear
-        threading.Thread(target=self.save_channels_state, daemon=True).start()
-        return True
+        # Guardar a disco sin bloquear (agrupado con otros cambios de la ventana)
+        return self.save_channels_state()
     
     def get_channels_state(self, client_id: Optional[str] = None) -> dict:
         """✅ NUEVO: Obtener estado de canales.
@@ -513,49 +647,31 @@ class DeviceRegistry:
     # ========================================================================
     
     def cleanup_expired(self):
-        """Limpiar dispositivos expirados."""
+        """Limpiar dispositivos expirados (solo se visitan los que caducan)."""
         with self.device_lock:
-            current_time = time.time()
-            expired = []
-            
-            for uuid, device in self.devices.items():
-                last_seen = device.get('last_seen', 0)
-                if current_time - last_seen > self.device_cache_timeout:
-                    expired.append(uuid)
-            
-            for uuid in expired:
-                logger.info(f"[Device Registry] 🗑️ Limpiando dispositivo expirado: {uuid[:12]}")
-                del self.devices[uuid]
-            
-            if expired:
-                self.save_to_disk()
-            
-            return len(expired)
+            return self._remove_devices(self.devices.expire(capacity=False))
     
     def cleanup_excess_devices(self):
         """Limpiar si excede máximo de dispositivos (mantener los más recientes)."""
         with self.device_lock:
-            if len(self.devices) > self.max_devices:
-                # Ordenar por last_seen
-                sorted_devices = sorted(
-                    self.devices.items(),
-                    key=lambda x: x[1].get('last_seen', 0)
-                )
-                
-                to_remove = len(self.devices) - self.max_devices
-                removed = []
-                
-                for uuid, _ in sorted_devices[:to_remove]:
-                    logger.info(f"[Device Registry] 🗑️ Limpiando por exceso: {uuid[:12]}")
-                    del self.devices[uuid]
-                    removed.append(uuid)
-                
-                if removed:
-                    self.save_to_disk()
-                
-                return len(removed)
+            return self._remove_devices(self.devices.expire(ttl=False))
+    
+    def _remove_devices(self, removed: list) -> int:
+        """✅ NUEVO: Índices, listeners y persistencia de los dispositivos quitados por expire()"""
+        for uuid, device, reason in removed:
+            if reason == 'expired':
+                logger.info(f"[Device Registry] 🗑️ Limpiando dispositivo expirado: {uuid[:12]}")
+            else:
+                logger.info(f"[Device Registry] 🗑️ Limpiando por exceso: {uuid[:12]}")
+            self._unindex_device(uuid, device)
+            self._notify_change(uuid)
+            if self.store is not None:
+                self.store.delete_device(uuid)
         
-        return 0
+        if removed:
+            self.save_to_disk()
+        
+        return len(removed)
     
     def _start_cleanup_thread(self):
         """Iniciar thread de limpieza automática."""
@@ -597,3 +713,58 @@ def init_device_registry(persistence_file: str = "config/devices.json") -> Devic
     _global_registry = DeviceRegistry(persistence_file)
     return _global_registry
 
+
+
+if __name__ == '__main__':
+    # Benchmark: tormenta de reconexiones (500 Android, 2000 handshakes con cambio
+    # de IP) - índices ip+tipo / MAC frente al recorrido lineal anterior
+    import random
+    import tempfile
+
+    logging.disable(logging.INFO)
+    random.seed(7)
+    registry = DeviceRegistry(os.path.join(tempfile.mkdtemp(), 'devices.json'))
+    num_devices = 500
+    for i in range(num_devices):
+        registry.register_device(f'android-{i:04d}', {
+            'type': 'android',
+            'mac_address': f'02:00:00:00:{i // 256:02x}:{i % 256:02x}',
+            'primary_ip': f'192.168.1.{i % 250 + 2}' if i < 250 else f'192.168.2.{i % 250 + 2}'
+        })
+
+    def _linear_by_ip_and_type(ip, device_type):
+        candidates = [d for d in registry.devices.values()
+                      if d.get('primary_ip') == ip and d.get('type') == device_type]
+        return candidates[0] if candidates else None
+
+    def _linear_by_mac(mac):
+        for device in registry.devices.values():
+            if device.get('mac_address') == mac:
+                return device
+        return None
+
+    handshakes = []
+    for _ in range(2000):
+        i = random.randrange(num_devices)
+        device = registry.devices[f'android-{i:04d}']
+        handshakes.append((i, device['mac_address'], f'10.0.{random.randrange(4)}.{random.randrange(2, 250)}'))
+
+    indexed = linear = 0.0
+    for i, mac, new_ip in handshakes:
+        ip = registry.devices[f'android-{i:04d}']['primary_ip']
+        t0 = time.perf_counter()
+        found = (registry.find_device_by_mac(mac), registry.find_device_by_ip_and_type(ip, 'android'))
+        t1 = time.perf_counter()
+        expected = (_linear_by_mac(mac), _linear_by_ip_and_type(ip, 'android'))
+        t2 = time.perf_counter()
+        assert found == expected
+        indexed += t1 - t0
+        linear += t2 - t1
+        # Reconexión desde otra IP (DHCP): el índice se actualiza en register_device
+        registry.register_device(f'android-{i:04d}', {'type': 'android', 'primary_ip': new_ip})
+
+    lookups = 2 * len(handshakes)
+    print(f"{num_devices} dispositivos, {len(handshakes)} handshakes | "
+          f"índice: {indexed / lookups * 1e6:.2f} µs/búsqueda | "
+          f"recorrido lineal: {linear / lookups * 1e6:.2f} µs/búsqueda")
+    registry.persistence.stop()
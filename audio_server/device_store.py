@@ -0,0 +1,433 @@
+"""
+device_store.py - Backend SQLite (WAL) opcional para DeviceRegistry
+✅ Tablas devices / configurations / tags con índices para ip+tipo, MAC y last_seen
+✅ Un único hilo escritor: los cambios son upserts de UNA fila, agrupados por transacción
+✅ Importación única desde devices.json (el JSON no se toca)
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+
+from audio_server.quantiles import QuantileSketch
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    uuid TEXT PRIMARY KEY,
+    type TEXT,
+    name TEXT,
+    custom_name TEXT,
+    mac_address TEXT,
+    primary_ip TEXT,
+    device_info TEXT,
+    first_seen REAL,
+    last_seen REAL,
+    reconnections INTEGER DEFAULT 0,
+    active INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_devices_ip_type ON devices (primary_ip, type);
+CREATE INDEX IF NOT EXISTS idx_devices_mac ON devices (mac_address);
+CREATE INDEX IF NOT EXISTS idx_devices_last_seen ON devices (last_seen);
+
+CREATE TABLE IF NOT EXISTS configurations (
+    uuid TEXT PRIMARY KEY REFERENCES devices (uuid) ON DELETE CASCADE,
+    configuration TEXT,
+    session_id TEXT,
+    updated_at REAL
+);
+
+CREATE TABLE IF NOT EXISTS tags (
+    uuid TEXT REFERENCES devices (uuid) ON DELETE CASCADE,
+    tag TEXT,
+    PRIMARY KEY (uuid, tag)
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_UPSERT_DEVICE = """
+INSERT INTO devices (uuid, type, name, custom_name, mac_address, primary_ip, device_info,
+                     first_seen, last_seen, reconnections, active)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (uuid) DO UPDATE SET
+    type = excluded.type, name = excluded.name, custom_name = excluded.custom_name,
+    mac_address = excluded.mac_address, primary_ip = excluded.primary_ip,
+    device_info = excluded.device_info, last_seen = excluded.last_seen,
+    reconnections = excluded.reconnections, active = excluded.active
+"""
+
+_UPSERT_CONFIGURATION = """
+INSERT INTO configurations (uuid, configuration, session_id, updated_at)
+VALUES (?, ?, ?, ?)
+ON CONFLICT (uuid) DO UPDATE SET
+    configuration = excluded.configuration, session_id = excluded.session_id,
+    updated_at = excluded.updated_at
+"""
+
+
+def _device_row(device: dict) -> tuple:
+    return (
+        device['uuid'],
+        device.get('type'),
+        device.get('name'),
+        device.get('custom_name'),
+        device.get('mac_address'),
+        device.get('primary_ip'),
+        json.dumps(device.get('device_info') or {}, ensure_ascii=False),
+        device.get('first_seen'),
+        device.get('last_seen'),
+        device.get('reconnections', 0),
+        1 if device.get('active') else 0
+    )
+
+
+class SqliteDeviceStore:
+    """
+    Persistencia por fila del registro de dispositivos.
+
+    Los productores (con device_lock tomado) solo dejan una copia de la fila
+    en un dict pendiente por (tabla, uuid): el último valor gana. El hilo
+    escritor vacía lo pendiente en una transacción. `flush()` espera a que
+    todo lo encolado hasta ese momento esté en disco.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._written = threading.Condition(self._lock)
+        self._enqueued = 0      # Secuencia del último cambio encolado
+        self._committed = 0     # Secuencia del último cambio escrito
+        self.running = False
+        self.thread = None
+
+        # Métricas
+        self.rows_requested = 0
+        self.rows_written = 0
+        self.transactions = 0
+        self.commit_ms = QuantileSketch()
+        self.write_errors = 0
+
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA foreign_keys=ON')
+        return conn
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True, name='device-store')
+        self.thread.start()
+        logger.info(f"[DeviceStore] ✅ SQLite WAL activo: {self.db_path}")
+
+    # ------------------------------------------------------------------
+    # Lectura (arranque)
+    # ------------------------------------------------------------------
+
+    def load(self) -> dict:
+        """Todos los dispositivos en el formato de registro de DeviceRegistry"""
+        devices = {}
+        conn = self._connect()
+        try:
+            for row in conn.execute(
+                'SELECT uuid, type, name, custom_name, mac_address, primary_ip, device_info, '
+                'first_seen, last_seen, reconnections, active FROM devices'
+            ):
+                try:
+                    device_info = json.loads(row[6]) if row[6] else {}
+                except ValueError:
+                    device_info = {}
+                devices[row[0]] = {
+                    'uuid': row[0],
+                    'type': row[1],
+                    'name': row[2],
+                    'custom_name': row[3],
+                    'mac_address': row[4],
+                    'primary_ip': row[5],
+                    'device_info': device_info,
+                    'first_seen': row[7],
+                    'last_seen': row[8],
+                    'reconnections': row[9] or 0,
+                    'configuration': {},
+                    'configuration_session_id': None,
+                    'tags': [],
+                    'active': bool(row[10])
+                }
+            for uuid, configuration, session_id in conn.execute(
+                'SELECT uuid, configuration, session_id FROM configurations'
+            ):
+                device = devices.get(uuid)
+                if device is None:
+                    continue
+                try:
+                    device['configuration'] = json.loads(configuration) if configuration else {}
+                except ValueError:
+                    pass
+                device['configuration_session_id'] = session_id
+            for uuid, tag in conn.execute('SELECT uuid, tag FROM tags'):
+                device = devices.get(uuid)
+                if device is not None:
+                    device['tags'].append(tag)
+        finally:
+            conn.close()
+        return devices
+
+    def import_json(self, json_path: str) -> int:
+        """Importación única desde devices.json (queda marcada en la tabla meta)"""
+        conn = self._connect()
+        try:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'imported_json'").fetchone():
+                return 0
+            if not os.path.exists(json_path):
+                return 0
+            with open(json_path, 'r') as f:
+                devices = json.load(f) or {}
+            now = time.time()
+            imported = 0
+            with conn:
+                for uuid, device in devices.items():
+                    if not isinstance(device, dict):
+                        continue
+                    device = dict(device, uuid=device.get('uuid') or uuid)
+                    conn.execute(_UPSERT_DEVICE, _device_row(device))
+                    if device.get('configuration'):
+                        conn.execute(_UPSERT_CONFIGURATION, (
+                            device['uuid'], json.dumps(device['configuration'], ensure_ascii=False),
+                            device.get('configuration_session_id'), now
+                        ))
+                    for tag in device.get('tags') or []:
+                        conn.execute('INSERT OR IGNORE INTO tags (uuid, tag) VALUES (?, ?)',
+                                     (device['uuid'], tag))
+                    imported += 1
+                conn.execute("INSERT INTO meta (key, value) VALUES ('imported_json', ?)",
+                             (json.dumps({'path': json_path, 'devices': imported, 'at': now}),))
+            logger.info(f"[DeviceStore] 📥 Importados {imported} dispositivos desde {json_path}")
+            return imported
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------------
+    # API de productores (cualquier hilo, sin E/S)
+    # ------------------------------------------------------------------
+
+    def _enqueue(self, key, value):
+        with self._lock:
+            if key[0] != 'delete':
+                # Re-registro tras un borrado aún pendiente: gana el upsert
+                self._pending.pop(('delete', key[1]), None)
+            self._pending[key] = value
+            self._enqueued += 1
+            self.rows_requested += 1
+        self._wakeup.set()
+
+    def upsert_device(self, device: dict):
+        snapshot = dict(device)
+        snapshot['device_info'] = dict(device.get('device_info') or {})
+        self._enqueue(('device', device['uuid']), snapshot)
+
+    def upsert_configuration(self, device_uuid: str, configuration: dict, session_id=None):
+        self._enqueue(('configuration', device_uuid), (dict(configuration or {}), session_id))
+
+    def add_tag(self, device_uuid: str, tag: str):
+        self._enqueue(('tag', device_uuid, tag), True)
+
+    def delete_device(self, device_uuid: str):
+        with self._lock:
+            # Un borrado anula cualquier upsert pendiente del mismo dispositivo
+            for key in [k for k in self._pending if k[1] == device_uuid]:
+                del self._pending[key]
+        self._enqueue(('delete', device_uuid), True)
+
+    # ------------------------------------------------------------------
+    # Hilo escritor
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            while self.running:
+                self._wakeup.wait(timeout=1.0)
+                self._wakeup.clear()
+                self._write_pending(conn)
+            self._write_pending(conn)
+            with self._lock:
+                if self._pending:
+                    logger.error(f"[DeviceStore] ❌ {len(self._pending)} filas sin escribir al cerrar")
+        finally:
+            conn.close()
+
+    def _write_pending(self, conn: sqlite3.Connection):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            sequence = self._enqueued
+        if not pending:
+            with self._lock:
+                self._committed = max(self._committed, sequence)
+                self._written.notify_all()
+            return
+
+        devices = []
+        configurations = []
+        tags = []
+        deletes = []
+        now = time.time()
+        for key, value in pending.items():
+            kind = key[0]
+            if kind == 'device':
+                devices.append(_device_row(value))
+            elif kind == 'configuration':
+                configuration, session_id = value
+                configurations.append((key[1], json.dumps(configuration, ensure_ascii=False),
+                                       session_id, now))
+            elif kind == 'tag':
+                tags.append((key[1], key[2]))
+            elif kind == 'delete':
+                deletes.append((key[1],))
+
+        start = time.perf_counter()
+        try:
+            with conn:
+                if devices:
+                    conn.executemany(_UPSERT_DEVICE, devices)
+                if configurations:
+                    conn.executemany(_UPSERT_CONFIGURATION, configurations)
+                if tags:
+                    conn.executemany('INSERT OR IGNORE INTO tags (uuid, tag) VALUES (?, ?)', tags)
+                if deletes:
+                    conn.executemany('DELETE FROM devices WHERE uuid = ?', deletes)
+        except sqlite3.Error as e:
+            self.write_errors += 1
+            logger.error(f"[DeviceStore] ❌ Error escribiendo (se reintenta): {e}")
+            # Devolver el lote a lo pendiente sin pisar cambios más nuevos; _committed no avanza
+            # y flush() sigue esperando (el bucle del escritor reintenta en ≤1 s)
+            self._requeue(pending)
+            return
+
+        self.commit_ms.add((time.perf_counter() - start) * 1000)
+        self.transactions += 1
+        self.rows_written += len(pending)
+
+        with self._lock:
+            self._committed = max(self._committed, sequence)
+            self._written.notify_all()
+
+    def _requeue(self, pending: dict):
+        """Reencolar un lote fallido: lo encolado mientras tanto gana"""
+        with self._lock:
+            newer = self._pending
+            newer_uuids = {key[1] for key in newer if key[0] != 'delete'}
+            merged = {}
+            for key, value in pending.items():
+                if key in newer:
+                    continue
+                if key[0] == 'delete':
+                    if key[1] in newer_uuids:
+                        continue   # Re-registrado después del borrado
+                elif ('delete', key[1]) in newer:
+                    continue       # Borrado después del upsert
+                merged[key] = value
+            merged.update(newer)
+            self._pending = merged
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Esperar a que los cambios encolados hasta ahora estén escritos"""
+        if not self.running:
+            return False
+        with self._lock:
+            target = self._enqueued
+            if self._committed >= target:
+                return True
+        self._wakeup.set()
+        with self._lock:
+            return self._written.wait_for(lambda: self._committed >= target, timeout=timeout)
+
+    def close(self):
+        if not self.running:
+            return
+        self.flush()
+        self.running = False
+        self._wakeup.set()
+        if self.thread:
+            self.thread.join(timeout=2.0)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            backlog = len(self._pending)
+        return {
+            'backend': 'sqlite',
+            'db_path': self.db_path,
+            'rows_requested': self.rows_requested,
+            'rows_written': self.rows_written,
+            'coalesced': self.rows_requested - self.rows_written - backlog,
+            'transactions': self.transactions,
+            'backlog': backlog,
+            'commit_ms': self.commit_ms.summary(),
+            'write_errors': self.write_errors
+        }
+
+
+if __name__ == '__main__':
+    # Benchmark: registro de 1000 dispositivos, backend JSON frente a SQLite (WAL).
+    # "durable" = operación + flush() (lo que costaba cuando cada cambio se guardaba
+    # en línea); "write-behind" = solo la operación, el escritor agrupa después.
+    import tempfile
+
+    import config
+    from audio_server.device_registry import DeviceRegistry
+
+    logging.disable(logging.INFO)
+    num_devices = 1000
+    durable_ops = 200
+
+    for backend in ('json', 'sqlite'):
+        config.DEVICE_REGISTRY_BACKEND = backend
+        registry = DeviceRegistry(os.path.join(tempfile.mkdtemp(), 'devices.json'))
+
+        start = time.perf_counter()
+        for i in range(num_devices):
+            registry.register_device(f'device-{i:04d}', {
+                'type': 'android',
+                'name': f'Phone {i}',
+                'mac_address': f'02:00:00:00:{i // 256:02x}:{i % 256:02x}',
+                'primary_ip': f'192.168.{i // 250}.{i % 250 + 2}'
+            })
+        behind_ms = (time.perf_counter() - start) / num_devices * 1000
+        start = time.perf_counter()
+        registry.flush()
+        flush_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        for i in range(durable_ops):
+            registry.update_configuration(f'device-{i:04d}', {'channels': [0, 1, i % 8], 'master_gain': 0.8})
+            registry.flush()
+        durable_ms = (time.perf_counter() - start) / durable_ops * 1000
+
+        on_disk = os.path.getsize(registry.store.db_path if registry.store else registry.persistence_file)
+        print(f"{backend:6s} | register (write-behind): {behind_ms * 1000:7.1f} µs/op | "
+              f"flush final: {flush_ms:7.1f} ms | update_configuration durable: {durable_ms:7.2f} ms/op | "
+              f"{on_disk / 1024:.0f} KiB")
+        if registry.store:
+            stats = registry.store.get_stats()
+            print(f"         filas: {stats['rows_requested']} pedidas, {stats['rows_written']} escritas "
+                  f"en {stats['transactions']} transacciones")
+            registry.store.close()
+        registry.persistence.stop()
@@ -1,70 +1,151 @@
 """
 ⚡ Latency Optimizer - Monitoreo y reducción de latencia WebSocket
-✅ Debouncing de parámetros frecuentes
-✅ Batching de actualizaciones
-✅ Logging de latencias
+✅ Coalescencia de parámetros frecuentes (faders) por (cliente, parámetro, canal)
+✅ Batching de actualizaciones a tasa acotada (un flush por cliente y ventana)
+✅ Flushes en un pool pequeño: un Android congestionado no retrasa los del resto
+✅ Latencias por tipo de evento en sketches de cuantiles (handlers Socket.IO con @timed_handler)
 """
 
 import time
 import logging
+import functools
 import threading
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Callable, Any
 
+import config
+from audio_server.timer_wheel import TimerWheel
+from audio_server.quantiles import QuantileSketch
+
 logger = logging.getLogger(__name__)
 
 
 class LatencyOptimizer:
     """
     ✅ Sistema para reducir latencia en cambios frecuentes de parámetros
-    - Debounce: agrupa cambios múltiples dentro de una ventana de tiempo
-    - Batching: envía cambios en lotes en lugar de uno por uno
+    - Coalescencia: por (cliente, parámetro, canal) solo viaja el último valor
+    - Batching: un flush por cliente y ventana (tasa acotada, no se pospone
+      mientras el fader se sigue moviendo)
     - Latency tracking: mide tiempos de respuesta
+    
+    Quien llama aplica el cambio a ChannelManager al momento; aquí solo se
+    agrupa lo caro (push a Android, param_sync, persistencia, broadcast), que
+    hacen los handlers registrados con add_flush_handler().
     """
 
     def __init__(self, debounce_ms: int = 50):
         self.debounce_ms = debounce_ms / 1000.0  # convertir a segundos
-        self.pending_updates = {}  # client_id -> {'gains': {...}, 'pans': {...}, ...}
-        self.debounce_timers = {}  # client_id -> threading.Timer
+        self.pending_updates = {}  # client_id -> {'params': {...}, 'origins': {...}, 'sources': set, 'events': n}
+        # ✅ OPTIMIZACIÓN: Un solo hilo planificador (timer wheel) en vez de un threading.Timer por flush
+        self.scheduler = TimerWheel(
+            tick=getattr(config, 'PARAM_COALESCE_TICK_MS', 5) / 1000.0, name='param-coalescer'
+        )
         self.lock = threading.Lock()
+        self.flush_handlers = []   # callback(client_id, updates)
+        # ✅ NUEVO: La rueda solo entrega flushes vencidos; los handlers (sendall a Android,
+        # broadcast, registro) corren aquí. Un flush a la vez por cliente (orden preservado)
+        self.flush_pool = ThreadPoolExecutor(
+            max_workers=max(1, getattr(config, 'PARAM_FLUSH_WORKERS', 4)),
+            thread_name_prefix='param-flush-'
+        )
+        self._flushing = set()     # client_id con flush en curso en el pool
+        self._reflush = set()      # client_id vencidos otra vez durante su flush
+        
+        # ✅ NUEVO: Métricas de coalescencia (eventos que entran vs mensajes que salen)
+        self.events_in = 0
+        self.flushes = 0
+        self.messages_out = defaultdict(int)  # tipo de salida -> mensajes
         
         # Latency tracking
-        self.latency_samples = defaultdict(list)  # event_type -> [latencies_ms]
-        self.max_samples = 100  # Mantener último 100 muestras
+        # ✅ OPTIMIZACIÓN: Sketch de cuantiles por tipo de evento (memoria acotada, add O(1))
+        self.latency_sketches = {}  # event_type -> QuantileSketch (ms)
+        self.latency_lock = threading.Lock()
+        self.latency_since = time.time()
         
         logger.info(f"[LatencyOptimizer] ✅ Inicializado (debounce: {debounce_ms}ms)")
 
-    def queue_parameter_update(self, client_id: str, param_type: str, channel: int, value: float):
+    def add_flush_handler(self, callback: Callable[[str, Dict[str, Any]], None]):
+        """✅ NUEVO: Registrar quien envía/persiste los cambios agrupados de un cliente"""
+        with self.lock:
+            if callback not in self.flush_handlers:
+                self.flush_handlers.append(callback)
+
+    def remove_flush_handler(self, callback: Callable[[str, Dict[str, Any]], None]):
+        """✅ NUEVO: Quitar un handler (el servidor que lo registró se detiene)"""
+        with self.lock:
+            if callback in self.flush_handlers:
+                self.flush_handlers.remove(callback)
+
+    def queue_parameter_update(self, client_id: str, param_type: str, channel: int, value: Any,
+                               source: str = 'web', skip_sid: str = None):
         """
-        Encolar una actualización de parámetro con debouncing
+        Encolar una actualización de parámetro con coalescencia
         
         Args:
             client_id: ID del cliente
-            param_type: 'gain' o 'pan'
+            param_type: 'gain', 'pan', 'mute', 'channel_toggle', ... ('mix' = solo marcador de flush)
             channel: Canal afectado
-            value: Valor del parámetro
+            value: Valor del parámetro (gana el último de la ventana)
+            source: Origen del cambio ('web' | 'android')
+            skip_sid: Sesión web que ya lo sabe (no recibe su propio param_sync)
         """
+        key = (param_type, channel)
         with self.lock:
-            # Inicializar estructura si no existe
-            if client_id not in self.pending_updates:
-                self.pending_updates[client_id] = {'gains': {}, 'pans': {}}
+            self.events_in += 1
             
-            # Almacenar el cambio
-            key = 'gains' if param_type == 'gain' else 'pans'
-            self.pending_updates[client_id][key][channel] = value
+            # Inicializar estructura si no existe
+            updates = self.pending_updates.get(client_id)
+            if updates is None:
+                updates = {'params': {}, 'origins': {}, 'sources': set(), 'events': 0}
+                self.pending_updates[client_id] = updates
             
-            # Cancelar timer anterior si existe
-            if client_id in self.debounce_timers:
-                self.debounce_timers[client_id].cancel()
+            # Almacenar el cambio (el último valor gana)
+            updates['params'][key] = value
+            updates['origins'][key] = (source, skip_sid)
+            updates['sources'].add(source)
+            updates['events'] += 1
             
-            # Crear nuevo timer (ejecutará después de debounce_ms)
-            timer = threading.Timer(
-                self.debounce_ms,
-                self._flush_pending_updates,
-                args=[client_id]
-            )
-            self.debounce_timers[client_id] = timer
-            timer.start()
+            # Un solo flush programado por ventana: mover el fader no lo retrasa
+            if updates['events'] > 1:
+                return
+            immediate = self.debounce_ms <= 0
+            if not immediate:
+                # Flush dentro de debounce_ms en el hilo de la rueda (O(1), sin hilo nuevo)
+                self.scheduler.schedule(client_id, self.debounce_ms, self._dispatch_flush, client_id)
+        
+        if immediate:
+            # Ventana 0: sin coalescencia, flush en el hilo que llama
+            self._flush_pending_updates(client_id)
+
+    def _dispatch_flush(self, client_id: str):
+        """✅ NUEVO: Hilo de la rueda: pasar el flush vencido al pool sin ejecutarlo aquí"""
+        with self.lock:
+            if client_id in self._flushing:
+                # El flush anterior sigue en curso: se repite al terminar (mismo hilo, en orden)
+                self._reflush.add(client_id)
+                return
+            self._flushing.add(client_id)
+        try:
+            self.flush_pool.submit(self._run_flush, client_id)
+        except RuntimeError:
+            # Pool cerrado (apagado): flush en este hilo
+            with self.lock:
+                self._flushing.discard(client_id)
+            self._flush_pending_updates(client_id)
+
+    def _run_flush(self, client_id: str):
+        while True:
+            try:
+                self._flush_pending_updates(client_id)
+            finally:
+                with self.lock:
+                    again = client_id in self._reflush
+                    self._reflush.discard(client_id)
+                    if not again:
+                        self._flushing.discard(client_id)
+            if not again:
+                return
 
     def _flush_pending_updates(self, client_id: str):
         """Enviar los cambios pendientes acumulados"""
@@ -73,56 +154,91 @@ class LatencyOptimizer:
                 return
             
             updates = self.pending_updates.pop(client_id)
-            if client_id in self.debounce_timers:
-                del self.debounce_timers[client_id]
+            self.flushes += 1
+            handlers = list(self.flush_handlers)
         
-        # Aquí retornar los updates para que el caller los envíe
-        if updates['gains'] or updates['pans']:
+        if updates['params']:
             logger.debug(f"[LatencyOptimizer] 🚀 Flush updates: {client_id[:8]} "
-                        f"(gains: {len(updates['gains'])}, pans: {len(updates['pans'])})")
+                        f"({updates['events']} eventos -> {len(updates['params'])} parámetros)")
+        
+        for handler in handlers:
+            try:
+                handler(client_id, updates)
+            except Exception as e:
+                logger.error(f"[LatencyOptimizer] ❌ Error en flush de {client_id[:8]}: {e}")
         
-        return updates if (updates['gains'] or updates['pans']) else None
+        return updates if updates['params'] else None
+
+    def flush_all(self, source: str = None):
+        """
+        ✅ NUEVO: Enviar ya todo lo pendiente (apagado), en el hilo que llama
+        source: solo las ventanas con cambios de ese origen ('web' | 'android')
+        """
+        with self.lock:
+            client_ids = [
+                client_id for client_id, updates in self.pending_updates.items()
+                if source is None or source in updates['sources']
+            ]
+        for client_id in client_ids:
+            self.scheduler.cancel(client_id)
+            self._flush_pending_updates(client_id)
 
-    def get_pending_updates(self, client_id: str) -> Dict[str, Dict[int, float]] | None:
+    def get_pending_updates(self, client_id: str) -> Dict[str, Any] | None:
         """Obtener y limpiar updates pendientes"""
         with self.lock:
             if client_id in self.pending_updates:
                 updates = self.pending_updates.pop(client_id)
-                if client_id in self.debounce_timers:
-                    self.debounce_timers[client_id].cancel()
-                    del self.debounce_timers[client_id]
+                self.scheduler.cancel(client_id)
                 
-                if updates['gains'] or updates['pans']:
+                if updates['params']:
                     return updates
         
         return None
 
-    def record_latency(self, event_type: str, latency_ms: float):
-        """Registrar muestra de latencia"""
+    def record_output(self, kind: str, count: int = 1):
+        """✅ NUEVO: Contar mensajes que salen de un flush (param_sync, mix_state, broadcast...)"""
         with self.lock:
-            samples = self.latency_samples[event_type]
-            samples.append(latency_ms)
-            
-            # Mantener solo las últimas N muestras
-            if len(samples) > self.max_samples:
-                samples.pop(0)
+            self.messages_out[kind] += count
 
-    def get_latency_stats(self) -> Dict[str, Dict[str, float]]:
-        """Obtener estadísticas de latencia"""
-        import statistics
-        
-        stats = {}
+    def get_stats(self) -> Dict[str, Any]:
+        """✅ NUEVO: Eventos recibidos vs mensajes emitidos"""
         with self.lock:
-            for event_type, samples in self.latency_samples.items():
-                if samples:
-                    stats[event_type] = {
-                        'avg': statistics.mean(samples),
-                        'min': min(samples),
-                        'max': max(samples),
-                        'samples': len(samples)
-                    }
-        
-        return stats
+            messages_out = dict(self.messages_out)
+            total_out = sum(messages_out.values())
+            return {
+                'window_ms': round(self.debounce_ms * 1000, 1),
+                'events_in': self.events_in,
+                'flushes': self.flushes,
+                'messages_out': total_out,
+                'messages_out_by_type': messages_out,
+                'pending_clients': len(self.pending_updates),
+                'flushing_clients': len(self._flushing),
+                'reduction': round(self.events_in / total_out, 2) if total_out else None,
+                'scheduler': self.scheduler.get_stats()
+            }
+
+    def record_latency(self, event_type: str, latency_ms: float):
+        """Registrar muestra de latencia"""
+        with self.latency_lock:
+            sketch = self.latency_sketches.get(event_type)
+            if sketch is None:
+                sketch = QuantileSketch()
+                self.latency_sketches[event_type] = sketch
+            sketch.add(latency_ms)
+
+    def get_latency_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Obtener estadísticas de latencia: {evento: {count, mean, min, max, p50, p90, p99}} en ms"""
+        with self.latency_lock:
+            return {
+                event_type: sketch.summary()
+                for event_type, sketch in sorted(self.latency_sketches.items())
+            }
+
+    def reset_latency_stats(self):
+        """✅ NUEVO: Empezar una medición nueva (p.ej. antes de una prueba de carga)"""
+        with self.latency_lock:
+            self.latency_sketches = {}
+            self.latency_since = time.time()
 
     def log_latency_summary(self):
         """Loguear resumen de latencias"""
@@ -130,17 +246,121 @@ class LatencyOptimizer:
         if stats:
             logger.info("[LatencyOptimizer] 📊 Latencia WebSocket:")
             for event_type, data in stats.items():
-                logger.info(f"  {event_type}: avg={data['avg']:.2f}ms, "
-                           f"min={data['min']:.2f}ms, max={data['max']:.2f}ms")
+                logger.info(f"  {event_type}: n={data['count']}, p50={data['p50']}ms, "
+                           f"p99={data['p99']}ms, max={data['max']}ms")
+
+
+def timed_handler(event_type: str):
+    """
+    ✅ NUEVO: Decorador de handlers Socket.IO: tiempo de ejecución al sketch de `event_type`.
+    Coste: dos perf_counter() y un add() O(1); se registra también si el handler lanza.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                get_optimizer().record_latency(event_type, (time.perf_counter() - start) * 1000)
+        return wrapper
+    return decorator
 
 
 # Instancia global
 _optimizer_instance = None
 
 
-def get_optimizer(debounce_ms: int = 50) -> LatencyOptimizer:
+def get_optimizer(debounce_ms: int = None) -> LatencyOptimizer:
     """Obtener o crear instancia global del optimizer"""
     global _optimizer_instance
     if _optimizer_instance is None:
+        if debounce_ms is None:
+            debounce_ms = getattr(config, 'PARAM_COALESCE_MS', 50)
         _optimizer_instance = LatencyOptimizer(debounce_ms)
     return _optimizer_instance
+
+
+if __name__ == '__main__':
+    # Benchmark: 10k actualizaciones/s (20 clientes × 8 canales) durante 2 s.
+    # Antes: cancelar + crear un threading.Timer (un hilo) por actualización.
+    # Ahora: coalescencia por ventana sobre la rueda de un solo hilo.
+    import random
+
+    rate = 10000
+    duration = 2.0
+    window = 0.05
+    keys = [(f'client-{c}', ch) for c in range(20) for ch in range(8)]
+
+    def paced(update):
+        """Llamar a update(i) a `rate` por segundo; devuelve µs por llamada (coste del productor)"""
+        total = int(rate * duration)
+        start = time.perf_counter()
+        spent = 0.0
+        for i in range(total):
+            target = start + i / rate
+            while time.perf_counter() < target:
+                pass
+            t0 = time.perf_counter()
+            update(i)
+            spent += time.perf_counter() - t0
+        return spent / total * 1e6
+
+    # --- Timer por actualización (implementación anterior) ---
+    timers = {}
+    legacy_lock = threading.Lock()
+    legacy_flushes = [0]
+    threads_before = threading.active_count()
+    peak_threads = [threads_before]
+
+    def legacy_flush(client_id):
+        with legacy_lock:
+            timers.pop(client_id, None)
+            legacy_flushes[0] += 1
+
+    def legacy_update(i):
+        client_id, _ = keys[random.randrange(len(keys))]
+        with legacy_lock:
+            if client_id in timers:
+                timers[client_id].cancel()
+            timer = threading.Timer(window, legacy_flush, args=[client_id])
+            timer.daemon = True
+            timers[client_id] = timer
+            timer.start()
+        if i % 500 == 0:
+            peak_threads[0] = max(peak_threads[0], threading.active_count())
+
+    legacy_us = paced(legacy_update)
+    time.sleep(window * 4)
+    print(f"threading.Timer: {legacy_us:7.2f} µs/actualización, pico de hilos "
+          f"{peak_threads[0] - threads_before}, flushes {legacy_flushes[0]}")
+
+    # --- Rueda de temporizadores + coalescencia ---
+    optimizer = LatencyOptimizer(int(window * 1000))
+    delivered = QuantileSketch()
+    first_event = {}
+
+    def on_flush(client_id, updates):
+        delivered.add((time.perf_counter() - first_event.pop(client_id)) * 1000)
+        optimizer.record_output('param_sync', len(updates['params']))
+
+    optimizer.add_flush_handler(on_flush)
+    threads_before = threading.active_count()
+    peak_threads = [threads_before]
+
+    def wheel_update(i):
+        client_id, channel = keys[random.randrange(len(keys))]
+        first_event.setdefault(client_id, time.perf_counter())
+        optimizer.queue_parameter_update(client_id, 'gain', channel, random.random())
+        if i % 500 == 0:
+            peak_threads[0] = max(peak_threads[0], threading.active_count())
+
+    wheel_us = paced(wheel_update)
+    time.sleep(window * 4)
+    stats = optimizer.get_stats()
+    summary = delivered.summary()
+    print(f"TimerWheel:      {wheel_us:7.2f} µs/actualización, pico de hilos "
+          f"{peak_threads[0] - threads_before}, flushes {stats['flushes']}")
+    print(f"  eventos {stats['events_in']} -> mensajes {stats['messages_out']} (x{stats['reduction']}), "
+          f"primer evento -> flush p50 {summary['p50']}ms p99 {summary['p99']}ms, "
+          f"lag máx. rueda {stats['scheduler']['max_lag_ms']}ms")
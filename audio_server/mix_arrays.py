@@ -0,0 +1,189 @@
+"""
+mix_arrays.py - Estado de mezcla denso (clientes × canales) para consumidores vectorizados
+✅ Arrays float32 de ganancia, pan y mute + máscara de canales ruteados y master_gain
+✅ Índice estable client_id -> fila (las filas libres se reutilizan, nunca se mueven)
+✅ Un cambio de mezcla reescribe UNA fila: coste independiente del número de clientes
+✅ Exposición de solo lectura (vistas con writeable=False)
+"""
+
+import logging
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# version: contador de cambios | index: {client_id: fila} | resto: vistas de solo lectura
+MixArraysView = namedtuple('MixArraysView', (
+    'version', 'index', 'gains', 'pans', 'mutes', 'routed', 'master_gain'))
+
+
+def _read_only(array: np.ndarray) -> np.ndarray:
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+class MixArrays:
+    """
+    Espejo denso de las suscripciones de ChannelManager.
+
+    Los dicts siguen siendo la fuente de verdad (persistencia, UI); estos
+    arrays se reescriben fila a fila en cada cambio para que el audio pueda
+    trabajar con `gains * routed * (1 - mutes) * master_gain[:, None]` sin
+    recorrer dicts por bloque. Valores por defecto de una fila: ganancia 1.0,
+    pan 0.0, sin mute, ningún canal ruteado.
+    """
+
+    def __init__(self, num_channels: int, initial_clients: int = 16):
+        self.num_channels = num_channels
+        self._capacity = max(1, initial_clients)
+        self._index = {}
+        self._free = []
+        self._next_row = 0
+        self.version = 0
+        self.lock = threading.Lock()
+        self._allocate(self._capacity)
+        self._view = None
+
+    def _allocate(self, capacity: int):
+        rows = self._next_row
+        gains = np.ones((capacity, self.num_channels), dtype=np.float32)
+        pans = np.zeros((capacity, self.num_channels), dtype=np.float32)
+        mutes = np.zeros((capacity, self.num_channels), dtype=np.float32)
+        routed = np.zeros((capacity, self.num_channels), dtype=bool)
+        master_gain = np.zeros(capacity, dtype=np.float32)
+        if rows:
+            gains[:rows] = self._gains[:rows]
+            pans[:rows] = self._pans[:rows]
+            mutes[:rows] = self._mutes[:rows]
+            routed[:rows] = self._routed[:rows]
+            master_gain[:rows] = self._master_gain[:rows]
+        # Se reemplazan los arrays (no se redimensionan): las vistas ya entregadas siguen válidas
+        self._gains = gains
+        self._pans = pans
+        self._mutes = mutes
+        self._routed = routed
+        self._master_gain = master_gain
+
+    # ------------------------------------------------------------------
+    # Escritura (hilos de control, vía ChannelManager)
+    # ------------------------------------------------------------------
+
+    def update(self, client_id, subscription):
+        """Reescribir la fila del cliente (o liberarla si ya no hay suscripción)"""
+        if subscription is None:
+            self.remove(client_id)
+            return
+
+        with self.lock:
+            row = self._index.get(client_id)
+            if row is None:
+                row = self._acquire_row()
+                self._index[client_id] = row
+                self._view = None
+            self._write_row(row, subscription)
+            self.version += 1
+
+    def remove(self, client_id):
+        with self.lock:
+            row = self._index.pop(client_id, None)
+            if row is None:
+                return
+            self._reset_row(row)
+            self._free.append(row)
+            self._view = None
+            self.version += 1
+
+    def _acquire_row(self) -> int:
+        if self._free:
+            return self._free.pop()
+        if self._next_row >= self._capacity:
+            self._capacity *= 2
+            self._allocate(self._capacity)
+            logger.debug(f"[MixArrays] Capacidad ampliada a {self._capacity} clientes")
+        row = self._next_row
+        self._next_row += 1
+        return row
+
+    def _reset_row(self, row: int):
+        self._gains[row] = 1.0
+        self._pans[row] = 0.0
+        self._mutes[row] = 0.0
+        self._routed[row] = False
+        self._master_gain[row] = 0.0
+
+    def _cells(self, mapping):
+        """(índices, valores) de un dict {canal: valor} dentro de rango"""
+        indices = []
+        values = []
+        for ch, value in (mapping or {}).items():
+            try:
+                ch = int(ch)
+            except (ValueError, TypeError):
+                continue
+            if 0 <= ch < self.num_channels:
+                indices.append(ch)
+                values.append(value)
+        return indices, values
+
+    def _write_row(self, row: int, subscription):
+        self._reset_row(row)
+        indices, values = self._cells(subscription.get('gains'))
+        if indices:
+            self._gains[row, indices] = values
+        indices, values = self._cells(subscription.get('pans'))
+        if indices:
+            self._pans[row, indices] = values
+        indices, values = self._cells(subscription.get('mutes'))
+        if indices:
+            self._mutes[row, indices] = [1.0 if muted else 0.0 for muted in values]
+        indices, _ = self._cells(dict.fromkeys(subscription.get('channels', [])))
+        if indices:
+            self._routed[row, indices] = True
+        self._master_gain[row] = subscription.get('master_gain', 1.0)
+
+    # ------------------------------------------------------------------
+    # Lectura (cualquier hilo)
+    # ------------------------------------------------------------------
+
+    def view(self) -> MixArraysView:
+        """Vistas de solo lectura + índice congelado (se recrean solo si cambian las filas)"""
+        with self.lock:
+            view = self._view
+            if view is None or view.gains.base is not self._gains:
+                view = MixArraysView(
+                    version=self.version,
+                    index=MappingProxyType(dict(self._index)),
+                    gains=_read_only(self._gains),
+                    pans=_read_only(self._pans),
+                    mutes=_read_only(self._mutes),
+                    routed=_read_only(self._routed),
+                    master_gain=_read_only(self._master_gain)
+                )
+                self._view = view
+            elif view.version != self.version:
+                view = view._replace(version=self.version)
+                self._view = view
+            return view
+
+    def row(self, client_id):
+        """Copia (ganancias efectivas, pans) de la fila del cliente, o None"""
+        with self.lock:
+            row = self._index.get(client_id)
+            if row is None:
+                return None
+            gains = (self._gains[row] * self._routed[row] * (1.0 - self._mutes[row])
+                     * self._master_gain[row])
+            return gains, self._pans[row].copy()
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                'clients': len(self._index),
+                'capacity': self._capacity,
+                'channels': self.num_channels,
+                'version': self.version
+            }
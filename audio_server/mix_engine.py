@@ -0,0 +1,218 @@
+"""
+mix_engine.py - Motor de mezcla matricial para todas las mezclas del servidor
+✅ Matriz de ganancias (canales × 3·clientes: L, R, mono) con gains/pans/mutes/master_gain ya aplicados
+✅ Actualización incremental: solo se reescriben las columnas del cliente que cambió
+✅ Un solo `bloque @ matriz` (BLAS) por bloque de audio a un buffer preasignado
+"""
+
+import logging
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MIX_COLUMNS = 3  # L, R (pan de potencia constante) y mono (sin pan) por cliente
+
+_mix_engine_instance = None
+_engine_lock = threading.Lock()
+
+
+def needs_server_mix(subscription) -> bool:
+    """Clientes cuya mezcla se calcula en el servidor (maestro y mixdown estéreo)"""
+    if not subscription:
+        return False
+    return bool(subscription.get('is_master')) or subscription.get('mix_mode') == 'stereo'
+
+
+class MixEngine:
+    """
+    ✅ Todas las mezclas estéreo del servidor en una multiplicación de matrices.
+
+    Cada cliente mezclado ocupa un grupo de columnas (L, R, mono). La columna
+    mono ignora el pan (monitor del maestro, mismo nivel que la suma
+    gain·master_gain) y se recorta por separado, no a partir del estéreo ya
+    recortado. Los grupos activos son contiguos (al quitar uno se mueve el
+    último a su hueco), así que el cálculo por bloque es siempre
+    `audio @ matriz[:, :3·n]`. La ley de pan (potencia constante) se evalúa
+    solo al cambiar la mezcla, nunca por bloque.
+
+    La salida usa doble buffer: un consumidor en otro hilo tiene un bloque
+    completo de margen antes de que se sobrescriba.
+    """
+
+    def __init__(self, num_channels: int, initial_clients: int = 8):
+        self.num_channels = num_channels
+        self._capacity = max(1, initial_clients)
+        self._matrix = np.zeros((num_channels, MIX_COLUMNS * self._capacity), dtype=np.float32)
+        self._slots = {}        # {client_id: índice de grupo}
+        self._slot_owner = []   # índice de grupo -> client_id
+        self._outputs = [None, None]
+        self._current = None
+        self._flip = 0
+        self.block_id = 0
+        self.lock = threading.Lock()
+        self.mix_arrays = None  # ✅ NUEVO: filas densas de ChannelManager (si están disponibles)
+
+    # ------------------------------------------------------------------
+    # Actualización de la matriz (hilos de control)
+    # ------------------------------------------------------------------
+
+    def on_subscription_event(self, event):
+        """Listener del bus de ChannelManager: reescribe (o libera) las columnas del cliente"""
+        self.on_subscription_changed(event.client_id, event.route)
+
+    def on_subscription_changed(self, client_id, subscription):
+        if needs_server_mix(subscription):
+            self.set_client_mix(client_id, subscription)
+        else:
+            self.remove_client(client_id)
+
+    def set_mix_arrays(self, mix_arrays):
+        """✅ NUEVO: Leer gains/pans/mutes de las filas densas en vez de recorrer dicts"""
+        self.mix_arrays = mix_arrays
+
+    def sync_all(self, subscriptions: dict):
+        """Reconstruir desde todas las suscripciones (arranque)"""
+        for client_id, subscription in list(subscriptions.items()):
+            self.on_subscription_changed(client_id, subscription)
+
+    def set_client_mix(self, client_id, subscription):
+        row = self.mix_arrays.row(client_id) if self.mix_arrays is not None else None
+        if row is not None and len(row[0]) == self.num_channels:
+            weights = self._weights_from_row(*row)
+        else:
+            weights = self._weights_for(subscription)
+        with self.lock:
+            slot = self._slots.get(client_id)
+            if slot is None:
+                slot = len(self._slot_owner)
+                if slot >= self._capacity:
+                    self._grow()
+                self._slots[client_id] = slot
+                self._slot_owner.append(client_id)
+            self._matrix[:, MIX_COLUMNS * slot:MIX_COLUMNS * (slot + 1)] = weights
+
+    def remove_client(self, client_id):
+        with self.lock:
+            slot = self._slots.pop(client_id, None)
+            if slot is None:
+                return
+            last = len(self._slot_owner) - 1
+            if slot != last:
+                # Mover el último grupo al hueco para mantener columnas contiguas
+                moved = self._slot_owner[last]
+                self._matrix[:, MIX_COLUMNS * slot:MIX_COLUMNS * (slot + 1)] = \
+                    self._matrix[:, MIX_COLUMNS * last:MIX_COLUMNS * (last + 1)]
+                self._slot_owner[slot] = moved
+                self._slots[moved] = slot
+            self._slot_owner.pop()
+            self._matrix[:, MIX_COLUMNS * last:MIX_COLUMNS * (last + 1)] = 0.0
+
+    def _grow(self):
+        self._capacity *= 2
+        matrix = np.zeros((self.num_channels, MIX_COLUMNS * self._capacity), dtype=np.float32)
+        matrix[:, :self._matrix.shape[1]] = self._matrix
+        self._matrix = matrix
+        logger.debug(f"[MixEngine] Capacidad ampliada a {self._capacity} mezclas")
+
+    def _weights_for(self, subscription) -> np.ndarray:
+        """Columnas (canales × 3): L/R con ganancia, mute y pan de potencia constante; mono sin pan"""
+        weights = np.zeros((self.num_channels, MIX_COLUMNS), dtype=np.float32)
+        gains = subscription.get('gains', {})
+        pans = subscription.get('pans', {})
+        mutes = subscription.get('mutes', {})
+        master_gain = subscription.get('master_gain', 1.0)
+        for ch in subscription.get('channels', []):
+            if not 0 <= ch < self.num_channels or mutes.get(ch, False):
+                continue
+            gain = gains.get(ch, 1.0) * master_gain
+            angle = (pans.get(ch, 0.0) + 1.0) * (np.pi / 4)
+            weights[ch, 0] = gain * np.cos(angle)
+            weights[ch, 1] = gain * np.sin(angle)
+            weights[ch, 2] = gain
+        return weights
+
+    @staticmethod
+    def _weights_from_row(gains: np.ndarray, pans: np.ndarray) -> np.ndarray:
+        """Igual que _weights_for pero vectorizado sobre una fila densa (ganancias efectivas)"""
+        angle = (pans + 1.0) * (np.pi / 4)
+        weights = np.empty((len(gains), MIX_COLUMNS), dtype=np.float32)
+        weights[:, 0] = gains * np.cos(angle)
+        weights[:, 1] = gains * np.sin(angle)
+        weights[:, 2] = gains
+        return weights
+
+    # ------------------------------------------------------------------
+    # Cálculo por bloque (hilo de captura)
+    # ------------------------------------------------------------------
+
+    def process(self, audio_block: np.ndarray):
+        """Calcular todas las mezclas del bloque en una sola matmul"""
+        with self.lock:
+            active = len(self._slot_owner)
+            if active == 0 or audio_block.shape[1] != self.num_channels:
+                self._current = None
+                return
+            shape = (audio_block.shape[0], MIX_COLUMNS * active)
+            self._flip ^= 1
+            out = self._outputs[self._flip]
+            if out is None or out.shape != shape:
+                # Solo se realoca si cambia el tamaño de bloque o el número de mezclas
+                out = np.empty(shape, dtype=np.float32)
+                self._outputs[self._flip] = out
+            np.matmul(audio_block, self._matrix[:, :MIX_COLUMNS * active], out=out)
+            np.clip(out, -1.0, 1.0, out=out)
+            self._current = (out, dict(self._slots))
+            self.block_id += 1
+
+    def get_mix(self, client_id):
+        """
+        Mezcla estéreo (frames × 2) del último bloque, o None si el cliente no
+        tiene mezcla en servidor. Es una vista: válida hasta el bloque siguiente.
+        """
+        current = self._current
+        if current is None:
+            return None
+        out, slots = current
+        slot = slots.get(client_id)
+        if slot is None:
+            return None
+        return out[:, MIX_COLUMNS * slot:MIX_COLUMNS * slot + 2]
+
+    def get_mono(self, client_id):
+        """
+        Mezcla mono sin pan (frames,) del último bloque, o None. Vista no
+        contigua: copiar antes de modificarla.
+        """
+        current = self._current
+        if current is None:
+            return None
+        out, slots = current
+        slot = slots.get(client_id)
+        if slot is None:
+            return None
+        return out[:, MIX_COLUMNS * slot + 2]
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                'mixes': len(self._slot_owner),
+                'capacity': self._capacity,
+                'blocks': self.block_id
+            }
+
+
+def init_mix_engine(num_channels: int):
+    """Inicializar instancia única del motor de mezcla"""
+    global _mix_engine_instance
+
+    with _engine_lock:
+        if _mix_engine_instance is None or _mix_engine_instance.num_channels != num_channels:
+            _mix_engine_instance = MixEngine(num_channels)
+        return _mix_engine_instance
+
+
+def get_mix_engine():
+    """Obtener instancia del motor de mezcla"""
+    return _mix_engine_instance
@@ -10,6 +10,8 @@ import json
 
 import logging
 
+import zlib
+
 import config
 
 
@@ -34,8 +36,26 @@ class NativeAndroidProtocol:
 
     FLAG_INT16 = 0x02      # ✅ NUEVO: Flag para Int16
 
+    FLAG_COMPRESSED = 0x04  # ✅ NUEVO: Audio int16 comprimido con zlib (ladder de congestión)
+
+    FLAG_MIXDOWN = 0x08     # ✅ NUEVO: Payload es la mezcla estéreo L/R del cliente (mask = 0b11)
+
+    # ✅ NUEVO: Codificaciones seleccionables por cliente (de mayor a menor ancho de banda)
+    ENCODING_FLOAT32 = 'float32'
+    ENCODING_INT16 = 'int16'
+    ENCODING_INT16_ZLIB = 'int16_zlib'
+
     FLAG_RF_MODE = 0x80
 
+    # ✅ NUEVO: Audio por UDP unicast (header + '!IQI' seq/sample_position/mask)
+    MSG_TYPE_AUDIO_UDP = 0x03
+    UDP_PAYLOAD_HEADER_SIZE = 16
+    _udp_payload_struct = struct.Struct('!IQI')
+
+    # ✅ NUEVO: FEC XOR (paridad cada K datagramas UDP de un cliente)
+    MSG_TYPE_FEC = 0x04
+    _fec_struct = struct.Struct('!IBBH')  # base_sequence, k, audio_flags, parity_len
+
     
 
     MAX_CONTROL_PAYLOAD = 500_000
@@ -52,13 +72,6 @@ class NativeAndroidProtocol:
 
     
 
-    # ✅ OPTIMIZACIÓN LATENCIA: Timestamp cacheado para evitar syscalls
-
-    _cached_timestamp = 0
-
-    _timestamp_cache_valid_ms = 5  # Actualizar cada 5ms máximo
-
-    
 
     # ✅ OPTIMIZACIÓN: Buffers pre-alocados
 
@@ -70,25 +83,32 @@ class NativeAndroidProtocol:
 
     def _get_timestamp_fast():
 
-        """✅ OPTIMIZACIÓN: Timestamp cacheado para reducir syscalls"""
-
-        import time as _time
-
-        current = int(_time.time() * 1000)
-
-        # Solo actualizar si han pasado más de 5ms
+        """
+        ✅ Timestamp del header: reloj MONÓTONO del servidor en ms (32 bits, wrap ~49 días).
+        No salta con NTP ni con cambios de hora; los paquetes de audio usan en su
+        lugar el instante ADC del bloque (ver timestamp_from_ns).
+        """
 
-        if current - NativeAndroidProtocol._cached_timestamp > NativeAndroidProtocol._timestamp_cache_valid_ms:
+        return (time.monotonic_ns() // 1_000_000) & 0xFFFFFFFF
 
-            NativeAndroidProtocol._cached_timestamp = current
+    @staticmethod
+    def timestamp_from_ns(monotonic_ns):
+        """✅ NUEVO: monotonic_ns (p.ej. instante ADC del bloque) -> timestamp de header"""
+        if monotonic_ns is None:
+            return NativeAndroidProtocol._get_timestamp_fast()
+        return (monotonic_ns // 1_000_000) & 0xFFFFFFFF
 
-        return NativeAndroidProtocol._cached_timestamp & 0xFFFFFFFF
+    @staticmethod
+    def monotonic_ms():
+        """✅ NUEVO: Reloj monótono del servidor en ms (sin truncar, para JSON de control)"""
+        return time.monotonic_ns() // 1_000_000
 
 
 
     @staticmethod
 
-    def create_audio_packet(audio_data, active_channels, sample_position, sequence=0, rf_mode=False):
+    def create_audio_packet(audio_data, active_channels, sample_position, sequence=0, rf_mode=False, encoding=None,
+                            preselected=False, extra_flags=0, timestamp=None):
 
         """
 
@@ -140,9 +160,11 @@ class NativeAndroidProtocol:
 
             
 
-            # ✅ Filtrar canales válidos
-
-            valid_channels = [ch for ch in active_channels if 0 <= ch < total_channels]
+            # ✅ Filtrar canales válidos (preselected: columnas ya son active_channels, p.ej. audio remuestreado)
+            if preselected:
+                valid_channels = list(active_channels)
+            else:
+                valid_channels = [ch for ch in active_channels if 0 <= ch < total_channels]
 
             if not valid_channels:
 
@@ -168,15 +190,17 @@ class NativeAndroidProtocol:
 
             # ✅ Seleccionar y entrelazar datos (operación única)
 
-            selected_data = audio_data[:, valid_channels]
+            selected_data = audio_data if preselected else audio_data[:, valid_channels]
 
             interleaved = selected_data.flatten('C')
 
             
 
-            # ✅ DECISIÓN: Int16 o Float32 según config
-
-            use_int16 = getattr(config, 'USE_INT16_ENCODING', True)
+            # ✅ DECISIÓN: Int16 o Float32 según config (o la codificación del cliente)
+            if encoding is None:
+                use_int16 = getattr(config, 'USE_INT16_ENCODING', True)
+            else:
+                use_int16 = encoding != NativeAndroidProtocol.ENCODING_FLOAT32
 
             
 
@@ -206,6 +230,11 @@ class NativeAndroidProtocol:
 
                 flags = NativeAndroidProtocol.FLAG_INT16
 
+                # ✅ NUEVO: zlib nivel 1 (el más rápido) para clientes congestionados
+                if encoding == NativeAndroidProtocol.ENCODING_INT16_ZLIB:
+                    audio_bytes = zlib.compress(audio_bytes, 1)
+                    flags |= NativeAndroidProtocol.FLAG_COMPRESSED
+
             else:
 
                 # Float32 original
@@ -246,6 +275,8 @@ class NativeAndroidProtocol:
 
                 flags |= NativeAndroidProtocol.FLAG_RF_MODE
 
+            flags |= extra_flags
+
             
 
             # ✅ Construir header usando struct pre-compilado
@@ -262,7 +293,8 @@ class NativeAndroidProtocol:
 
                 (NativeAndroidProtocol.MSG_TYPE_AUDIO << 8) | flags,
 
-                NativeAndroidProtocol._get_timestamp_fast(),  # ✅ OPTIMIZADO: timestamp cacheado
+                # ✅ Instante ADC del bloque si se conoce (reloj monótono, ms)
+                timestamp if timestamp is not None else NativeAndroidProtocol._get_timestamp_fast(),
 
                 len(payload)
 
@@ -308,6 +340,212 @@ class NativeAndroidProtocol:
 
     
 
+    @staticmethod
+    def create_udp_audio_datagrams(audio_data, active_channels, sample_position, rf_mode=False, max_datagram=None,
+                                   preselected=False, extra_flags=0, timestamp=None):
+        """
+        ✅ NUEVO: Fragmentar un bloque de audio en datagramas UDP autocontenidos.
+
+        Cada datagrama lleva su propio sample_position y un campo de secuencia
+        (en 0, se estampa por cliente con stamp_udp_sequence). Si se pierde uno,
+        solo se pierden sus muestras: nada queda bloqueado detrás.
+
+        Returns:
+            Lista de bytearray (plantillas) o [] si no hay nada que enviar
+        """
+        try:
+            if not active_channels or audio_data is None or audio_data.size == 0:
+                return []
+
+            total_channels = audio_data.shape[1]
+            if preselected:
+                valid_channels = list(active_channels)
+            else:
+                valid_channels = [ch for ch in active_channels if 0 <= ch < total_channels]
+            if not valid_channels:
+                return []
+
+            channel_mask = 0
+            for ch in valid_channels:
+                if ch < 48:
+                    channel_mask |= (1 << ch)
+
+            selected = audio_data if preselected else audio_data[:, valid_channels]
+
+            use_int16 = getattr(config, 'USE_INT16_ENCODING', True)
+            if use_int16:
+                encoded = (np.clip(selected, -0.9999, 0.9999) * 32767.0).astype('>i2')
+                flags = NativeAndroidProtocol.FLAG_INT16
+            else:
+                encoded = selected.astype('>f4')
+                flags = NativeAndroidProtocol.FLAG_FLOAT32
+            if rf_mode:
+                flags |= NativeAndroidProtocol.FLAG_RF_MODE
+            flags |= extra_flags
+
+            # ✅ Muestras por datagrama para quedar bajo el MTU
+            max_datagram = max_datagram or getattr(config, 'NATIVE_UDP_MAX_DATAGRAM', 1200)
+            overhead = NativeAndroidProtocol.HEADER_SIZE + NativeAndroidProtocol.UDP_PAYLOAD_HEADER_SIZE
+            frame_bytes = encoded.itemsize * len(valid_channels)
+            samples_per_datagram = max(1, (max_datagram - overhead) // frame_bytes)
+
+            if timestamp is None:
+                timestamp = NativeAndroidProtocol._get_timestamp_fast()
+            type_and_flags = (NativeAndroidProtocol.MSG_TYPE_AUDIO_UDP << 8) | flags
+
+            datagrams = []
+            samples = encoded.shape[0]
+            for offset in range(0, samples, samples_per_datagram):
+                audio_bytes = encoded[offset:offset + samples_per_datagram].tobytes()
+                payload_len = NativeAndroidProtocol.UDP_PAYLOAD_HEADER_SIZE + len(audio_bytes)
+
+                datagram = bytearray(NativeAndroidProtocol.HEADER_SIZE + payload_len)
+                NativeAndroidProtocol._header_struct.pack_into(
+                    datagram, 0,
+                    NativeAndroidProtocol.MAGIC_NUMBER,
+                    NativeAndroidProtocol.PROTOCOL_VERSION,
+                    type_and_flags,
+                    timestamp,
+                    payload_len
+                )
+                NativeAndroidProtocol._udp_payload_struct.pack_into(
+                    datagram, NativeAndroidProtocol.HEADER_SIZE,
+                    0, sample_position + offset, channel_mask
+                )
+                datagram[overhead:] = audio_bytes
+                datagrams.append(datagram)
+
+            return datagrams
+
+        except Exception as e:
+            logger.error(f"❌ Error creando datagramas UDP: {e}")
+            return []
+
+    @staticmethod
+    def stamp_udp_sequence(datagram, sequence):
+        """✅ NUEVO: Copiar plantilla UDP con el número de secuencia del cliente"""
+        packet = bytearray(datagram)
+        struct.pack_into('!I', packet, NativeAndroidProtocol.HEADER_SIZE, sequence & 0xFFFFFFFF)
+        return packet
+
+    @staticmethod
+    def decode_udp_audio_payload(payload_bytes):
+        """Decodificar sub-header de un datagrama UDP (seq, sample_position, mask)"""
+        if len(payload_bytes) < NativeAndroidProtocol.UDP_PAYLOAD_HEADER_SIZE:
+            return None
+        sequence, sample_position, channel_mask = NativeAndroidProtocol._udp_payload_struct.unpack_from(payload_bytes, 0)
+        return {
+            'sequence': sequence,
+            'sample_position': sample_position,
+            'channel_mask': channel_mask,
+            'audio_bytes': bytes(payload_bytes[NativeAndroidProtocol.UDP_PAYLOAD_HEADER_SIZE:])
+        }
+
+    @staticmethod
+    def create_fec_packet(datagrams, base_sequence, rf_mode=False):
+        """
+        ✅ NUEVO: Paquete de paridad XOR sobre K datagramas UDP consecutivos.
+
+        Protege todo lo que va después del header (sub-header UDP + audio), así
+        que un datagrama perdido del grupo se reconstruye completo, secuencia
+        incluida. Payload: '!IBBH' + K longitudes '!H' + paridad.
+        """
+        try:
+            k = len(datagrams)
+            if k == 0 or k > 255:
+                return None
+
+            header_size = NativeAndroidProtocol.HEADER_SIZE
+            payloads = [memoryview(d)[header_size:] for d in datagrams]
+            lengths = [len(p) for p in payloads]
+            parity_len = max(lengths)
+
+            parity = np.zeros(parity_len, dtype=np.uint8)
+            for p in payloads:
+                np.bitwise_xor(parity[:len(p)], np.frombuffer(p, dtype=np.uint8), out=parity[:len(p)])
+
+            audio_flags = datagrams[0][7] & ~NativeAndroidProtocol.FLAG_RF_MODE
+            fec_header_len = NativeAndroidProtocol._fec_struct.size + 2 * k
+            payload_len = fec_header_len + parity_len
+
+            flags = NativeAndroidProtocol.FLAG_RF_MODE if rf_mode else 0
+            packet = bytearray(header_size + payload_len)
+            NativeAndroidProtocol._header_struct.pack_into(
+                packet, 0,
+                NativeAndroidProtocol.MAGIC_NUMBER,
+                NativeAndroidProtocol.PROTOCOL_VERSION,
+                (NativeAndroidProtocol.MSG_TYPE_FEC << 8) | flags,
+                NativeAndroidProtocol._get_timestamp_fast(),
+                payload_len
+            )
+            NativeAndroidProtocol._fec_struct.pack_into(
+                packet, header_size, base_sequence & 0xFFFFFFFF, k, audio_flags, parity_len
+            )
+            struct.pack_into(f'!{k}H', packet, header_size + NativeAndroidProtocol._fec_struct.size, *lengths)
+            packet[header_size + fec_header_len:] = parity.tobytes()
+            return packet
+
+        except Exception as e:
+            logger.error(f"❌ Error creando paquete FEC: {e}")
+            return None
+
+    @staticmethod
+    def decode_fec_payload(payload_bytes):
+        """Decodificar payload FEC: base_sequence, k, flags, longitudes y paridad"""
+        fec_size = NativeAndroidProtocol._fec_struct.size
+        if len(payload_bytes) < fec_size:
+            return None
+        base_sequence, k, audio_flags, parity_len = NativeAndroidProtocol._fec_struct.unpack_from(payload_bytes, 0)
+        lengths_end = fec_size + 2 * k
+        if len(payload_bytes) < lengths_end + parity_len:
+            return None
+        lengths = struct.unpack_from(f'!{k}H', payload_bytes, fec_size)
+        return {
+            'base_sequence': base_sequence,
+            'k': k,
+            'audio_flags': audio_flags,
+            'lengths': lengths,
+            'parity': bytes(payload_bytes[lengths_end:lengths_end + parity_len])
+        }
+
+    @staticmethod
+    def recover_from_fec(fec, received_payloads):
+        """
+        ✅ NUEVO: Reconstruir el único datagrama faltante de un grupo FEC.
+
+        Args:
+            fec: dict de decode_fec_payload
+            received_payloads: {sequence: payload_bytes (sin header de 16B)}
+
+        Returns:
+            Datagrama completo (bytes) o None si faltan 0 o más de 1
+        """
+        base = fec['base_sequence']
+        group = [(base + i) & 0xFFFFFFFF for i in range(fec['k'])]
+        missing = [i for i, seq in enumerate(group) if seq not in received_payloads]
+        if len(missing) != 1:
+            return None
+
+        idx = missing[0]
+        parity = np.frombuffer(fec['parity'], dtype=np.uint8).copy()
+        for seq in group:
+            p = received_payloads.get(seq)
+            if p is not None:
+                p = p[:len(parity)]
+                np.bitwise_xor(parity[:len(p)], np.frombuffer(p, dtype=np.uint8), out=parity[:len(p)])
+
+        payload = parity[:fec['lengths'][idx]].tobytes()
+        header = bytearray(NativeAndroidProtocol.HEADER_SIZE)
+        NativeAndroidProtocol._header_struct.pack_into(
+            header, 0,
+            NativeAndroidProtocol.MAGIC_NUMBER,
+            NativeAndroidProtocol.PROTOCOL_VERSION,
+            (NativeAndroidProtocol.MSG_TYPE_AUDIO_UDP << 8) | fec['audio_flags'],
+            0,
+            len(payload)
+        )
+        return bytes(header) + payload
+
     @staticmethod
 
     def create_control_packet(message_type, data=None, rf_mode=False):
@@ -382,7 +620,7 @@ class NativeAndroidProtocol:
 
                 (NativeAndroidProtocol.MSG_TYPE_CONTROL << 8) | flags,
 
-                NativeAndroidProtocol._get_timestamp_fast(),  # ✅ OPTIMIZADO: timestamp cacheado
+                NativeAndroidProtocol._get_timestamp_fast(),
 
                 len(message_bytes)
 
@@ -476,7 +714,8 @@ class NativeAndroidProtocol:
 
             msgType = (typeAndFlags >> 8) & 0xFF
 
-            if msgType not in [NativeAndroidProtocol.MSG_TYPE_AUDIO, NativeAndroidProtocol.MSG_TYPE_CONTROL]:
+            if msgType not in [NativeAndroidProtocol.MSG_TYPE_AUDIO, NativeAndroidProtocol.MSG_TYPE_CONTROL,
+                               NativeAndroidProtocol.MSG_TYPE_AUDIO_UDP, NativeAndroidProtocol.MSG_TYPE_FEC]:
 
                 return False, f"Tipo inválido: {msgType}"
 
@@ -558,7 +797,9 @@ class NativeAndroidProtocol:
 
                 'float32': bool(flags & NativeAndroidProtocol.FLAG_FLOAT32),
 
-                'int16': bool(flags & NativeAndroidProtocol.FLAG_INT16)  # ✅ NUEVO
+                'int16': bool(flags & NativeAndroidProtocol.FLAG_INT16),  # ✅ NUEVO
+                'compressed': bool(flags & NativeAndroidProtocol.FLAG_COMPRESSED),
+                'mixdown': bool(flags & NativeAndroidProtocol.FLAG_MIXDOWN)
 
             }
 
@@ -574,7 +815,7 @@ class NativeAndroidProtocol:
 
     @staticmethod
 
-    def decode_audio_payload(payload_bytes):
+    def decode_audio_payload(payload_bytes, flags=None):
 
         """
 
@@ -602,6 +843,19 @@ class NativeAndroidProtocol:
 
             audio_bytes = payload_bytes[12:]
 
+            # ✅ NUEVO: Payload comprimido (FLAG_COMPRESSED) siempre es int16
+            if flags is not None and flags & NativeAndroidProtocol.FLAG_COMPRESSED:
+                audio_bytes = zlib.decompress(audio_bytes)
+                audio_array = np.frombuffer(audio_bytes, dtype='>i2').astype(np.float32) / 32767.0
+                samples_per_channel = len(audio_array) // len(active_channels) if active_channels else 0
+                return {
+                    'sample_position': sample_position,
+                    'channel_mask': channel_mask,
+                    'active_channels': active_channels,
+                    'audio_data': audio_array,
+                    'samples_per_channel': samples_per_channel
+                }
+
             
 
             # Determinar formato basado en tamaño
@@ -3,7 +3,20 @@ import socket, threading, time, json, struct, numpy as np, logging, os
 import select
 # ✅ ZERO-LATENCY: Queue eliminado - envío directo sin buffers
 from audio_server.native_protocol import NativeAndroidProtocol
-from collections import defaultdict
+from audio_server.udp_audio import UdpAudioSender, FecEncoder
+from audio_server.send_shards import ShardedSender
+from audio_server.stats_counters import ShardedCounters
+from audio_server.congestion import CongestionController, read_send_queue_bytes, LADDER
+from audio_server.resampler import DecimatorBank, output_rate_factor, design_decimation_filter
+from audio_server.mix_engine import get_mix_engine
+from audio_server.control_dispatch import ControlDispatcher
+from audio_server.quantiles import QuantileSketch
+from audio_server.state_journal import StateJournal
+from audio_server.ttl_cache import TTLCache
+from audio_server.latency_optimizer import get_optimizer
+from audio_server.persistence import get_persistence_service
+from audio_server.channel_manager import CLIENT_REMOVED, CHANNELS_CHANGED
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
 import config
 
@@ -30,14 +43,41 @@ class NativeClient:
         self.preferred_audio_format = "float32"  # Por defecto float32
         self.persistent = False
         self.auto_reconnect = False
-        self.packets_sent = 0
-        self.packets_dropped = 0
+        # ✅ NUEVO: Contadores sin lock (captura, shards y hilo de control escriben)
+        self.counters = ShardedCounters(('packets_sent', 'packets_dropped', 'bytes_sent'))
         self.connection_time = time.time()
         self.reconnection_count = 0
         self.consecutive_send_failures = 0
         self.max_consecutive_failures = 10  # ✅ AUMENTADO: 5 → 10 (más tolerante con buffers llenos)
         self.first_buffer_full_time = None  # Inicializar para evitar AttributeError
         
+        # ✅ NUEVO: Audio UDP (None = audio por TCP como siempre)
+        self.udp_addr = None
+        self.udp_sequence = 0
+        self.fec_encoder = None  # ✅ NUEVO: FecEncoder si el cliente negoció FEC
+        
+        # ✅ NUEVO: Escalera de codificación por congestión (solo audio TCP)
+        self.congestion = None
+        self.batch_pending = None  # Paquete retenido en modo lotes
+        self.sndbuf = config.SOCKET_SNDBUF
+        
+        # ✅ NUEVO: Factor de decimación de salida (1 = SAMPLE_RATE completo)
+        self.resample_factor = 1
+        
+        # ✅ NUEVO: El cliente sabe reproducir la mezcla estéreo del servidor (FLAG_MIXDOWN)
+        self.supports_mixdown = False
+        
+        # ✅ NUEVO: Métrica handshake → primer bloque de audio
+        self.handshake_completed_at = None
+        self.awaiting_first_audio = False
+        self.first_audio_ms = None
+        self.control_worker = None  # Worker de control asignado por ControlDispatcher
+        
+        # ✅ NUEVO: Distribuciones de RTT (eco de heartbeat) y latencia ADC → envío (ms)
+        self.rtt = QuantileSketch()
+        self.adc_to_wire = QuantileSketch()
+        self.last_rtt_ms = None
+        
         # ✅ ZERO-LATENCY: Sin cola - envío directo (tipo RF)
         # self.send_queue = ELIMINADO
         # self.send_thread = ELIMINADO
@@ -48,6 +88,7 @@ class NativeClient:
             self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, config.SOCKET_SNDBUF)
             self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, config.SOCKET_RCVBUF)
+            self.sndbuf = self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)  # Linux lo duplica
             # ✅ ZERO-LATENCY: Socket NO-BLOQUEANTE para envío directo (tipo RF)
             self.socket.setblocking(False)  # Non-blocking para envío sin esperas
             # self.socket.settimeout() = ELIMINADO (incompatible con non-blocking)
@@ -68,6 +109,28 @@ class NativeClient:
     def update_activity(self): 
         self.last_activity = time.time()
     
+    @property
+    def packets_sent(self) -> int:
+        return self.counters.value('packets_sent')
+    
+    @property
+    def packets_dropped(self) -> int:
+        return self.counters.value('packets_dropped')
+    
+    @property
+    def bytes_sent(self) -> int:
+        return self.counters.value('bytes_sent')
+    
+    def record_wire_latency(self, adc_ns: int):
+        """✅ NUEVO: Bloque capturado en adc_ns acaba de salir hacia este cliente"""
+        self.adc_to_wire.add((time.monotonic_ns() - adc_ns) / 1e6)
+    
+    def next_udp_sequence(self) -> int:
+        """✅ NUEVO: Secuencia UDP monótona por cliente (wrap a 32 bits)"""
+        seq = self.udp_sequence
+        self.udp_sequence = (seq + 1) & 0xFFFFFFFF
+        return seq
+    
     def update_heartbeat(self): 
         self.last_heartbeat = time.time()
         self.update_activity()
@@ -93,19 +156,19 @@ class NativeClient:
                     if sent == 0:
                         # Socket cerrado
                         self.consecutive_send_failures += 1
-                        self.packets_dropped += 1
+                        self.counters.add('packets_dropped')
                         return False
                     total_sent += sent
                 except BlockingIOError:
                     # Socket buffer lleno - DROP packet (tipo RF)
                     self.consecutive_send_failures += 1
-                    self.packets_dropped += 1
+                    self.counters.add('packets_dropped')
                     return False
                 except (BrokenPipeError, ConnectionError, OSError):
                     self.status = 0
                     return False
             
-            self.packets_sent += 1
+            self.counters.update(packets_sent=1, bytes_sent=data_len)
             self.consecutive_send_failures = 0
             self.update_activity()
             return True
@@ -191,7 +254,7 @@ class NativeClient:
             self.socket.settimeout(1.0)
             try:
                 self.socket.sendall(data)
-                self.packets_sent += 1
+                self.counters.update(packets_sent=1, bytes_sent=len(data))
                 self.consecutive_send_failures = 0
                 self.update_activity()
                 return True
@@ -280,6 +343,7 @@ class NativeClient:
                 'pans': {str(int(k)): float(v) for k, v in pans.items()},
                 'mutes': {str(int(k)): bool(v) for k, v in mutes.items()},
                 'master_gain': float(master_gain),
+                'mix_mode': subscription.get('mix_mode', 'channels'),
             }
 
             packet = NativeAndroidProtocol.create_control_packet(
@@ -301,8 +365,10 @@ class NativeClient:
     def close(self):
         """✅ MEJORADO: Cierre robusto y garantizado de recursos"""
         connection_duration = time.time() - self.connection_time
+        counters = self.counters.snapshot()
         logger.info(f"🔌 {self.id[:15]} - Duración: {connection_duration:.1f}s, "
-                   f"Enviados: {self.packets_sent}, Perdidos: {self.packets_dropped}, "
+                   f"Enviados: {counters['packets_sent']}, Perdidos: {counters['packets_dropped']}, "
+                   f"Bytes: {counters['bytes_sent']}, "
                    f"Reconexiones: {self.reconnection_count}")
         self.status = 0
         
@@ -335,17 +401,23 @@ class NativeAudioServer:
         self.accept_thread = None
         self.maintenance_thread = None
         
-        self.persistent_state = defaultdict(dict)
         self.persistent_lock = threading.Lock()
         self.STATE_CACHE_TIMEOUT = getattr(config, 'RF_STATE_CACHE_TIMEOUT', 300)
-        self.MAX_PERSISTENT_STATES = 50
+        self.MAX_PERSISTENT_STATES = getattr(config, 'RF_MAX_PERSISTENT_STATES', 50)
+        # ✅ OPTIMIZACIÓN: TTL/LRU con heap (sin ordenar todos los estados en cada pasada)
+        self.persistent_state = TTLCache(ttl=self.STATE_CACHE_TIMEOUT, max_entries=self.MAX_PERSISTENT_STATES)
         
         # ✅ NUEVO: Referencia a websocket_server para broadcasts
         self.websocket_server_ref = None  # Asignado dinámicamente en runtime
         
         # ✅ NUEVO: Persistencia en disco
         self.STATE_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', 'client_states.json')
+        # ✅ NUEVO: Snapshot + journal write-behind (sin reescribir el JSON por cada cambio)
+        self.state_journal = StateJournal(self.STATE_FILE, service=get_persistence_service())
         self._load_persistent_states_from_disk()
+        self.state_journal.start()
+        # ✅ NUEVO: update_mix de Android se persiste y se devuelve agrupado por ventana
+        get_optimizer().add_flush_handler(self._flush_native_mix)
         
         self.sample_position_lock = threading.Lock()
         self.sample_position = 0
@@ -356,21 +428,33 @@ class NativeAudioServer:
         self._packet_cache = {}  # {frozenset(channels): (packet_bytes, sample_position)}
         self._cache_lock = threading.Lock()
         
-        self.stats = {
-            'packets_sent': 0,
-            'packets_dropped': 0,
-            'clients_connected': 0,
-            'clients_disconnected': 0,
-            'clients_reconnected': 0,
-            'clients_zombie_killed': 0,
-            'cache_hits': 0,  # ✅ FASE 2: Estadísticas de cache
-            'cache_misses': 0,
-            'bytes_sent': 0,
-            'uptime': 0,
-            'cached_states': 0
-        }
+        # ✅ NUEVO: Audio UDP unicast (socket único, creado en start())
+        self.udp_sender = None
+        self._udp_cache = {}  # {(frozenset(channels), factor): [datagram_templates]}
+        
+        # ✅ NUEVO: Decimadores por grupo de canales (solo hilo de captura)
+        self._decimators = DecimatorBank()
+        
+        # ✅ OPTIMIZACIÓN: Contadores por hilo sin lock; se suman solo en get_stats()
+        self.counters = ShardedCounters((
+            'packets_sent',
+            'packets_dropped',
+            'clients_connected',
+            'clients_disconnected',
+            'clients_reconnected',
+            'clients_zombie_killed',
+            'cache_hits',  # ✅ FASE 2: Estadísticas de cache
+            'cache_misses',
+            'bytes_sent',
+            'udp_datagrams_sent',
+            'udp_datagrams_dropped',
+            'fec_packets_sent',
+            'shard_blocks_dropped',
+            'congestion_steps_down',
+            'congestion_steps_up'
+        ))
+        self._block_counter = 0
         self.start_time = time.time()
-        self.stats_lock = threading.Lock()
         
         # ✅ OPTIMIZACIÓN: ThreadPoolExecutor para envío paralelo de audio a múltiples clientes
         # Con 10 clientes, usar 4-6 hilos evita saturación del hilo de captura
@@ -380,6 +464,27 @@ class NativeAudioServer:
             thread_name_prefix='audio-send-'
         )
         logger.info(f"[NativeServer] ✅ ThreadPoolExecutor para envío: {max_workers} workers")
+        
+        # ✅ NUEVO: Fan-out por shards (hilos persistentes, creados en start())
+        self.send_shards = None
+        
+        # ✅ NUEVO: Workers de control (creados en start()); el hilo de lectura solo encola
+        self.control_dispatcher = None
+        self._first_audio_ms = deque(maxlen=64)
+        self._first_audio_count = 0
+        
+        # ✅ NUEVO: Fuente del instante ADC por bloque (AudioCapture.current_block_adc_ns)
+        self.clock_source = None
+        
+        # ✅ NUEVO: Invalidación incremental: solo el cliente cuya ruta cambió
+        if hasattr(channel_manager, 'add_event_listener'):
+            channel_manager.add_event_listener(
+                self._on_subscription_event, kinds=(CLIENT_REMOVED, CHANNELS_CHANGED)
+            )
+    
+    def set_clock_source(self, source):
+        """✅ NUEVO: Objeto con `current_block_adc_ns` (AudioCapture) para sellar paquetes"""
+        self.clock_source = source
     
     def set_physical_channels(self, num_channels: int):
         """✅ NUEVO: Establecer número de canales reales del dispositivo"""
@@ -389,19 +494,16 @@ class NativeAudioServer:
     def _load_persistent_states_from_disk(self):
         """✅ NUEVO: Cargar estado de clientes guardado en disco"""
         try:
-            os.makedirs(os.path.dirname(self.STATE_FILE) or '.', exist_ok=True)
-            
-            if not os.path.exists(self.STATE_FILE):
-                logger.info(f"[NativeServer] 📁 Archivo de estados no existe: {self.STATE_FILE}")
+            # ✅ Snapshot + replay del journal
+            data = self.state_journal.load()
+            if not data:
+                logger.info(f"[NativeServer] 📁 Sin estados guardados: {self.STATE_FILE}")
                 return
             
-            with open(self.STATE_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f) or {}
-            
             with self.persistent_lock:
                 for device_uuid, state in data.items():
                     if isinstance(state, dict):
-                        self.persistent_state[device_uuid] = state
+                        self.persistent_state.set(device_uuid, state, stamp=state.get('last_seen', 0))
             
             count = len(self.persistent_state)
             logger.info(f"[NativeServer] ✅ Estados de clientes cargados: {count} dispositivos")
@@ -410,20 +512,11 @@ class NativeAudioServer:
             logger.warning(f"[NativeServer] ⚠️ Error cargando estados: {e}")
     
     def _save_persistent_states_to_disk(self):
-        """✅ NUEVO: Guardar estado de clientes en disco (thread-safe)"""
+        """✅ Volcar journal y compactar a snapshot con el estado completo (apagado)"""
         try:
-            os.makedirs(os.path.dirname(self.STATE_FILE) or '.', exist_ok=True)
-            
             with self.persistent_lock:
                 data = dict(self.persistent_state)
-            
-            # Escribir a archivo temporal para evitar corrupción
-            tmp_path = self.STATE_FILE + '.tmp'
-            with open(tmp_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            
-            # Renombrar atómicamente
-            os.replace(tmp_path, self.STATE_FILE)
+            self.state_journal.close(final_state=data)
             
             if config.DEBUG:
                 logger.debug(f"[NativeServer] 💾 Estados guardados: {len(data)} dispositivos")
@@ -431,34 +524,72 @@ class NativeAudioServer:
         except Exception as e:
             logger.error(f"[NativeServer] ❌ Error guardando estados: {e}")
     
-    def _notify_web_clients_update(self):
+    def _notify_web_clients_update(self, client_id: str = None):
         """✅ Notificar a clientes web sobre cambios de estado (sincronización Android→Web)"""
         try:
             if self.websocket_server_ref and hasattr(self.websocket_server_ref, 'broadcast_clients_update'):
-                self.websocket_server_ref.broadcast_clients_update()
+                self.websocket_server_ref.broadcast_clients_update(
+                    [client_id] if client_id is not None else None
+                )
                 if config.DEBUG:
                     logger.debug("[NativeServer] 📡 Notificación enviada a clientes web")
         except Exception as e:
             if config.DEBUG:
                 logger.debug(f"[NativeServer] ⚠️ Error notificando a web: {e}")
 
-    def _emit_param_sync_to_web(self, client_id: str, param_type: str, channel: int, value):
-        """✅ NUEVO: Emitir cambio específico a web para sincronización instantánea"""
+    def _flush_native_mix(self, persistent_id: str, updates: dict):
+        """✅ NUEVO: Salida agrupada de update_mix de Android (hilo del LatencyOptimizer)"""
+        if 'android' not in updates['sources']:
+            return
+        
+        # ✅ Guardar estado en persistent_state del servidor (para GET_CLIENT_STATE)
+        try:
+            subscription = self.channel_manager.get_client_subscription(persistent_id)
+            if subscription:
+                with self.persistent_lock:
+                    state = {
+                        'channels': subscription.get('channels', []),
+                        'gains': subscription.get('gains', {}),
+                        'pans': subscription.get('pans', {}),
+                        'mutes': subscription.get('mutes', {}),
+                        'master_gain': subscription.get('master_gain', 1.0),
+                        'mix_mode': subscription.get('mix_mode', 'channels'),
+                        'timestamp': int(time.time() * 1000)
+                    }
+                    self.persistent_state[persistent_id] = state
+                logger.debug(f"💾 Estado persistente guardado para {persistent_id[:15]}")
+
+                # ✅ Registro en el journal (write-behind, sin E/S en este hilo)
+                self.state_journal.record(persistent_id, state)
+        except Exception as e:
+            if config.DEBUG:
+                logger.debug(f"Error guardando estado persistente: {e}")
+
+        # ✅ Persistir también en device_registry para durabilidad multi-sesión
         try:
-            if self.websocket_server_ref and hasattr(self.websocket_server_ref, 'socketio'):
-                self.websocket_server_ref.socketio.emit('param_sync', {
-                    'type': param_type,
-                    'channel': channel,
-                    'value': value,
-                    'client_id': client_id,
-                    'source': 'android',
+            subscription = self.channel_manager.get_client_subscription(persistent_id)
+            device_uuid = None
+            if subscription:
+                device_uuid = subscription.get('device_uuid') or persistent_id
+
+            if device_uuid and getattr(self.channel_manager, 'device_registry', None):
+                config_to_save = {
+                    'channels': subscription.get('channels', []) if subscription else [],
+                    'gains': subscription.get('gains', {}) if subscription else {},
+                    'pans': subscription.get('pans', {}) if subscription else {},
+                    'mutes': subscription.get('mutes', {}) if subscription else {},
+                    'master_gain': subscription.get('master_gain', 1.0) if subscription else 1.0,
+                    'mix_mode': subscription.get('mix_mode', 'channels') if subscription else 'channels',
                     'timestamp': int(time.time() * 1000)
-                })
-                if config.DEBUG:
-                    logger.debug(f"[NativeServer] ⚡ param_sync emitido: {param_type} ch{channel}={value}")
+                }
+                self.channel_manager.device_registry.update_configuration(device_uuid, config_to_save)
         except Exception as e:
             if config.DEBUG:
-                logger.debug(f"[NativeServer] ⚠️ Error emitiendo param_sync: {e}")
+                logger.debug(f"DeviceRegistry update (native update_mix) failed: {e}")
+        
+        # Devolver el estado final al propio Android (un mix_state por ventana)
+        if self.push_mix_state_to_client(persistent_id):
+            get_optimizer().record_output('mix_state')
     
     def start(self):
         if self.running: 
@@ -474,6 +605,32 @@ class NativeAudioServer:
         self.server_socket.bind((config.NATIVE_HOST, config.NATIVE_PORT))
         self.server_socket.listen(config.NATIVE_MAX_CLIENTS)
         self.server_socket.setblocking(False)
+        
+        # ✅ NUEVO: Socket UDP para audio (control sigue en TCP)
+        if getattr(config, 'NATIVE_UDP_ENABLED', False):
+            try:
+                self.udp_sender = UdpAudioSender.create(config.NATIVE_HOST, config.NATIVE_UDP_PORT)
+            except Exception as e:
+                logger.error(f"[NativeServer] ❌ No se pudo abrir socket UDP: {e}")
+                self.udp_sender = None
+        
+        # ✅ NUEVO: Shards de envío para clientes TCP
+        if getattr(config, 'NATIVE_SHARDED_FANOUT', False):
+            self.send_shards = ShardedSender(
+                min(10, max(1, getattr(config, 'AUDIO_SEND_POOL_SIZE', 6))),
+                getattr(config, 'NATIVE_SHARD_QUEUE_DEPTH', 4),
+                on_block_done=self._on_shard_block_done
+            )
+            self.send_shards.start()
+        
+        # ✅ NUEVO: Mensajes de control fuera del hilo de lectura de cada cliente
+        self.control_dispatcher = ControlDispatcher(
+            getattr(config, 'NATIVE_CONTROL_WORKERS', 4),
+            getattr(config, 'NATIVE_CONTROL_QUEUE_DEPTH', 64),
+            self._dispatch_control_message
+        )
+        self.control_dispatcher.start()
+        
         self.running = True
         
         self.accept_thread = threading.Thread(target=self._accept_loop, daemon=True)
@@ -492,6 +649,8 @@ class NativeAudioServer:
         logger.info(f"   🔄 Auto-reconexión: ENABLED")
         logger.info(f"   💾 Estado cache: {self.STATE_CACHE_TIMEOUT}s (Max: {self.MAX_PERSISTENT_STATES})")
         logger.info(f"   ✅ Zombie detection: ENABLED")
+        logger.info(f"   📡 Audio UDP: {'ENABLED :' + str(config.NATIVE_UDP_PORT) if self.udp_sender else 'DISABLED'}")
+        logger.info(f"   🧵 Fan-out: {str(len(self.send_shards.shards)) + ' shards' if self.send_shards else 'serie'}")
         logger.info(f"{'='*70}\n")
     
     def _maintenance_loop(self):
@@ -502,28 +661,14 @@ class NativeAudioServer:
             try:
                 current_time = time.time()
                 
-                # ✅ 1. Limpiar estado persistente expirado (si timeout > 0)
+                # ✅ 1-2. Estados expirados (si timeout > 0) y exceso sobre el límite (los más antiguos)
                 with self.persistent_lock:
-                    if self.STATE_CACHE_TIMEOUT and self.STATE_CACHE_TIMEOUT > 0:
-                        expired = [
-                            pid for pid, state in self.persistent_state.items()
-                            if current_time - state.get('last_seen', 0) > self.STATE_CACHE_TIMEOUT
-                        ]
-                        for pid in expired:
+                    for pid, _, reason in self.persistent_state.expire(current_time):
+                        if reason == 'expired':
                             logger.info(f"🗑️ Limpiando estado expirado: {pid[:15]}")
-                            del self.persistent_state[pid]
-                    
-                    # ✅ 2. Limitar cantidad de estados guardados
-                    if len(self.persistent_state) > self.MAX_PERSISTENT_STATES:
-                        # Eliminar los más antiguos
-                        sorted_states = sorted(
-                            self.persistent_state.items(),
-                            key=lambda x: x[1].get('last_seen', 0)
-                        )
-                        to_remove = len(self.persistent_state) - self.MAX_PERSISTENT_STATES
-                        for pid, _ in sorted_states[:to_remove]:
+                        else:
                             logger.info(f"🗑️ Limpiando estado por límite: {pid[:15]}")
-                            del self.persistent_state[pid]
+                        self.state_journal.delete(pid)
                 
                 # ✅ 3. Verificar y eliminar clientes zombies
                 with self.client_lock:
@@ -534,7 +679,7 @@ class NativeAudioServer:
                         if not client.is_alive(timeout=1.0):  # ⬇️ REDUCIDO de 30s a 1s
                             logger.warning(f"💀 Cliente zombie detectado: {client_id[:15]}")
                             clients_to_remove.append(client_id)
-                            self.stats['clients_zombie_killed'] += 1
+                            self.update_stats(clients_zombie_killed=1)
                     
                     # ✅ Eliminar zombies
                     for client_id in clients_to_remove:
@@ -542,14 +687,21 @@ class NativeAudioServer:
                         preserve = client.auto_reconnect if client else False
                         self._disconnect_client(client_id, preserve_state=preserve)
                 
-                # ✅ 4. Actualizar estadísticas
-                with self.stats_lock:
-                    self.stats['uptime'] = int(time.time() - self.start_time)
-                    self.stats['cached_states'] = len(self.persistent_state)
-                
-                # ✅ 5. Log periódico
+                # ✅ 4. Log periódico (uptime y cached_states se calculan en get_stats)
                 active_clients = len([c for c in self.clients.values() if c.status == 1])
-                logger.info(f"📊 Clientes activos: {active_clients}, Zombies eliminados: {self.stats['clients_zombie_killed']}")
+                logger.info(f"📊 Clientes activos: {active_clients}, Zombies eliminados: {self.counters.value('clients_zombie_killed')}")
+                
+                # ✅ 5. Lag de shards (máximo de la ventana de 10s)
+                if self.send_shards:
+                    lag_warn = getattr(config, 'NATIVE_SHARD_LAG_WARN_MS', 5.0)
+                    for shard_stats in self.send_shards.get_stats():
+                        if shard_stats['max_lag_ms'] > lag_warn or shard_stats['backlog'] > 1:
+                            logger.warning(f"🧵 Shard {shard_stats['shard']} atrasado: "
+                                         f"lag máx {shard_stats['max_lag_ms']:.2f}ms, "
+                                         f"backlog {shard_stats['backlog']}, "
+                                         f"bloques descartados {shard_stats['blocks_dropped']}")
+                    for shard in self.send_shards.shards:
+                        shard.reset_max_lag()
                     
             except Exception as e:
                 if config.DEBUG:
@@ -561,10 +713,25 @@ class NativeAudioServer:
         # ✅ NUEVO: Detener ThreadPoolExecutor
         logger.info("[NativeServer] 🛑 Deteniendo ThreadPoolExecutor...")
         self.audio_send_pool.shutdown(wait=True)
+        if self.send_shards:
+            self.send_shards.stop()
+            self.send_shards = None
+        if self.control_dispatcher:
+            self.control_dispatcher.stop()
+            self.control_dispatcher = None
+        
+        # ✅ NUEVO: Volcar las ventanas de update_mix pendientes mientras el journal sigue abierto
+        # y dejar de recibir flushes (un servidor nuevo registra su propio handler)
+        optimizer = get_optimizer()
+        optimizer.flush_all(source='android')
+        optimizer.remove_flush_handler(self._flush_native_mix)
         
         # ✅ NUEVO: Guardar estado antes de apagar
         logger.info(f"[NativeServer] 💾 Guardando estado de clientes antes de apagar...")
         self._save_persistent_states_to_disk()
+        device_registry = getattr(self.channel_manager, 'device_registry', None)
+        if device_registry and hasattr(device_registry, 'flush'):
+            device_registry.flush()
         
         with self.client_lock:
             for client in list(self.clients.values()):
@@ -572,6 +739,9 @@ class NativeAudioServer:
             self.clients.clear()
         if self.server_socket:
             self.server_socket.close()
+        if self.udp_sender:
+            self.udp_sender.close()
+            self.udp_sender = None
         
         if getattr(self.channel_manager, 'native_server', None) is self:
             self.channel_manager.native_server = None
@@ -595,7 +765,7 @@ class NativeAudioServer:
                 client = NativeClient(temp_id, client_socket, address)
                 with self.client_lock:
                     self.clients[temp_id] = client
-                    self.stats['clients_connected'] += 1
+                self.update_stats(clients_connected=1)
                 logger.info(f"✅ Cliente RF: {temp_id[:15]} ({address[0]})")
                 threading.Thread(target=self._client_read_loop, args=(temp_id,), daemon=True).start()
                 
@@ -661,7 +831,13 @@ class NativeAudioServer:
                 if msgType == NativeAndroidProtocol.MSG_TYPE_CONTROL:
                     try:
                         message = json.loads(payload.decode('utf-8'))
-                        self._handle_control_message(client, message)
+                        # ✅ NUEVO: Solo encolar; el worker del cliente lo procesa en orden
+                        dispatcher = self.control_dispatcher
+                        if dispatcher:
+                            if not dispatcher.submit(client, message) and config.DEBUG:
+                                logger.warning(f"⚠️ Control descartado ({message.get('type')}) - {client_id[:15]}")
+                        else:
+                            self._handle_control_message(client, message)
                     except Exception as e:
                         if config.DEBUG:
                             logger.error(f"❌ Control: {e}")
@@ -762,6 +938,12 @@ class NativeAudioServer:
         
         return data if len(data) == size else None
     
+    def _dispatch_control_message(self, client: NativeClient, message: dict):
+        """✅ NUEVO: Entrada desde ControlDispatcher (ignora conexiones ya cerradas)"""
+        if client.status == 0:
+            return
+        self._handle_control_message(client, message)
+    
     def _handle_control_message(self, client: NativeClient, message: dict):
         msg_type = message.get('type', '')
 
@@ -879,6 +1061,51 @@ class NativeAudioServer:
             client.persistent = message.get('persistent', False)
             client.auto_reconnect = message.get('auto_reconnect', False)
 
+            # ✅ NUEVO: Audio por UDP si el cliente lo pide y el servidor lo tiene habilitado
+            client.udp_addr = None
+            udp_port = message.get('udp_port')
+            if self.udp_sender and message.get('audio_transport') == 'udp' and udp_port:
+                try:
+                    udp_port = int(udp_port)
+                    if 0 < udp_port < 65536:
+                        client.udp_addr = (client.address[0], udp_port)
+                        client.udp_sequence = 0
+                        logger.info(f"[NativeServer] 📡 {client.id[:15]} audio UDP -> {client.udp_addr[0]}:{udp_port}")
+                except (ValueError, TypeError):
+                    pass
+
+            # ✅ NUEVO: FEC XOR solo sobre UDP y solo si el cliente sabe decodificarlo
+            client.fec_encoder = None
+            if client.udp_addr and message.get('fec') and getattr(config, 'NATIVE_FEC_ENABLED', False):
+                client.fec_encoder = FecEncoder(getattr(config, 'NATIVE_FEC_GROUP_SIZE', 8), client.rf_mode)
+                logger.info(f"[NativeServer] 🛡️ {client.id[:15]} FEC XOR k={client.fec_encoder.k} "
+                           f"(overhead {client.fec_encoder.overhead * 100:.1f}%)")
+
+            # ✅ NUEVO: Sample rate reducido si el cliente lo pide (24k / 16k)
+            client.resample_factor = 1
+            if message.get('sample_rate') and getattr(config, 'NATIVE_RESAMPLE_ENABLED', True):
+                factor = output_rate_factor(message.get('sample_rate'), config.SAMPLE_RATE)
+                if factor > 1:
+                    try:
+                        design_decimation_filter(factor)
+                        client.resample_factor = factor
+                        logger.info(f"[NativeServer] 🎚️ {client.id[:15]} sample rate "
+                                   f"{config.SAMPLE_RATE // factor} Hz (÷{factor})")
+                    except Exception as e:
+                        logger.warning(f"[NativeServer] ⚠️ Decimador no disponible: {e}")
+
+            # ✅ NUEVO: Mezcla personal en servidor si el cliente la soporta
+            client.supports_mixdown = 'stereo' in (message.get('mix_modes') or [])
+
+            # ✅ NUEVO: Control de congestión para audio TCP
+            client.congestion = None
+            client.batch_pending = None
+            if not client.udp_addr and getattr(config, 'NATIVE_CONGESTION_CONTROL', True):
+                encodings = message.get('encodings') or []
+                start_level = 1 if getattr(config, 'USE_INT16_ENCODING', True) else 0
+                max_level = len(LADDER) - 1 if NativeAndroidProtocol.ENCODING_INT16_ZLIB in encodings else 1
+                client.congestion = CongestionController(client.sndbuf, start_level, max_level)
+
             logger.info(f"🤝 {client.id[:15]} - HANDSHAKE: "
                        f"reconnection={is_reconnection}, "
                        f"auto_reconnect={client.auto_reconnect}")
@@ -890,7 +1117,8 @@ class NativeAudioServer:
                     if persistent_id in self.persistent_state:
                         restored_state = self.persistent_state[persistent_id]
                         logger.info(f"💾 Estado restaurado para: {persistent_id[:15]}")
-                        self.persistent_state[persistent_id]['last_seen'] = time.time()
+                        restored_state['last_seen'] = time.time()
+                        self.persistent_state.touch(persistent_id, restored_state['last_seen'])
 
             # ✅ MEJORADO: restaurar desde DeviceRegistry SIN restricción de session_id (persistencia permanente)
             if restored_state is None and getattr(self.channel_manager, 'device_registry', None):
@@ -905,7 +1133,7 @@ class NativeAudioServer:
 
             if restored_state is not None and is_reconnection:
                 client.reconnection_count = restored_state.get('reconnection_count', 0) + 1
-                self.stats['clients_reconnected'] += 1
+                self.update_stats(clients_reconnected=1)
 
             # Registrar en channel_manager
             channels_to_subscribe = []
@@ -929,6 +1157,8 @@ class NativeAudioServer:
                     mutes=restored_state.get('mutes', {}),
                     master_gain=restored_state.get('master_gain', 1.0)
                 )
+                if restored_state.get('mix_mode') and client.supports_mixdown:
+                    self.channel_manager.set_client_mix_mode(persistent_id, restored_state['mix_mode'])
 
             # Enviar respuesta
             response = NativeAndroidProtocol.create_control_packet(
@@ -936,7 +1166,8 @@ class NativeAudioServer:
                 {
                     'server_version': '2.5.0-RF-FIXED',
                     'protocol_version': NativeAndroidProtocol.PROTOCOL_VERSION,
-                    'sample_rate': config.SAMPLE_RATE,
+                    'sample_rate': config.SAMPLE_RATE // client.resample_factor,
+                    'source_sample_rate': config.SAMPLE_RATE,
                     'max_channels': self.channel_manager.num_channels,
                     'status': 'ready_rf',
                     'rf_mode': client.rf_mode,
@@ -947,7 +1178,30 @@ class NativeAudioServer:
                     'web_controlled': True,
                     'state_restored': restored_state is not None,
                     'persistent_id': persistent_id,
-                    'is_reconnection': is_reconnection
+                    'is_reconnection': is_reconnection,
+                    'audio_transport': 'udp' if client.udp_addr else 'tcp',
+                    'udp_audio': {
+                        'enabled': self.udp_sender is not None,
+                        'port': config.NATIVE_UDP_PORT,
+                        'max_datagram': getattr(config, 'NATIVE_UDP_MAX_DATAGRAM', 1200)
+                    },
+                    'fec': {
+                        'scheme': 'xor',
+                        'k': client.fec_encoder.k,
+                        'overhead': client.fec_encoder.overhead
+                    } if client.fec_encoder else None,
+                    'mix_mode': (self.channel_manager.get_client_subscription(persistent_id) or {}).get('mix_mode', 'channels'),
+                    'mixdown_supported': client.supports_mixdown,
+                    'clock': {
+                        'source': 'monotonic',
+                        'server_time_ms': NativeAndroidProtocol.monotonic_ms(),
+                        'audio_timestamp': 'adc',  # Header de audio = instante ADC (ms, 32 bits)
+                        'rtt_probe': True
+                    },
+                    'congestion_control': {
+                        'ladder': list(LADDER[client.congestion.min_level:client.congestion.max_level + 1]),
+                        'encoding': client.congestion.encoding
+                    } if client.congestion else None
                 },
                 client.rf_mode
             )
@@ -955,6 +1209,11 @@ class NativeAudioServer:
             if response:
                 # ✅ FASE 2: Handshake siempre síncrono
                 client.send_bytes_sync(response)
+            
+            # ✅ NUEVO: Empezar a medir handshake → primer audio
+            client.handshake_completed_at = time.perf_counter()
+            client.first_audio_ms = None
+            client.awaiting_first_audio = True
 
             # ✅ NUEVO: Enviar estado completo de mezcla para que el Android aplique
             try:
@@ -965,31 +1224,42 @@ class NativeAudioServer:
                 if config.DEBUG:
                     logger.debug(f"mix_state send failed: {e}")
             
-            self._notify_web_clients_update()
+            self._notify_web_clients_update(persistent_id)
         
         elif msg_type == 'heartbeat':
             # ✅ FIX: Responder heartbeat INMEDIATAMENTE con retry logic
+            # ✅ NUEVO: Sonda RTT. El cliente devuelve en su próximo heartbeat el
+            # server_time_ms recibido (echo_server_time_ms) y cuánto lo retuvo (echo_hold_ms)
+            now_ms = NativeAndroidProtocol.monotonic_ms()
+            echo = message.get('echo_server_time_ms')
+            if echo is not None:
+                try:
+                    rtt_ms = now_ms - int(echo) - float(message.get('echo_hold_ms', 0) or 0)
+                    if 0 <= rtt_ms < 60000:
+                        client.rtt.add(rtt_ms)
+                        client.last_rtt_ms = rtt_ms
+                except (ValueError, TypeError):
+                    pass
+            
             response = NativeAndroidProtocol.create_control_packet(
                 'heartbeat_response',
                 {
                     'timestamp': int(time.time() * 1000),
+                    'server_time_ms': now_ms,
+                    'echo_timestamp': message.get('timestamp'),
+                    'rtt_ms': round(client.last_rtt_ms, 2) if client.last_rtt_ms is not None else None,
                     'clients_connected': len(self.clients)
                 },
                 client.rf_mode
             )
             if response:
-                # ✅ FIX: Intentar envío sync CON REINTENTOS
-                max_attempts = 3
-                for attempt in range(max_attempts):
-                    if client.send_bytes_sync(response):
-                        if config.DEBUG:
-                            logger.debug(f"💓 Heartbeat response enviado a {client.id[:15]}")
-                        break
-                    else:
-                        if attempt < max_attempts - 1:
-                            time.sleep(0.05)  # Esperar 50ms antes de reintentar
-                        else:
-                            logger.warning(f"⚠️ No se pudo enviar heartbeat response a {client.id[:15]}")
+                # ✅ Un solo intento: sin sleeps que retengan al worker (el siguiente
+                # heartbeat del cliente hace de reintento)
+                if client.send_bytes_sync(response):
+                    if config.DEBUG:
+                        logger.debug(f"💓 Heartbeat response enviado a {client.id[:15]}")
+                else:
+                    logger.warning(f"⚠️ No se pudo enviar heartbeat response a {client.id[:15]}")
 
         elif msg_type == 'update_mix':
             # ✅ Permitir que el cliente Android controle su propia mezcla (ON/gain/pan)
@@ -1025,84 +1295,38 @@ class NativeAudioServer:
                     channels=channels,
                     gains=gains_int,
                     pans=pans_int,
+                    publish=False,   # Persistencia y mix_updated en el flush
                 )
 
                 if ok:
-                    # ✅ SINCRONIZACIÓN INSTANTÁNEA A WEB: Emitir cambios específicos
+                    # ✅ NUEVO: param_sync, persistencia, broadcast y eco al propio Android
+                    # agrupados por ventana (ChannelManager ya tiene el cambio)
+                    optimizer = get_optimizer()
                     new_subscription = self.channel_manager.get_client_subscription(persistent_id)
                     if new_subscription:
                         new_channels = set(new_subscription.get('channels', []))
-                        new_gains = new_subscription.get('gains', {})
-                        new_pans = new_subscription.get('pans', {})
                         
-                        # Emitir cambios de canales
+                        # Cambios de canales
                         for ch in new_channels - prev_channels:
-                            self._emit_param_sync_to_web(persistent_id, 'channel_toggle', ch, True)
+                            optimizer.queue_parameter_update(persistent_id, 'channel_toggle', ch, True, source='android')
                         for ch in prev_channels - new_channels:
-                            self._emit_param_sync_to_web(persistent_id, 'channel_toggle', ch, False)
+                            optimizer.queue_parameter_update(persistent_id, 'channel_toggle', ch, False, source='android')
                         
-                        # Emitir cambios de gains
+                        # Cambios de gains
                         if gains_int:
                             for ch, val in gains_int.items():
                                 if prev_gains.get(ch) != val:
-                                    self._emit_param_sync_to_web(persistent_id, 'gain', ch, val)
+                                    optimizer.queue_parameter_update(persistent_id, 'gain', ch, val, source='android')
                         
-                        # Emitir cambios de pans
+                        # Cambios de pans
                         if pans_int:
                             for ch, val in pans_int.items():
                                 if prev_pans.get(ch) != val:
-                                    self._emit_param_sync_to_web(persistent_id, 'pan', ch, val)
+                                    optimizer.queue_parameter_update(persistent_id, 'pan', ch, val, source='android')
                     
-                    # ✅ Guardar estado en persistent_state del servidor (para GET_CLIENT_STATE)
-                    try:
-                        subscription = self.channel_manager.get_client_subscription(persistent_id)
-                        if subscription:
-                            with self.persistent_lock:
-                                self.persistent_state[persistent_id] = {
-                                    'channels': subscription.get('channels', []),
-                                    'gains': subscription.get('gains', {}),
-                                    'pans': subscription.get('pans', {}),
-                                    'mutes': subscription.get('mutes', {}),
-                                    'master_gain': subscription.get('master_gain', 1.0),
-                                    'timestamp': int(time.time() * 1000)
-                                }
-                            logger.debug(f"💾 Estado persistente guardado para {persistent_id[:15]}")
-                            
-                            # ✅ NUEVO: Guardar en disco para durabilidad después de reinicios
-                            self._save_persistent_states_to_disk()
-                    except Exception as e:
-                        if config.DEBUG:
-                            logger.debug(f"Error guardando estado persistente: {e}")
-
-                    # ✅ Persistir también en device_registry para durabilidad multi-sesión
-                    try:
-                        subscription = self.channel_manager.get_client_subscription(persistent_id)
-                        device_uuid = None
-                        if subscription:
-                            device_uuid = subscription.get('device_uuid') or persistent_id
-
-                        if device_uuid and getattr(self.channel_manager, 'device_registry', None):
-                            config_to_save = {
-                                'channels': subscription.get('channels', []) if subscription else [],
-                                'gains': subscription.get('gains', {}) if subscription else {},
-                                'pans': subscription.get('pans', {}) if subscription else {},
-                                'mutes': subscription.get('mutes', {}) if subscription else {},
-                                'master_gain': subscription.get('master_gain', 1.0) if subscription else 1.0,
-                                'timestamp': int(time.time() * 1000)
-                            }
-                            self.channel_manager.device_registry.update_configuration(device_uuid, config_to_save)
-                    except Exception as e:
-                        if config.DEBUG:
-                            logger.debug(f"DeviceRegistry update (native update_mix) failed: {e}")
-
-                    # refrescar web (broadcast completo) y devolver estado al propio Android
-                    self._notify_web_clients_update()
-                    try:
-                        subscription = self.channel_manager.get_client_subscription(persistent_id)
-                        if subscription:
-                            client.send_mix_state(subscription)
-                    except Exception:
-                        pass
+                    # Marcador de mezcla: el eco y la persistencia salen una vez por ventana
+                    # aunque el mensaje no cambiara nada (p. ej. reintento con el mismo estado)
+                    optimizer.queue_parameter_update(persistent_id, 'mix', -1, None, source='android')
             except Exception as e:
                 if config.DEBUG:
                     logger.error(f"❌ update_mix error: {e}")
@@ -1132,6 +1356,7 @@ class NativeAudioServer:
                             'pans': {str(k): v for k, v in saved_state.get('pans', {}).items()},
                             'mutes': {str(k): v for k, v in saved_state.get('mutes', {}).items()},
                             'master_gain': saved_state.get('master_gain', 1.0),
+                            'mix_mode': saved_state.get('mix_mode', 'channels'),
                         },
                         client.rf_mode,
                     )
@@ -1162,7 +1387,8 @@ class NativeAudioServer:
     
         try:
             from audio_server import websocket_server
-            websocket_server.broadcast_clients_update()
+            # ✅ Solo este cliente: el resto de la lista no cambió por su mensaje
+            websocket_server.broadcast_clients_update([getattr(client, 'persistent_id', None) or client.id])
         except Exception as e:
             if config.DEBUG:
                 logger.error(f"Error notificando web: {e}")
@@ -1291,22 +1517,46 @@ class NativeAudioServer:
         samples = audio_data.shape[0]
         current_position = self.increment_sample_position(samples)
         
-        # ✅ FASE 2: Tomar snapshot de clientes con lock mínimo
+        # ✅ NUEVO: Instante ADC del bloque (reloj monótono) -> timestamp de todos sus paquetes
+        adc_ns = getattr(self.clock_source, 'current_block_adc_ns', None) if self.clock_source else None
+        if adc_ns is None:
+            adc_ns = time.monotonic_ns()
+        header_timestamp = NativeAndroidProtocol.timestamp_from_ns(adc_ns)
+        self._block_counter += 1
+        sample_congestion = self._block_counter % getattr(config, 'NATIVE_CONGESTION_SAMPLE_BLOCKS', 32) == 0
+        
+        # ✅ NUEVO: Tabla de rutas inmutable (una carga de atributo, nunca un dict que muta)
+        routing = self.channel_manager.routing
+        
+        # ✅ FASE 2: Solo clientes conectados CON canales, con lock mínimo
         with self.client_lock:
-            active_clients = [
-                (client_id, client, self.channel_manager.get_client_subscription(client_id))
-                for client_id, client in self.clients.items()
-                if client.status == 1
-            ]
+            clients = self.clients
+            active_clients = []
+            for route in routing.active:
+                client = clients.get(route.client_id)
+                if client is not None and client.status == 1:
+                    active_clients.append((route.client_id, client, route))
         
         if not active_clients:
             return
         
         # ✅ FASE 2: Limpiar cache del frame anterior
         self._packet_cache.clear()
+        self._udp_cache.clear()
+        udp_sender = self.udp_sender
         
         clients_to_remove = []
         sent = 0
+        sent_bytes = 0
+        dropped = 0
+        cache_hits = 0
+        cache_misses = 0
+        fec_sent = 0
+        steps_down = 0
+        steps_up = 0
+        send_shards = self.send_shards
+        shard_batch = send_shards.new_batch() if send_shards else None
+        udp_clients = []
         
         # ✅ FASE 2: Procesar sin lock global
         for client_id, client, subscription in active_clients:
@@ -1314,22 +1564,79 @@ class NativeAudioServer:
                 clients_to_remove.append(client_id)
                 continue
             
-            if not subscription:
-                continue
+            # Tupla ordenada y sin duplicados (ya validada al publicar la ruta)
+            channels = subscription.channels
+            
+            # ✅ FASE 2: Usar cache de paquetes por grupo de canales
+            channel_key = channels
+            
+            factor = client.resample_factor
             
-            channels = subscription.get('channels', [])
-            if not channels:
-                # ✅ ARREGLO: Asegurar que subscribed_channels es vacío cuando no hay canales
-                client.subscribed_channels = set()
+            # ✅ NUEVO: Mezcla personal estéreo - paquete propio del cliente (sin compartir cache)
+            mixdown = client.supports_mixdown and subscription.mix_mode == 'stereo'
+            if mixdown:
+                channel_key = ('mix', client_id)
+            
+            # ✅ NUEVO: Clientes UDP - plantillas por grupo, secuencia por cliente
+            if client.udp_addr and udp_sender:
+                udp_key = (channel_key, factor)
+                templates = self._udp_cache.get(udp_key)
+                if templates is None:
+                    valid_channels = sorted([ch for ch in channels if ch < audio_data.shape[1]])
+                    templates = []
+                    if valid_channels:
+                        source, source_channels, position, extra_flags = self._block_source(
+                            audio_data, valid_channels, current_position, factor, client_id, subscription, mixdown
+                        )
+                        templates = NativeAndroidProtocol.create_udp_audio_datagrams(
+                            source, source_channels, position, client.rf_mode,
+                            preselected=True, extra_flags=extra_flags, timestamp=header_timestamp
+                        )
+                    self._udp_cache[udp_key] = templates
+                if not templates:
+                    client.subscribed_channels = set()
+                    continue
+                client.subscribed_channels = set(ch for ch in channels if ch < audio_data.shape[1])
+                fec_encoder = client.fec_encoder
+                udp_bytes = 0
+                for template in templates:
+                    sequence = client.next_udp_sequence()
+                    datagram = NativeAndroidProtocol.stamp_udp_sequence(template, sequence)
+                    udp_sender.queue(datagram, client.udp_addr)
+                    udp_bytes += len(datagram)
+                    if fec_encoder:
+                        fec_packet = fec_encoder.add(datagram, sequence)
+                        if fec_packet:
+                            udp_sender.queue(fec_packet, client.udp_addr)
+                            fec_sent += 1
+                client.counters.update(packets_sent=len(templates), bytes_sent=udp_bytes)
+                client.update_activity()
+                udp_clients.append(client)
+                if client.awaiting_first_audio:
+                    self._record_first_audio(client)
                 continue
             
-            # ✅ FASE 2: Usar cache de paquetes por grupo de canales
-            channel_key = frozenset(channels)
+            # ✅ NUEVO: Escalón de codificación del cliente (muestreo cada N bloques)
+            congestion = client.congestion
+            encoding = None
+            if congestion:
+                if sample_congestion:
+                    change = congestion.sample(read_send_queue_bytes(client.socket), client.packets_dropped)
+                    if change:
+                        if change < 0:
+                            steps_down += 1
+                        else:
+                            steps_up += 1
+                        logger.info(f"[NativeServer] 🚦 {client_id[:15]} congestión "
+                                   f"{congestion.transitions[-1]['from']} → {congestion.encoding} "
+                                   f"(cola {congestion.last_occupancy * 100:.0f}%)")
+                encoding = congestion.wire_encoding
+            channel_key = (channel_key, encoding, factor)
             
             cached = self._packet_cache.get(channel_key)
             if cached:
                 packet_bytes = cached
-                self.update_stats(cache_hits=1)
+                cache_hits += 1
             else:
                 # Crear paquete y cachear
                 valid_channels = sorted([ch for ch in channels if ch < audio_data.shape[1]])
@@ -1338,13 +1645,17 @@ class NativeAudioServer:
                     client.subscribed_channels = set()
                     continue
                     
+                source, source_channels, position, extra_flags = self._block_source(
+                    audio_data, valid_channels, current_position, factor, client_id, subscription, mixdown
+                )
                 packet_bytes = NativeAndroidProtocol.create_audio_packet(
-                    audio_data, valid_channels, current_position, 0, client.rf_mode
+                    source, source_channels, position, 0, client.rf_mode, encoding,
+                    preselected=True, extra_flags=extra_flags, timestamp=header_timestamp
                 )
                 
                 if packet_bytes:
                     self._packet_cache[channel_key] = packet_bytes
-                    self.update_stats(cache_misses=1)
+                    cache_misses += 1
                 else:
                     continue
             
@@ -1353,18 +1664,53 @@ class NativeAudioServer:
             valid_subscribed = [ch for ch in channels if ch < audio_data.shape[1]]
             client.subscribed_channels = set(valid_subscribed)
             
+            if client.awaiting_first_audio:
+                self._record_first_audio(client)
+            
+            # ✅ NUEVO: Modo lotes - 2 bloques por send() (menos paquetes en el aire)
+            if congestion:
+                pending = client.batch_pending
+                if pending is not None:
+                    packet_bytes = pending + packet_bytes
+                    client.batch_pending = None
+                elif congestion.batched:
+                    client.batch_pending = packet_bytes
+                    continue
+            
+            # ✅ NUEVO: Con shards solo se reparte la referencia al paquete ya codificado
+            if shard_batch is not None:
+                send_shards.add(shard_batch, client_id, client, packet_bytes)
+                continue
+            
             try:
                 # ✅ OPTIMIZACIÓN: Envío asíncrono (no bloquea hilo de captura)
                 if client.send_bytes_direct(packet_bytes):
                     sent += 1
+                    sent_bytes += len(packet_bytes)
+                    client.record_wire_latency(adc_ns)
                 else:
                     # No desconectar aquí, dejar que is_alive() lo haga por tiempo
-                    self.update_stats(packets_dropped=1)
+                    dropped += 1
             except Exception as e:
                 if config.DEBUG:
                     logger.error(f"❌ Envío {client_id[:15]}: {e}")
                 clients_to_remove.append(client_id)
         
+        self._decimators.end_block()
+        
+        # ✅ NUEVO: Entregar el bloque a los shards (put_nowait, nunca espera)
+        if shard_batch is not None:
+            rejected = send_shards.dispatch(shard_batch, adc_ns)
+            if rejected:
+                self.update_stats(shard_blocks_dropped=rejected)
+        
+        # ✅ NUEVO: Enviar todos los datagramas UDP del bloque en una ráfaga
+        udp_sent = udp_dropped = udp_sent_bytes = 0
+        if udp_sender:
+            udp_sent, udp_dropped, udp_sent_bytes = udp_sender.flush()
+            for client in udp_clients:
+                client.record_wire_latency(adc_ns)
+        
         # ✅ FASE 2: Limpiar clientes muertos con lock
         if clients_to_remove:
             for client_id in clients_to_remove:
@@ -1374,8 +1720,84 @@ class NativeAudioServer:
                     preserve = client.auto_reconnect
                     self._disconnect_client(client_id, preserve_state=preserve)
         
-        if sent > 0:
-            self.update_stats(packets_sent=sent)
+        # ✅ OPTIMIZACIÓN: Un solo update de contadores por bloque
+        self.counters.update(
+            packets_sent=sent, packets_dropped=dropped, bytes_sent=sent_bytes + udp_sent_bytes,
+            cache_hits=cache_hits, cache_misses=cache_misses,
+            congestion_steps_down=steps_down, congestion_steps_up=steps_up,
+            udp_datagrams_sent=udp_sent, udp_datagrams_dropped=udp_dropped, fec_packets_sent=fec_sent
+        )
+    
+    def _on_subscription_event(self, event):
+        """✅ NUEVO: Cliente sin canales (o desuscrito): vaciar su subscribed_channels"""
+        if event.route is not None and event.route.channels:
+            return
+        with self.client_lock:
+            client = self.clients.get(event.client_id)
+        if client is not None and client.subscribed_channels:
+            client.subscribed_channels = set()
+    
+    def _block_source(self, audio_data, valid_channels, position, factor, client_id, subscription, mixdown):
+        """
+        ✅ NUEVO: Audio del bloque listo para empaquetar (columnas ya seleccionadas).
+        
+        Returns:
+            (audio, canales, sample_position, extra_flags)
+        """
+        extra_flags = 0
+        if mixdown:
+            # ✅ Mezcla ya calculada por el motor matricial en este bloque (fallback local)
+            engine = get_mix_engine()
+            source = engine.get_mix(client_id) if engine else None
+            if source is None:
+                source = self._render_mixdown(audio_data, valid_channels, subscription)
+            source_channels = [0, 1]
+            extra_flags = NativeAndroidProtocol.FLAG_MIXDOWN
+            group = ('mix', client_id)
+        else:
+            source = audio_data[:, valid_channels]
+            source_channels = valid_channels
+            group = None
+        
+        if factor > 1:
+            # ✅ Decimado una vez por grupo (o por mezcla personal) y bloque
+            source = self._decimators.process(
+                source, list(range(source.shape[1])), factor, group=group or tuple(valid_channels)
+            )
+            position //= factor
+        return source, source_channels, position, extra_flags
+    
+    @staticmethod
+    def _render_mixdown(audio_data, valid_channels, subscription):
+        """✅ NUEVO: Mezcla estéreo con gains/pans/mutes/master_gain del cliente (pan de potencia constante)"""
+        gains = subscription.get('gains', {})
+        pans = subscription.get('pans', {})
+        mutes = subscription.get('mutes', {})
+        master_gain = subscription.get('master_gain', 1.0)
+        
+        weights = np.zeros((len(valid_channels), 2), dtype=np.float32)
+        for i, ch in enumerate(valid_channels):
+            if mutes.get(ch, False):
+                continue
+            gain = gains.get(ch, 1.0) * master_gain
+            angle = (pans.get(ch, 0.0) + 1.0) * (np.pi / 4)
+            weights[i, 0] = gain * np.cos(angle)
+            weights[i, 1] = gain * np.sin(angle)
+        
+        mix = audio_data[:, valid_channels] @ weights
+        np.clip(mix, -1.0, 1.0, out=mix)
+        return mix
+    
+    def _record_first_audio(self, client: NativeClient):
+        """✅ NUEVO: Primer bloque de audio entregado tras el handshake"""
+        client.awaiting_first_audio = False
+        if client.handshake_completed_at is None:
+            return
+        elapsed_ms = (time.perf_counter() - client.handshake_completed_at) * 1000
+        client.first_audio_ms = elapsed_ms
+        self._first_audio_ms.append(elapsed_ms)
+        self._first_audio_count += 1
+        logger.info(f"[NativeServer] ⏱️ {client.id[:15]} primer audio {elapsed_ms:.1f}ms tras handshake")
     
     def _disconnect_client(self, client_id: str, preserve_state: bool = False):
         # ✅ OPTIMIZACIÓN: Sacar client_lock LO ANTES POSIBLE para no bloquear audio
@@ -1386,6 +1808,9 @@ class NativeAudioServer:
                 return  # Cliente ya estaba desconectado
             self.update_stats(clients_disconnected=1)
         
+        if self.send_shards:
+            self.send_shards.forget(client_id)
+        
         # ✅ Lock liberado AQUÍ - Audio puede fluir normalmente
         
         # Paso 2: Operaciones LENTAS fuera del lock crítico
@@ -1401,13 +1826,16 @@ class NativeAudioServer:
                             'pans': subscription.get('pans', {}),
                             'mutes': subscription.get('mutes', {}),
                             'master_gain': subscription.get('master_gain', 1.0),
+                            'mix_mode': subscription.get('mix_mode', 'channels'),
                             'last_seen': time.time(),
                             'reconnection_count': client.reconnection_count,
                             'client_type': 'native'
                         }
+                        self.state_journal.record(client.persistent_id, self.persistent_state[client.persistent_id])
                         logger.info(f"💾 Estado guardado para reconexión: {client.persistent_id[:15]}")
                     elif client.persistent_id in self.persistent_state:
                         self.persistent_state[client.persistent_id]['last_seen'] = time.time()
+                        self.persistent_state.touch(client.persistent_id)
             except Exception as e:
                 logger.debug(f"Error guardando estado: {e}")
         
@@ -1432,6 +1860,16 @@ class NativeAudioServer:
         except Exception as e:
             logger.debug(f"Error notificando: {e}")
 
+    def _on_shard_block_done(self, sent, dropped, sent_bytes, dead_client_ids):
+        """✅ NUEVO: Resultado de un bloque enviado por un shard (hilo del shard)"""
+        if sent or dropped:
+            self.counters.update(packets_sent=sent, packets_dropped=dropped, bytes_sent=sent_bytes)
+        for client_id in dead_client_ids:
+            with self.client_lock:
+                client = self.clients.get(client_id)
+            if client:
+                self._disconnect_client(client_id, preserve_state=client.auto_reconnect)
+
     def _notify_client_disconnected(self, client_id):
         try:
             from audio_server import websocket_server
@@ -1454,20 +1892,73 @@ class NativeAudioServer:
             return self.sample_position
     
     def update_stats(self, **kwargs):
-        with self.stats_lock:
-            for key, value in kwargs.items():
-                if key in self.stats:
-                    self.stats[key] += value
+        """✅ OPTIMIZACIÓN: Incremento en el slot del hilo actual (sin lock)"""
+        self.counters.update(**kwargs)
     
     def get_stats(self):
-        with self.stats_lock:
-            stats = self.stats.copy()
-            stats['active_clients'] = len(self.clients)
-            
-            with self.persistent_lock:
-                stats['cached_states'] = len(self.persistent_state)
-            
-            return stats
+        stats = self.counters.snapshot()
+        stats['uptime'] = int(time.time() - self.start_time)
+        
+        with self.client_lock:
+            clients = list(self.clients.values())
+        stats['active_clients'] = len(clients)
+        
+        # ✅ NUEVO: Agregado por cliente (bytes, drops y distribuciones de latencia)
+        per_client = {}
+        rtt_total = QuantileSketch()
+        wire_total = QuantileSketch()
+        for client in clients:
+            per_client[client.id] = client.counters.snapshot()
+            per_client[client.id]['first_audio_ms'] = (
+                round(client.first_audio_ms, 2) if client.first_audio_ms is not None else None
+            )
+            per_client[client.id]['rtt_ms'] = client.rtt.summary()
+            per_client[client.id]['adc_to_wire_ms'] = client.adc_to_wire.summary()
+            rtt_total.merge(client.rtt)
+            wire_total.merge(client.adc_to_wire)
+            if client.congestion:
+                per_client[client.id]['congestion'] = client.congestion.get_stats()
+        stats['per_client'] = per_client
+        stats['rtt_ms'] = rtt_total.summary()
+        stats['adc_to_wire_ms'] = wire_total.summary()
+        stats['client_bytes_sent'] = sum(c['bytes_sent'] for c in per_client.values())
+        stats['client_packets_dropped'] = sum(c['packets_dropped'] for c in per_client.values())
+        
+        with self.persistent_lock:
+            stats['cached_states'] = len(self.persistent_state)
+            stats['state_cache'] = self.persistent_state.get_stats()
+        
+        if self.send_shards:
+            stats['send_shards'] = self.send_shards.get_stats()
+        
+        stats['state_journal'] = self.state_journal.get_stats()
+        
+        # ✅ NUEVO: Despacho de control y tiempo handshake → primer audio
+        if self.control_dispatcher:
+            stats['control_dispatch'] = self.control_dispatcher.get_stats()
+        recent = list(self._first_audio_ms)
+        stats['handshake_to_first_audio_ms'] = {
+            'count': self._first_audio_count,
+            'last': round(recent[-1], 2) if recent else None,
+            'avg': round(sum(recent) / len(recent), 2) if recent else None,
+            'max': round(max(recent), 2) if recent else None
+        }
+        
+        return stats
+    
+    def get_client_congestion(self, client_id: str):
+        """✅ NUEVO: Estado de la escalera de congestión de un cliente (o None)"""
+        with self.client_lock:
+            client = self.clients.get(client_id)
+        if client and client.congestion:
+            return client.congestion.get_stats()
+        return None
+    
+    def client_supports_mixdown(self, client_id: str) -> bool:
+        """✅ NUEVO: El handshake del cliente anunció mix_modes con 'stereo'"""
+        with self.client_lock:
+            client = self.clients.get(client_id)
+        return bool(client and client.supports_mixdown)
     
     def get_client_count(self):
         with self.client_lock:
@@ -0,0 +1,226 @@
+"""
+persistence.py - Servicio único de persistencia write-behind para los archivos de estado
+✅ Un solo hilo escritor para devices.json, channels_state.json, web_ui_state.json y el journal nativo
+✅ Los productores solo marcan "sucio" (sin E/S); el escritor agrupa por archivo dentro de su ventana
+✅ Escritura atómica: temporal + fsync + os.replace
+✅ Cola acotada: una entrada pendiente por destino registrado
+✅ Métricas: escrituras evitadas y latencia de escritura por destino
+"""
+
+import os
+import json
+import time
+import heapq
+import threading
+import logging
+
+import config
+from audio_server.quantiles import QuantileSketch
+
+logger = logging.getLogger(__name__)
+
+_service_instance = None
+_service_lock = threading.Lock()
+
+
+def write_json_atomic(path: str, data, indent=None, fsync: bool = True) -> int:
+    """Escribir JSON en `path` sin dejar nunca un archivo a medias. Devuelve bytes escritos."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    payload = json.dumps(data, ensure_ascii=False, indent=indent)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(payload)
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(payload.encode('utf-8'))
+
+
+class PersistTarget:
+    """Destino registrado: un archivo JSON (snapshot) o un escritor propio (journal)"""
+
+    def __init__(self, name: str, writer, window: float):
+        self.name = name
+        self.writer = writer
+        self.window = window
+        self.due = None          # Instante (monotonic) de la escritura programada
+
+        self.marks = 0
+        self.writes = 0
+        self.bytes_written = 0
+        self.errors = 0
+        self.write_ms = QuantileSketch()
+
+    def get_stats(self) -> dict:
+        return {
+            'window_ms': round(self.window * 1000, 1),
+            'dirty_marks': self.marks,
+            'writes': self.writes,
+            'writes_avoided': max(0, self.marks - self.writes),
+            'bytes_written': self.bytes_written,
+            'errors': self.errors,
+            'write_ms': self.write_ms.summary()
+        }
+
+
+class PersistenceService:
+    """
+    ✅ Escritor write-behind compartido.
+
+    `mark_dirty(name)` programa la escritura del destino para dentro de su
+    ventana; más marcas antes de ese instante no añaden trabajo (coalescencia).
+    El escritor llama al `snapshot()` del destino (que toma su propio lock el
+    mínimo tiempo y devuelve datos serializables) y escribe fuera de cualquier
+    lock de los productores. `flush()` escribe ya todo lo pendiente.
+    """
+
+    def __init__(self, fsync: bool = None):
+        self.fsync = getattr(config, 'PERSISTENCE_FSYNC', True) if fsync is None else fsync
+        self.max_targets = getattr(config, 'PERSISTENCE_MAX_TARGETS', 16)
+        self._targets = {}
+        self._heap = []          # (due, name) - puede contener entradas obsoletas
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._io_lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+    # ------------------------------------------------------------------
+    # Registro de destinos
+    # ------------------------------------------------------------------
+
+    def register_file(self, name: str, path: str, snapshot, window: float = None, indent=None):
+        """Archivo JSON reescrito entero (atómico) a partir de snapshot()"""
+        def writer():
+            return write_json_atomic(path, snapshot(), indent=indent, fsync=self.fsync)
+        self._register(name, writer, window)
+
+    def register_writer(self, name: str, write_fn, window: float = None):
+        """Escritor propio: write_fn() hace su E/S y devuelve bytes escritos"""
+        self._register(name, write_fn, window)
+
+    def _register(self, name, writer, window):
+        if window is None:
+            window = getattr(config, 'PERSISTENCE_WINDOW_MS', 500) / 1000.0
+        with self._lock:
+            if name not in self._targets and len(self._targets) >= self.max_targets:
+                raise ValueError(f"Demasiados destinos de persistencia ({self.max_targets})")
+            self._targets[name] = PersistTarget(name, writer, max(0.0, window))
+
+    # ------------------------------------------------------------------
+    # API de productores (cualquier hilo, sin E/S)
+    # ------------------------------------------------------------------
+
+    def mark_dirty(self, name: str, delay: float = None):
+        """Programar escritura del destino (delay: segundos, por defecto su ventana)"""
+        with self._lock:
+            target = self._targets.get(name)
+            if target is None:
+                return
+            target.marks += 1
+            due = time.monotonic() + (target.window if delay is None else delay)
+            if target.due is not None and target.due <= due:
+                return  # Ya hay una escritura igual o más temprana programada
+            target.due = due
+            heapq.heappush(self._heap, (due, name))
+            if not self.running:
+                self._start_locked()
+            self._wakeup.notify()
+
+    # ------------------------------------------------------------------
+    # Hilo escritor
+    # ------------------------------------------------------------------
+
+    def start(self):
+        with self._lock:
+            self._start_locked()
+
+    def _start_locked(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True, name='persistence')
+        self.thread.start()
+        logger.info("[Persistence] ✅ Escritor write-behind activo")
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while self.running:
+                    now = time.monotonic()
+                    while self._heap and self._targets[self._heap[0][1]].due != self._heap[0][0]:
+                        heapq.heappop(self._heap)  # Entrada reprogramada o ya escrita
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    self._wakeup.wait(timeout=timeout)
+                if not self.running:
+                    return
+                _, name = heapq.heappop(self._heap)
+                target = self._targets[name]
+                target.due = None
+            self._write(target)
+
+    def _write(self, target: PersistTarget):
+        with self._io_lock:
+            start = time.perf_counter()
+            try:
+                written = target.writer() or 0
+            except Exception as e:
+                target.errors += 1
+                logger.error(f"[Persistence] ❌ Error escribiendo {target.name}: {e}")
+                return
+            target.write_ms.add((time.perf_counter() - start) * 1000)
+            target.writes += 1
+            target.bytes_written += written
+
+    def flush(self, name: str = None):
+        """Escribir ya lo pendiente (de un destino o de todos) en el hilo que llama"""
+        with self._lock:
+            if name is None:
+                pending = [t for t in self._targets.values() if t.due is not None]
+            else:
+                target = self._targets.get(name)
+                pending = [target] if target is not None and target.due is not None else []
+            for target in pending:
+                target.due = None
+        for target in pending:
+            self._write(target)
+
+    def stop(self):
+        """Apagado: escribir todo lo pendiente y detener el hilo"""
+        with self._lock:
+            self.running = False
+            self._wakeup.notify()
+        if self.thread:
+            self.thread.join(timeout=2.0)
+        self.flush()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            targets = dict(self._targets)
+            backlog = sum(1 for t in targets.values() if t.due is not None)
+        return {
+            'running': self.running,
+            'backlog': backlog,
+            'fsync': self.fsync,
+            'targets': {name: target.get_stats() for name, target in targets.items()}
+        }
+
+
+def init_persistence_service() -> PersistenceService:
+    """Inicializar instancia única del servicio de persistencia"""
+    global _service_instance
+
+    with _service_lock:
+        if _service_instance is None:
+            _service_instance = PersistenceService()
+        return _service_instance
+
+
+def get_persistence_service() -> PersistenceService:
+    """Obtener instancia del servicio (se crea si aún no existe)"""
+    if _service_instance is None:
+        return init_persistence_service()
+    return _service_instance
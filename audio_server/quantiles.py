@@ -0,0 +1,95 @@
+"""
+quantiles.py - Distribuciones de latencia con memoria acotada
+✅ Histograma de buckets logarítmicos: error relativo fijo (2% por defecto)
+✅ add() es O(1) (un log y un incremento): apto para llamarse por bloque y cliente
+✅ Un solo escritor por sketch; los lectores trabajan sobre una copia
+"""
+
+import math
+
+
+class QuantileSketch:
+    """
+    Sketch de cuantiles con error relativo acotado (estilo DDSketch).
+
+    Cada valor positivo cae en el bucket ceil(log_gamma(v)); el cuantil se
+    devuelve como el punto medio (geométrico) del bucket, así que el error
+    relativo es como mucho `relative_accuracy`. Valores <= min_value se
+    cuentan aparte como "cero".
+    """
+
+    def __init__(self, relative_accuracy: float = 0.02, min_value: float = 1e-3):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.min_value = min_value
+        self._buckets = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if value <= self.min_value:
+            self.zero_count += 1
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        buckets = self._buckets
+        buckets[index] = buckets.get(index, 0) + 1
+
+    def merge(self, other: 'QuantileSketch'):
+        """Sumar otro sketch con la misma precisión (p.ej. agregado de clientes)"""
+        for index, n in other._buckets.copy().items():
+            self._buckets[index] = self._buckets.get(index, 0) + n
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def quantile(self, q: float, _buckets=None):
+        count = self.count
+        if count == 0:
+            return None
+        rank = q * (count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        buckets = _buckets if _buckets is not None else self._buckets.copy()
+        for index in sorted(buckets):
+            seen += buckets[index]
+            if seen > rank:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return self.max
+
+    def summary(self, quantiles=(0.5, 0.9, 0.99)) -> dict:
+        """Resumen listo para JSON (ms si se alimentó en ms)"""
+        buckets = self._buckets.copy()
+        count = self.count
+        result = {
+            'count': count,
+            'mean': round(self.total / count, 3) if count else None,
+            'min': round(self.min, 3) if self.min is not None else None,
+            'max': round(self.max, 3) if self.max is not None else None
+        }
+        for q in quantiles:
+            value = self.quantile(q, buckets)
+            result[f'p{q * 100:g}'] = round(value, 3) if value is not None else None
+        return result
+
+    def reset(self):
+        self._buckets = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
@@ -0,0 +1,123 @@
+"""
+resampler.py - Reducción de sample rate por cliente (48k → 24k / 16k)
+✅ Filtro anti-aliasing FIR diseñado UNA vez por factor (scipy, import perezoso)
+✅ Decimador con estado por grupo de canales: continuidad entre bloques
+✅ Polifásico: solo se calculan las muestras de salida, vectorizado en canales
+"""
+
+import logging
+from functools import lru_cache
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import config
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_FACTORS = (2, 3)
+
+
+@lru_cache(maxsize=None)
+def design_decimation_filter(factor: int) -> np.ndarray:
+    """
+    FIR pasa-bajos para decimar por `factor` (corte al 90% del nuevo Nyquist).
+
+    Returns:
+        Coeficientes float32 invertidos (listos para producto con la ventana)
+    """
+    from scipy.signal import firwin
+
+    taps_per_phase = getattr(config, 'NATIVE_RESAMPLE_TAPS_PER_PHASE', 16)
+    numtaps = taps_per_phase * factor
+    taps = firwin(numtaps, 0.9 / factor, window=('kaiser', 8.0))
+    return np.ascontiguousarray(taps[::-1], dtype=np.float32)
+
+
+def output_rate_factor(requested_rate, source_rate: int) -> int:
+    """Factor de decimación para un sample_rate pedido (1 = sin cambio)"""
+    try:
+        requested_rate = int(requested_rate)
+    except (TypeError, ValueError):
+        return 1
+    if requested_rate <= 0 or requested_rate >= source_rate or source_rate % requested_rate:
+        return 1
+    factor = source_rate // requested_rate
+    return factor if factor in SUPPORTED_FACTORS else 1
+
+
+class PolyphaseDecimator:
+    """
+    Decimador FIR con estado para un grupo de canales.
+
+    Mantiene las últimas numtaps-1 muestras y la fase de salida, así que
+    bloques de cualquier tamaño (128 no es múltiplo de 3) se encadenan sin
+    discontinuidades. Solo se evalúa el filtro en las posiciones de salida.
+    """
+
+    def __init__(self, factor: int, num_channels: int):
+        self.factor = factor
+        self.taps = design_decimation_filter(factor)
+        self.history = np.zeros((len(self.taps) - 1, num_channels), dtype=np.float32)
+        self.phase = 0  # Índice (en el bloque) de la próxima muestra de salida
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            block: (frames, canales) float32 a la tasa original
+
+        Returns:
+            (frames_salida, canales) float32 a tasa / factor
+        """
+        frames = block.shape[0]
+        extended = np.concatenate((self.history, block), axis=0)
+        self.history = extended[frames:]
+
+        if self.phase >= frames:
+            self.phase -= frames
+            return np.empty((0, block.shape[1]), dtype=np.float32)
+
+        # ventanas[i] = extended[i : i+numtaps] termina en la muestra i del bloque
+        windows = sliding_window_view(extended, len(self.taps), axis=0)
+        selected = windows[self.phase:frames:self.factor]  # (salidas, canales, numtaps)
+        out = selected @ self.taps
+
+        next_output = self.phase + len(out) * self.factor
+        self.phase = next_output - frames
+        return out.astype(np.float32, copy=False)
+
+
+class DecimatorBank:
+    """
+    Decimadores por (grupo de canales, factor) para el fan-out nativo.
+
+    Todos los clientes con los mismos canales y tasa comparten un decimador;
+    cada uno avanza una sola vez por bloque. Los grupos que dejan de usarse
+    se descartan al cerrar el bloque.
+    """
+
+    def __init__(self):
+        self._decimators = {}
+        self._block_outputs = {}
+
+    def process(self, audio_data: np.ndarray, channels: list, factor: int, group=None) -> np.ndarray:
+        """group: clave propia (p.ej. mezcla personal de un cliente) en vez de los canales"""
+        key = (group if group is not None else tuple(channels), factor)
+        out = self._block_outputs.get(key)
+        if out is not None:
+            return out
+
+        decimator = self._decimators.get(key)
+        if decimator is None:
+            decimator = PolyphaseDecimator(factor, len(channels))
+            self._decimators[key] = decimator
+        out = decimator.process(audio_data[:, channels])
+        self._block_outputs[key] = out
+        return out
+
+    def end_block(self):
+        """Cerrar el bloque: descartar decimadores de grupos que no se usaron"""
+        if len(self._decimators) != len(self._block_outputs):
+            for key in [k for k in self._decimators if k not in self._block_outputs]:
+                del self._decimators[key]
+        self._block_outputs.clear()
@@ -0,0 +1,264 @@
+"""
+send_shards.py - Fan-out de audio repartido en hilos de envío persistentes
+✅ Cada cliente pertenece a UN shard (orden de paquetes por cliente garantizado)
+✅ El hilo de captura solo hace put_nowait: nunca espera a un shard
+✅ Cola acotada por shard: si un shard va atrasado se descarta el bloque (tipo RF)
+✅ Lag por shard (encolado → enviado) para monitoreo
+"""
+
+import queue
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SendShard:
+    """Hilo de envío persistente con cola acotada de bloques"""
+
+    def __init__(self, index: int, queue_depth: int, on_block_done=None):
+        self.index = index
+        self.queue = queue.Queue(maxsize=max(1, queue_depth))
+        self.on_block_done = on_block_done
+        self.running = False
+        self.thread = None
+
+        self.stats_lock = threading.Lock()
+        self.blocks_processed = 0
+        self.blocks_dropped = 0
+        self.packets_sent = 0
+        self.packets_dropped = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self._lag_total_ms = 0.0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(
+            target=self._run, daemon=True, name=f'audio-shard-{self.index}'
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        if self.thread:
+            self.thread.join(timeout=1.0)
+
+    def submit(self, sends: list, adc_ns=None) -> bool:
+        """Encolar los envíos de un bloque. Nunca bloquea."""
+        try:
+            self.queue.put_nowait((time.perf_counter(), sends, adc_ns))
+            return True
+        except queue.Full:
+            with self.stats_lock:
+                self.blocks_dropped += 1
+                self.packets_dropped += len(sends)
+            return False
+
+    def _run(self):
+        while self.running:
+            job = self.queue.get()
+            if job is None:
+                break
+
+            enqueued_at, sends, adc_ns = job
+            lag_ms = (time.perf_counter() - enqueued_at) * 1000
+
+            sent = 0
+            sent_bytes = 0
+            dropped = 0
+            dead = []
+            for client_id, client, packet in sends:
+                try:
+                    # ✅ send() libera el GIL durante la syscall
+                    if client.send_bytes_direct(packet):
+                        sent += 1
+                        sent_bytes += len(packet)
+                        if adc_ns is not None:
+                            client.record_wire_latency(adc_ns)
+                    else:
+                        dropped += 1
+                except Exception:
+                    dead.append(client_id)
+
+            with self.stats_lock:
+                self.blocks_processed += 1
+                self.packets_sent += sent
+                self.packets_dropped += dropped
+                self.last_lag_ms = lag_ms
+                self._lag_total_ms += lag_ms
+                if lag_ms > self.max_lag_ms:
+                    self.max_lag_ms = lag_ms
+
+            if self.on_block_done:
+                try:
+                    self.on_block_done(sent, dropped, sent_bytes, dead)
+                except Exception as e:
+                    logger.debug(f"[SendShards] on_block_done: {e}")
+
+    def get_stats(self) -> dict:
+        with self.stats_lock:
+            processed = self.blocks_processed
+            return {
+                'shard': self.index,
+                'backlog': self.queue.qsize(),
+                'blocks_processed': processed,
+                'blocks_dropped': self.blocks_dropped,
+                'packets_sent': self.packets_sent,
+                'packets_dropped': self.packets_dropped,
+                'last_lag_ms': round(self.last_lag_ms, 3),
+                'max_lag_ms': round(self.max_lag_ms, 3),
+                'avg_lag_ms': round(self._lag_total_ms / processed, 3) if processed else 0.0
+            }
+
+    def reset_max_lag(self):
+        with self.stats_lock:
+            self.max_lag_ms = 0.0
+
+
+class ShardedSender:
+    """
+    ✅ Reparte los clientes entre N shards persistentes.
+
+    El hilo de captura codifica los paquetes por grupo de canales (cache) y
+    solo reparte referencias (cliente, paquete) a los shards; las syscalls de
+    envío corren en paralelo en los hilos de shard.
+    """
+
+    def __init__(self, num_shards: int, queue_depth: int = 4, on_block_done=None):
+        self.shards = [SendShard(i, queue_depth, on_block_done) for i in range(max(1, num_shards))]
+        self._assignment = {}  # {client_id: shard_index}
+        self._load = [0] * len(self.shards)
+        self._assign_lock = threading.Lock()
+
+    def start(self):
+        for shard in self.shards:
+            shard.start()
+        logger.info(f"[SendShards] ✅ {len(self.shards)} shards de envío activos")
+
+    def stop(self):
+        for shard in self.shards:
+            shard.stop()
+
+    def shard_for(self, client_id: str) -> int:
+        """Shard del cliente (asignación estable al shard menos cargado)"""
+        index = self._assignment.get(client_id)
+        if index is not None:
+            return index
+        with self._assign_lock:
+            index = self._assignment.get(client_id)
+            if index is None:
+                index = self._load.index(min(self._load))
+                self._assignment[client_id] = index
+                self._load[index] += 1
+            return index
+
+    def forget(self, client_id: str):
+        with self._assign_lock:
+            index = self._assignment.pop(client_id, None)
+            if index is not None:
+                self._load[index] -= 1
+
+    def new_batch(self) -> list:
+        return [[] for _ in self.shards]
+
+    def add(self, batch: list, client_id: str, client, packet):
+        batch[self.shard_for(client_id)].append((client_id, client, packet))
+
+    def dispatch(self, batch: list, adc_ns=None) -> int:
+        """
+        Entregar el bloque a los shards. Devuelve shards que lo descartaron.
+        adc_ns: instante ADC del bloque para medir latencia ADC → envío por cliente.
+        """
+        rejected = 0
+        for shard, sends in zip(self.shards, batch):
+            if sends and not shard.submit(sends, adc_ns):
+                rejected += 1
+        return rejected
+
+    def get_stats(self) -> list:
+        return [shard.get_stats() for shard in self.shards]
+
+
+if __name__ == '__main__':
+    # Benchmark: fan-out serie vs shards con clientes simulados (socketpair)
+    import socket
+
+    class _BenchClient:
+        def __init__(self):
+            self.tx, self.rx = socket.socketpair()
+            self.tx.setblocking(False)
+            self.rx.setblocking(False)
+            self.tx.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+
+        def send_bytes_direct(self, data):
+            try:
+                self.tx.send(data)
+                return True
+            except BlockingIOError:
+                return False
+
+        def drain(self):
+            try:
+                while self.rx.recv(1 << 20):
+                    pass
+            except BlockingIOError:
+                pass
+
+        def close(self):
+            self.tx.close()
+            self.rx.close()
+
+    packet = bytes(16 + 12 + 128 * 16 * 2)  # 16 canales int16, bloque de 128
+    blocks = 2000
+    paced_blocks = 750
+    block_period = 128 / 48000
+
+    for num_clients in (10, 25, 50):
+        clients = [(f'c{i}', _BenchClient()) for i in range(num_clients)]
+
+        start = time.perf_counter()
+        for b in range(blocks):
+            for client_id, client in clients:
+                client.send_bytes_direct(packet)
+            if b % 50 == 0:
+                for _, client in clients:
+                    client.drain()
+        serial_us = (time.perf_counter() - start) / blocks * 1e6
+
+        # Shards al ritmo real de captura (bloque de 128 @ 48 kHz)
+        sender = ShardedSender(6, queue_depth=4)
+        sender.start()
+        capture_time = 0.0
+        deadline = time.perf_counter()
+        for b in range(paced_blocks):
+            t0 = time.perf_counter()
+            batch = sender.new_batch()
+            for client_id, client in clients:
+                sender.add(batch, client_id, client, packet)
+            sender.dispatch(batch)
+            capture_time += time.perf_counter() - t0
+            if b % 50 == 0:
+                for _, client in clients:
+                    client.drain()
+            deadline += block_period
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        capture_us = capture_time / paced_blocks * 1e6
+        time.sleep(0.2)
+        sender.stop()
+        stats = sender.get_stats()
+
+        print(f"{num_clients:3d} clientes | serie: {serial_us:8.1f} µs/bloque | "
+              f"shards (hilo captura): {capture_us:8.1f} µs/bloque | "
+              f"lag máx: {max(s['max_lag_ms'] for s in stats):.2f} ms | "
+              f"bloques descartados: {sum(s['blocks_dropped'] for s in stats)}")
+
+        for _, client in clients:
+            client.close()
@@ -0,0 +1,318 @@
+"""
+state_journal.py - Persistencia write-behind del estado de mezcla de clientes nativos
+✅ Cambios como registros compactos (una línea JSON) añadidos a un journal
+✅ Escritor en segundo plano (propio o el PersistenceService compartido):
+   agrupa cambios de una ventana (último valor gana)
+✅ fsync según política ('always' | 'interval' | 'never')
+✅ Compactación periódica a snapshot (formato de client_states.json) y replay al arrancar
+✅ Métricas: amplificación de escritura y latencia de fsync
+"""
+
+import os
+import json
+import time
+import threading
+import logging
+
+import config
+from audio_server.quantiles import QuantileSketch
+
+logger = logging.getLogger(__name__)
+
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+_DELETED = object()
+
+
+def _detach(state: dict) -> dict:
+    """Copia superficial de dos niveles: el escritor no ve mutaciones posteriores"""
+    return {
+        k: dict(v) if isinstance(v, dict) else list(v) if isinstance(v, list) else v
+        for k, v in state.items()
+    }
+
+
+class StateJournal:
+    """
+    Snapshot + journal de registros {"k": clave, "v": estado} / {"k": clave, "d": 1}.
+
+    `record()` y `delete()` solo dejan el cambio en un dict pendiente (nunca
+    tocan disco). El escritor despierta, espera la ventana de agrupado y
+    escribe una línea por clave cambiada. Al superar el tamaño de compactación
+    escribe un snapshot nuevo (temporal + os.replace) y vacía el journal.
+    Los registros son estados completos, así que repetir el replay de un
+    journal viejo sobre un snapshot nuevo es idempotente.
+
+    Con `service` (PersistenceService) no se crea hilo propio: el journal se
+    registra como un destino más y el hilo compartido hace la E/S.
+    """
+
+    def __init__(self, snapshot_path: str, journal_path: str = None, service=None, name: str = 'client_states'):
+        self.snapshot_path = snapshot_path
+        self.service = service
+        self.name = name
+        self.journal_path = journal_path or snapshot_path + '.journal'
+        self.window = getattr(config, 'NATIVE_STATE_JOURNAL_WINDOW_MS', 250) / 1000.0
+        self.fsync_policy = getattr(config, 'NATIVE_STATE_JOURNAL_FSYNC', 'interval')
+        if self.fsync_policy not in FSYNC_POLICIES:
+            self.fsync_policy = 'interval'
+        self.fsync_interval = getattr(config, 'NATIVE_STATE_JOURNAL_FSYNC_INTERVAL', 1.0)
+        self.compact_bytes = getattr(config, 'NATIVE_STATE_JOURNAL_COMPACT_BYTES', 256 * 1024)
+
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._io_lock = threading.Lock()
+        self._state = {}       # Estado materializado (solo hilo escritor tras load())
+        self._journal = None
+        self._journal_size = 0
+        self._last_fsync = time.monotonic()
+        self._unsynced = False
+        self.running = False
+        self.thread = None
+
+        # Métricas
+        self.records_requested = 0
+        self.records_written = 0
+        self.batches = 0
+        self.journal_bytes = 0     # Bytes de registros (lo que realmente cambió)
+        self.snapshot_bytes = 0    # Bytes reescritos por compactación
+        self.compactions = 0
+        self.fsyncs = 0
+        self.fsync_ms = QuantileSketch()
+        self.write_errors = 0
+
+    # ------------------------------------------------------------------
+    # Arranque: snapshot + replay
+    # ------------------------------------------------------------------
+
+    def load(self) -> dict:
+        """Leer snapshot y aplicar el journal encima. Devuelve el estado completo."""
+        state = {}
+        os.makedirs(os.path.dirname(self.snapshot_path) or '.', exist_ok=True)
+
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f) or {}
+                state.update((k, v) for k, v in data.items() if isinstance(v, dict))
+            except Exception as e:
+                logger.warning(f"[StateJournal] ⚠️ Snapshot ilegible ({e}), se usa solo el journal")
+
+        replayed = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Última línea a medio escribir (corte de luz): se ignora
+                        continue
+                    key = entry.get('k')
+                    if key is None:
+                        continue
+                    if entry.get('d'):
+                        state.pop(key, None)
+                    elif isinstance(entry.get('v'), dict):
+                        state[key] = entry['v']
+                    replayed += 1
+
+        self._state = dict(state)
+        if replayed:
+            logger.info(f"[StateJournal] ♻️ Replay: {replayed} registros sobre el snapshot")
+        return state
+
+    def start(self):
+        if self.running:
+            return
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        self._journal_size = self._journal.tell()
+        self.running = True
+        if self.service is not None:
+            self.service.register_writer(self.name, self._service_write, window=self.window)
+        else:
+            self.thread = threading.Thread(target=self._run, daemon=True, name='state-journal')
+            self.thread.start()
+        logger.info(f"[StateJournal] ✅ Escritor activo (ventana {self.window * 1000:.0f}ms, "
+                    f"fsync {self.fsync_policy})")
+
+    # ------------------------------------------------------------------
+    # API de productores (cualquier hilo, sin E/S)
+    # ------------------------------------------------------------------
+
+    def record(self, key: str, state: dict):
+        detached = _detach(state)
+        with self._lock:
+            self._pending[key] = detached
+            self.records_requested += 1
+        self._signal()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._pending[key] = _DELETED
+            self.records_requested += 1
+        self._signal()
+
+    def _signal(self):
+        if self.service is not None:
+            self.service.mark_dirty(self.name)
+        else:
+            self._wakeup.set()
+
+    # ------------------------------------------------------------------
+    # Hilo escritor
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        while self.running:
+            self._wakeup.wait(timeout=self.fsync_interval)
+            if not self.running:
+                break
+            if self._wakeup.is_set():
+                self._wakeup.clear()
+                # Ventana de agrupado: un fader arrastrado produce una sola línea
+                time.sleep(self.window)
+                self._write_pending()
+            elif self._unsynced:
+                self._fsync()
+
+    def _service_write(self) -> int:
+        """Destino del PersistenceService: volcar lo pendiente y fsync según política"""
+        with self._io_lock:
+            if not self.running:
+                return 0
+            written = self._write_pending()
+            if self._unsynced and self.fsync_policy == 'interval':
+                if time.monotonic() - self._last_fsync >= self.fsync_interval:
+                    self._fsync()
+                else:
+                    # Sin escritor propio: programar el fsync diferido en el hilo compartido
+                    self.service.mark_dirty(self.name, delay=self.fsync_interval)
+            return written
+
+    def _write_pending(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        lines = []
+        for key, value in pending.items():
+            if value is _DELETED:
+                self._state.pop(key, None)
+                lines.append(json.dumps({'k': key, 'd': 1}, separators=(',', ':')))
+            else:
+                self._state[key] = value
+                lines.append(json.dumps({'k': key, 'v': value}, separators=(',', ':'), ensure_ascii=False))
+        data = '\n'.join(lines) + '\n'
+
+        try:
+            self._journal.write(data)
+            self._journal.flush()
+        except Exception as e:
+            self.write_errors += 1
+            logger.error(f"[StateJournal] ❌ Error escribiendo journal: {e}")
+            return 0
+
+        written = len(data.encode('utf-8'))
+        self._journal_size += written
+        self.journal_bytes += written
+        self.records_written += len(lines)
+        self.batches += 1
+        self._unsynced = True
+
+        if self.fsync_policy == 'always' or (
+            self.fsync_policy == 'interval' and time.monotonic() - self._last_fsync >= self.fsync_interval
+        ):
+            self._fsync()
+
+        if self._journal_size >= self.compact_bytes:
+            self._compact(self._state)
+        return written
+
+    def _fsync(self):
+        if self.fsync_policy == 'never' or self._journal is None:
+            self._unsynced = False
+            return
+        start = time.perf_counter()
+        try:
+            os.fsync(self._journal.fileno())
+        except OSError as e:
+            self.write_errors += 1
+            logger.error(f"[StateJournal] ❌ fsync falló: {e}")
+            return
+        self.fsync_ms.add((time.perf_counter() - start) * 1000)
+        self.fsyncs += 1
+        self._last_fsync = time.monotonic()
+        self._unsynced = False
+
+    def _compact(self, state: dict):
+        """Snapshot atómico del estado y journal vacío"""
+        tmp_path = self.snapshot_path + '.tmp'
+        try:
+            data = json.dumps(state, separators=(',', ':'), ensure_ascii=False)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+                f.flush()
+                if self.fsync_policy != 'never':
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+
+            # El snapshot ya contiene todo: el journal puede empezar de cero
+            self._journal.close()
+            self._journal = open(self.journal_path, 'w', encoding='utf-8')
+            self._journal_size = 0
+            self._unsynced = False
+        except Exception as e:
+            self.write_errors += 1
+            logger.error(f"[StateJournal] ❌ Error compactando: {e}")
+            return
+
+        self.snapshot_bytes += len(data.encode('utf-8'))
+        self.compactions += 1
+        logger.debug(f"[StateJournal] 🗜️ Compactado: {len(state)} estados")
+
+    def close(self, final_state: dict = None):
+        """
+        Detener el escritor: volcar lo pendiente y compactar.
+        final_state: estado autoritativo del llamador (reemplaza al materializado).
+        """
+        if not self.running:
+            return
+        self._wakeup.set()
+        if self.thread:
+            self.running = False
+            self.thread.join(timeout=2.0)
+        with self._io_lock:
+            self.running = False
+            self._write_pending()
+            self._compact(_detach(final_state) if final_state is not None else self._state)
+            try:
+                self._journal.close()
+            except Exception:
+                pass
+            self._journal = None
+
+    # ------------------------------------------------------------------
+    # Métricas
+    # ------------------------------------------------------------------
+
+    def get_stats(self) -> dict:
+        journal_bytes = self.journal_bytes
+        disk_bytes = journal_bytes + self.snapshot_bytes
+        return {
+            'records_requested': self.records_requested,
+            'records_written': self.records_written,
+            'coalesced': self.records_requested - self.records_written,
+            'batches': self.batches,
+            'journal_size': self._journal_size,
+            'journal_bytes': journal_bytes,
+            'snapshot_bytes': self.snapshot_bytes,
+            # Bytes en disco por byte de cambio real (1.0 = solo journal)
+            'write_amplification': round(disk_bytes / journal_bytes, 3) if journal_bytes else None,
+            'compactions': self.compactions,
+            'fsync_policy': self.fsync_policy,
+            'fsyncs': self.fsyncs,
+            'fsync_ms': self.fsync_ms.summary(),
+            'write_errors': self.write_errors
+        }
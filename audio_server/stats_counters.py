@@ -0,0 +1,71 @@
+"""
+stats_counters.py - Contadores de estadísticas sin lock en el camino caliente
+✅ Un slot (lista de enteros) por hilo escritor: incrementar no toma locks
+✅ La suma se hace solo al leer (get_stats), no por cada paquete
+✅ Slots de hilos terminados se consolidan para no crecer sin límite
+"""
+
+import threading
+
+
+class ShardedCounters:
+    """
+    Contadores con nombre fijo repartidos en slots por hilo.
+
+    Cada hilo escribe solo en su propio slot, así que `add()` nunca compite
+    con otro escritor. El lector suma todos los slots; puede ver un valor
+    un incremento atrasado, nunca uno corrupto. Nombres desconocidos se
+    ignoran (igual que el antiguo `if key in self.stats`).
+    """
+
+    def __init__(self, names):
+        self.names = tuple(names)
+        self._index = {name: i for i, name in enumerate(self.names)}
+        self._local = threading.local()
+        self._slots = []  # [(thread, slot)]
+        self._retired = [0] * len(self.names)
+        self._slots_lock = threading.Lock()  # Solo registro de slots y lectura
+
+    def _slot(self) -> list:
+        try:
+            return self._local.slot
+        except AttributeError:
+            slot = [0] * len(self.names)
+            self._local.slot = slot
+            with self._slots_lock:
+                self._slots.append((threading.current_thread(), slot))
+            return slot
+
+    def add(self, name: str, value: int = 1):
+        index = self._index.get(name)
+        if index is not None:
+            self._slot()[index] += value
+
+    def update(self, **kwargs):
+        slot = self._slot()
+        index = self._index
+        for name, value in kwargs.items():
+            i = index.get(name)
+            if i is not None:
+                slot[i] += value
+
+    def value(self, name: str) -> int:
+        return self.snapshot().get(name, 0)
+
+    def snapshot(self) -> dict:
+        """Sumar todos los slots (y consolidar los de hilos terminados)"""
+        with self._slots_lock:
+            totals = list(self._retired)
+            alive = []
+            for thread, slot in self._slots:
+                if thread.is_alive():
+                    alive.append((thread, slot))
+                    for i, v in enumerate(slot):
+                        totals[i] += v
+                else:
+                    # El hilo ya no escribe: su slot pasa a la base consolidada
+                    for i, v in enumerate(slot):
+                        self._retired[i] += v
+                        totals[i] += v
+            self._slots = alive
+        return dict(zip(self.names, totals))
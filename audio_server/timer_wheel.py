@@ -0,0 +1,159 @@
+"""
+timer_wheel.py - Planificador de temporizadores en un solo hilo (hashed timer wheel)
+✅ schedule / reschedule / cancel en O(1) por clave (sin un hilo nuevo por temporizador)
+✅ Resolución de un tick (5ms por defecto); vueltas completas para retardos > rueda
+✅ El hilo duerme sin ticks mientras no hay nada pendiente
+✅ Callbacks en el hilo de la rueda, fuera del lock
+"""
+
+import math
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TimerWheel:
+    """
+    Rueda de `slots` casillas de `tick` segundos.
+
+    Cada clave tiene a lo sumo un temporizador pendiente: programarla otra
+    vez lo mueve de casilla (reprogramación O(1)). Un retardo de n ticks cae
+    en la casilla (cursor + n) % slots con (n - 1) // slots vueltas por
+    delante; cada paso del cursor dispara las entradas de su casilla sin
+    vueltas restantes y descuenta una al resto.
+    """
+
+    def __init__(self, tick: float = 0.005, slots: int = 256, name: str = 'timer-wheel'):
+        self.tick = tick
+        self.num_slots = slots
+        self.name = name
+        self._slots = [{} for _ in range(slots)]   # clave -> [vueltas, callback, args]
+        self._where = {}                            # clave -> casilla
+        self._cursor = 0
+        self._next_tick = None                      # Instante (monotonic) del próximo paso
+        self._cond = threading.Condition()
+        self.running = False
+        self.thread = None
+
+        # Métricas
+        self.scheduled = 0
+        self.rescheduled = 0
+        self.cancelled = 0
+        self.fired = 0
+        self.callback_errors = 0
+        self.max_lag_ms = 0.0
+
+    def start(self):
+        with self._cond:
+            if not self.running:
+                self._start_locked()
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify()
+        if self.thread:
+            self.thread.join(timeout=1.0)
+
+    # ------------------------------------------------------------------
+    # API (cualquier hilo)
+    # ------------------------------------------------------------------
+
+    def schedule(self, key, delay: float, callback, *args):
+        """Programar (o reprogramar) el temporizador de `key` para dentro de `delay` s"""
+        ticks = max(1, int(math.ceil(delay / self.tick)))
+        with self._cond:
+            if not self.running:
+                self._start_locked()
+            previous = self._where.pop(key, None)
+            if previous is not None:
+                del self._slots[previous][key]
+                self.rescheduled += 1
+            else:
+                self.scheduled += 1
+            if self._next_tick is None:
+                # Rueda parada: el primer paso es dentro de un tick a partir de ahora
+                self._next_tick = time.monotonic() + self.tick
+                self._cond.notify()
+            slot = (self._cursor + ticks) % self.num_slots
+            self._slots[slot][key] = [(ticks - 1) // self.num_slots, callback, args]
+            self._where[key] = slot
+
+    def cancel(self, key) -> bool:
+        with self._cond:
+            slot = self._where.pop(key, None)
+            if slot is None:
+                return False
+            del self._slots[slot][key]
+            self.cancelled += 1
+            return True
+
+    def pending(self, key) -> bool:
+        return key in self._where
+
+    def __len__(self):
+        return len(self._where)
+
+    # ------------------------------------------------------------------
+    # Hilo de la rueda
+    # ------------------------------------------------------------------
+
+    def _start_locked(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True, name=self.name)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            due = []
+            with self._cond:
+                while self.running and (self._next_tick is None or time.monotonic() < self._next_tick):
+                    if self._next_tick is None:
+                        self._cond.wait()
+                    else:
+                        self._cond.wait(timeout=max(0.0, self._next_tick - time.monotonic()))
+                if not self.running:
+                    return
+                now = time.monotonic()
+                lag_ms = (now - self._next_tick) * 1000
+                if lag_ms > self.max_lag_ms:
+                    self.max_lag_ms = lag_ms
+                # Avanzar todos los pasos vencidos (si el hilo se retrasó, se recuperan)
+                while self._next_tick <= now:
+                    self._cursor = (self._cursor + 1) % self.num_slots
+                    self._next_tick += self.tick
+                    slot = self._slots[self._cursor]
+                    if not slot:
+                        continue
+                    for key in [k for k, entry in slot.items() if entry[0] == 0]:
+                        _, callback, args = slot.pop(key)
+                        del self._where[key]
+                        due.append((callback, args))
+                    for entry in slot.values():
+                        entry[0] -= 1
+                if not self._where:
+                    self._next_tick = None  # Nada pendiente: dormir hasta el próximo schedule()
+                self.fired += len(due)
+            for callback, args in due:
+                try:
+                    callback(*args)
+                except Exception as e:
+                    self.callback_errors += 1
+                    logger.error(f"[TimerWheel] ❌ Error en callback ({self.name}): {e}")
+
+    def get_stats(self) -> dict:
+        with self._cond:
+            pending = len(self._where)
+        return {
+            'tick_ms': round(self.tick * 1000, 2),
+            'slots': self.num_slots,
+            'pending': pending,
+            'scheduled': self.scheduled,
+            'rescheduled': self.rescheduled,
+            'cancelled': self.cancelled,
+            'fired': self.fired,
+            'callback_errors': self.callback_errors,
+            'max_lag_ms': round(self.max_lag_ms, 3)
+        }
@@ -0,0 +1,177 @@
+"""
+ttl_cache.py - Contenedor TTL/LRU para cachés de estado (registro, estados nativos y web)
+✅ OrderedDict (orden de uso) + heap de (last_seen, clave) para expirar sin ordenar todo
+✅ touch() O(1): la entrada del heap se corrige de forma perezosa al llegar a la cima
+✅ expire(): caducidad por TTL y desalojo por capacidad en O(log n) amortizado por entrada
+✅ Sin lock propio: lo protege el lock del dueño (device_lock, persistent_lock, ...)
+"""
+
+import time
+import heapq
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+
+class TTLCache(MutableMapping):
+    """
+    Mapping clave -> valor con marca de último uso por clave.
+
+    El heap guarda (marca, clave) tal como estaba al insertar; touch() solo
+    actualiza la marca en `_stamps`. Cuando una entrada vieja llega a la cima
+    se reinserta con la marca actual (o se descarta si la clave ya no está),
+    así que cada expire() solo toca las claves que realmente caducan o que se
+    usaron desde la última pasada.
+
+    ttl <= 0 / None: sin caducidad. max_entries <= 0 / None: sin límite.
+    """
+
+    def __init__(self, ttl: float = None, max_entries: int = None, clock=time.time):
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self.max_entries = max_entries if max_entries and max_entries > 0 else None
+        self.clock = clock
+        self._data = OrderedDict()
+        self._stamps = {}
+        self._heap = []
+
+        # Métricas
+        self.expirations = 0
+        self.evictions = 0
+
+    # ------------------------------------------------------------------
+    # Mapping
+    # ------------------------------------------------------------------
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        del self._data[key]
+        del self._stamps[key]
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def keys(self):
+        return self._data.keys()
+
+    def values(self):
+        return self._data.values()
+
+    def items(self):
+        return self._data.items()
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def pop(self, key, *default):
+        if key in self._data:
+            del self._stamps[key]
+            return self._data.pop(key)
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def clear(self):
+        self._data.clear()
+        self._stamps.clear()
+        self._heap = []
+
+    # ------------------------------------------------------------------
+    # Marcas de uso
+    # ------------------------------------------------------------------
+
+    def set(self, key, value, stamp: float = None):
+        """Insertar/reemplazar y marcar como usado en `stamp` (por defecto ahora)"""
+        self._data[key] = value
+        self.touch(key, stamp)
+
+    def touch(self, key, stamp: float = None) -> bool:
+        """Marcar uso de una clave existente. O(1) salvo si la marca retrocede."""
+        if key not in self._data:
+            return False
+        if stamp is None:
+            stamp = self.clock()
+        previous = self._stamps.get(key)
+        self._stamps[key] = stamp
+        self._data.move_to_end(key)
+        if previous is None or stamp < previous:
+            # Clave nueva o marca anterior: el heap necesita una entrada que no llegue tarde
+            heapq.heappush(self._heap, (stamp, key))
+            self._maybe_compact()
+        return True
+
+    def last_seen(self, key, default=None):
+        return self._stamps.get(key, default)
+
+    def _maybe_compact(self):
+        # Entradas obsoletas acumuladas (claves borradas o reinsertadas): reconstruir
+        if len(self._heap) > 2 * len(self._data) + 64:
+            self._heap = [(stamp, key) for key, stamp in self._stamps.items()]
+            heapq.heapify(self._heap)
+
+    def _oldest(self):
+        """(marca, clave) de la clave menos usada recientemente, o None"""
+        heap = self._heap
+        while heap:
+            stamp, key = heap[0]
+            current = self._stamps.get(key)
+            if current is None:
+                heapq.heappop(heap)              # Clave ya eliminada
+            elif current != stamp:
+                heapq.heapreplace(heap, (current, key))  # Usada desde que se encoló
+            else:
+                return stamp, key
+        return None
+
+    # ------------------------------------------------------------------
+    # Caducidad y capacidad
+    # ------------------------------------------------------------------
+
+    def expire(self, now: float = None, ttl: bool = True, capacity: bool = True) -> list:
+        """
+        Quitar lo caducado (TTL) y lo que exceda max_entries (menos reciente
+        primero). Devuelve [(clave, valor, 'expired' | 'capacity'), ...].
+        """
+        removed = []
+        if ttl and self.ttl is not None:
+            deadline = (self.clock() if now is None else now) - self.ttl
+            while True:
+                oldest = self._oldest()
+                if oldest is None or oldest[0] >= deadline:
+                    break
+                key = oldest[1]
+                heapq.heappop(self._heap)
+                removed.append((key, self.pop(key), 'expired'))
+                self.expirations += 1
+
+        if capacity and self.max_entries is not None:
+            while len(self._data) > self.max_entries:
+                key = self._oldest()[1]
+                heapq.heappop(self._heap)
+                removed.append((key, self.pop(key), 'capacity'))
+                self.evictions += 1
+        return removed
+
+    def is_expired(self, key, now: float = None) -> bool:
+        if self.ttl is None or key not in self._stamps:
+            return False
+        return (self.clock() if now is None else now) - self._stamps[key] > self.ttl
+
+    def get_stats(self) -> dict:
+        return {
+            'size': len(self._data),
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'expirations': self.expirations,
+            'evictions': self.evictions,
+            'heap_size': len(self._heap)
+        }
@@ -0,0 +1,312 @@
+"""
+udp_audio.py - Transporte de audio UDP unicast para clientes nativos
+✅ Un único socket no-bloqueante para todos los clientes (sendto en ráfaga)
+✅ Semántica latency-first: datagrama perdido = muestras perdidas, sin reintentos
+✅ Tracker de secuencia de referencia (pérdidas / reordenamiento / duplicados)
+✅ FEC XOR opcional: 1 paquete de paridad cada K datagramas (overhead 1/K)
+"""
+
+import socket
+import logging
+import threading
+
+import config
+from audio_server.native_protocol import NativeAndroidProtocol
+
+logger = logging.getLogger(__name__)
+
+
+class UdpAudioSender:
+    """
+    ✅ Envío de audio por UDP desde un solo socket no-bloqueante.
+
+    El hilo de captura encola (datagrama, dirección) durante el fan-out y hace
+    flush() una vez por bloque: todos los sendto salen seguidos (estilo
+    sendmmsg, que Python no expone). Si el buffer del kernel está lleno el
+    datagrama se descarta (tipo RF), nunca se espera.
+    """
+
+    def __init__(self, sock: socket.socket):
+        self.socket = sock
+        self._pending = []
+        self.datagrams_sent = 0
+        self.datagrams_dropped = 0
+        self.bytes_sent = 0
+
+    @classmethod
+    def create(cls, host: str, port: int):
+        """Crear socket UDP no-bloqueante ligado a host:port"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, getattr(config, 'NATIVE_UDP_SNDBUF', 262144))
+        except OSError as e:
+            logger.warning(f"[UDP] ⚠️ SO_SNDBUF: {e}")
+        sock.bind((host, port))
+        sock.setblocking(False)
+        logger.info(f"[UDP] ✅ Socket de audio UDP en {host}:{port}")
+        return cls(sock)
+
+    def queue(self, datagram, addr):
+        """Encolar datagrama para el próximo flush (sin syscalls)"""
+        self._pending.append((datagram, addr))
+
+    def flush(self) -> tuple:
+        """
+        Enviar todos los datagramas encolados en una sola ráfaga.
+
+        Returns:
+            (enviados, descartados, bytes_enviados) en este flush
+        """
+        pending = self._pending
+        if not pending:
+            return 0, 0, 0
+        self._pending = []
+
+        sendto = self.socket.sendto
+        sent = 0
+        dropped = 0
+        sent_bytes = 0
+        for datagram, addr in pending:
+            try:
+                sent_bytes += sendto(datagram, addr)
+                sent += 1
+            except (BlockingIOError, InterruptedError):
+                dropped += 1
+            except OSError as e:
+                # ✅ ICMP unreachable, red caída, etc: descartar y seguir
+                dropped += 1
+                if config.DEBUG:
+                    logger.debug(f"[UDP] sendto {addr}: {e}")
+
+        self.datagrams_sent += sent
+        self.datagrams_dropped += dropped
+        self.bytes_sent += sent_bytes
+        return sent, dropped, sent_bytes
+
+    def close(self):
+        self._pending = []
+        try:
+            self.socket.close()
+        except Exception as e:
+            logger.debug(f"[UDP] Error cerrando socket: {e}")
+
+
+class UdpSequenceTracker:
+    """
+    ✅ Contadores de recepción por número de secuencia (referencia del receptor).
+
+    Usa aritmética de números de serie de 32 bits, así que soporta el
+    wrap-around del campo de secuencia. Un hueco cuenta como pérdida hasta que
+    el datagrama llega tarde (entonces pasa a reordenado).
+    """
+
+    SEQ_MOD = 1 << 32
+    SEQ_HALF = 1 << 31
+
+    def __init__(self, window: int = 1024):
+        self.window = window
+        self.highest = None
+        self.missing = set()
+        self.received = 0
+        self.reordered = 0
+        self.duplicates = 0
+        self.expired_losses = 0  # Huecos que salieron de la ventana sin llegar
+        self.lock = threading.Lock()
+
+    def on_datagram(self, sequence: int) -> str:
+        """
+        Registrar un datagrama recibido.
+
+        Returns:
+            'in_order' | 'gap' | 'reordered' | 'duplicate'
+        """
+        with self.lock:
+            self.received += 1
+            if self.highest is None:
+                self.highest = sequence
+                return 'in_order'
+
+            diff = (sequence - self.highest) % self.SEQ_MOD
+            if diff == 0:
+                self.duplicates += 1
+                return 'duplicate'
+
+            if diff < self.SEQ_HALF:
+                # Avanza: registrar huecos intermedios
+                result = 'in_order' if diff == 1 else 'gap'
+                for i in range(1, min(diff, self.window + 1)):
+                    self.missing.add((self.highest + i) % self.SEQ_MOD)
+                if diff > self.window + 1:
+                    self.expired_losses += diff - self.window - 1
+                self.highest = sequence
+                self._expire_old()
+                return result
+
+            # Llega tarde
+            if sequence in self.missing:
+                self.missing.discard(sequence)
+                self.reordered += 1
+                return 'reordered'
+            self.duplicates += 1
+            return 'duplicate'
+
+    def _expire_old(self):
+        if len(self.missing) <= self.window:
+            return
+        cutoff = (self.highest - self.window) % self.SEQ_MOD
+        stale = [s for s in self.missing if ((s - cutoff) % self.SEQ_MOD) >= self.SEQ_HALF]
+        for s in stale:
+            self.missing.discard(s)
+        self.expired_losses += len(stale)
+
+    @property
+    def lost(self) -> int:
+        return len(self.missing) + self.expired_losses
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                'received': self.received,
+                'lost': len(self.missing) + self.expired_losses,
+                'reordered': self.reordered,
+                'duplicates': self.duplicates,
+                'highest_sequence': self.highest
+            }
+
+
+class FecEncoder:
+    """
+    ✅ NUEVO: Codificador FEC XOR por cliente.
+
+    Acumula los datagramas de audio ya sellados con secuencia y cada K emite un
+    paquete de paridad que permite reconstruir UNA pérdida del grupo sin
+    retransmisión. Grupos siempre consecutivos en la secuencia del cliente.
+    """
+
+    def __init__(self, k: int, rf_mode: bool = False):
+        self.k = max(2, min(int(k), 255))
+        self.rf_mode = rf_mode
+        self._group = []
+        self._base_sequence = None
+        self.packets_emitted = 0
+
+    @property
+    def overhead(self) -> float:
+        return 1.0 / self.k
+
+    def add(self, datagram, sequence: int):
+        """
+        Registrar un datagrama del cliente.
+
+        Returns:
+            Paquete FEC (bytearray) cuando se completa el grupo, si no None
+        """
+        if not self._group:
+            self._base_sequence = sequence
+        self._group.append(datagram)
+        if len(self._group) < self.k:
+            return None
+
+        group = self._group
+        self._group = []
+        fec = NativeAndroidProtocol.create_fec_packet(group, self._base_sequence, self.rf_mode)
+        if fec is not None:
+            self.packets_emitted += 1
+        return fec
+
+    def reset(self):
+        self._group = []
+        self._base_sequence = None
+
+
+class FecDecoder:
+    """
+    ✅ Decodificador FEC de referencia (lado receptor).
+
+    Guarda los últimos payloads por secuencia y, al recibir un paquete de
+    paridad (o un datagrama que completa un grupo pendiente), reconstruye el
+    datagrama faltante si es el único perdido.
+    """
+
+    HEADER_SIZE = NativeAndroidProtocol.HEADER_SIZE
+
+    def __init__(self, history: int = 1024):
+        self.history = history
+        self._payloads = {}
+        self._order = []
+        self._pending_fec = []
+        self.recovered = 0
+        self.unrecoverable = 0
+
+    def on_datagram(self, datagram) -> list:
+        """
+        Procesar un datagrama UDP (audio o FEC).
+
+        Returns:
+            Lista de datagramas de audio reconstruidos (normalmente vacía)
+        """
+        header = NativeAndroidProtocol.decode_header(bytes(datagram[:self.HEADER_SIZE]))
+        if not header:
+            return []
+        payload = bytes(datagram[self.HEADER_SIZE:self.HEADER_SIZE + header['payload_length']])
+
+        if header['msg_type'] == NativeAndroidProtocol.MSG_TYPE_FEC:
+            fec = NativeAndroidProtocol.decode_fec_payload(payload)
+            if fec:
+                self._pending_fec.append(fec)
+        elif header['msg_type'] == NativeAndroidProtocol.MSG_TYPE_AUDIO_UDP:
+            if len(payload) < 4:
+                return []
+            self._remember(_udp_sequence_of(payload), payload)
+        else:
+            return []
+
+        return self._try_recover()
+
+    def _remember(self, sequence, payload):
+        if sequence in self._payloads:
+            return
+        self._payloads[sequence] = payload
+        self._order.append(sequence)
+        if len(self._order) > self.history:
+            for old in self._order[:-self.history]:
+                self._payloads.pop(old, None)
+            del self._order[:-self.history]
+
+    def _try_recover(self) -> list:
+        recovered = []
+        still_pending = []
+        for fec in self._pending_fec:
+            group = [(fec['base_sequence'] + i) & 0xFFFFFFFF for i in range(fec['k'])]
+            missing = sum(1 for seq in group if seq not in self._payloads)
+            if missing == 0:
+                continue
+            if missing == 1:
+                datagram = NativeAndroidProtocol.recover_from_fec(fec, self._payloads)
+                if datagram is not None:
+                    payload = datagram[self.HEADER_SIZE:]
+                    self._remember(_udp_sequence_of(payload), payload)
+                    recovered.append(datagram)
+                    self.recovered += 1
+                continue
+            still_pending.append(fec)
+
+        # ✅ Grupos con 2+ pérdidas no se recuperan nunca: limitar la espera
+        if len(still_pending) > 8:
+            self.unrecoverable += len(still_pending) - 8
+            still_pending = still_pending[-8:]
+        self._pending_fec = still_pending
+        return recovered
+
+    def get_stats(self) -> dict:
+        return {
+            'recovered': self.recovered,
+            'unrecoverable': self.unrecoverable,
+            'pending_groups': len(self._pending_fec)
+        }
+
+
+def _udp_sequence_of(payload) -> int:
+    """Secuencia UDP (primeros 4 bytes big-endian del payload)"""
+    return int.from_bytes(payload[:4], 'big')
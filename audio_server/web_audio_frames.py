@@ -0,0 +1,108 @@
+"""
+web_audio_frames.py - Tramas binarias de audio para clientes web (evento 'audio_frame')
+✅ Un mensaje por cliente y periodo con TODOS sus canales (antes: un emit por canal y bloque)
+✅ Cabecera compacta: posición de muestra, lista de canales y formato
+✅ Salida int16 (la mitad de bytes) o float32
+✅ Acumulación compartida: el bloque se copia UNA vez, no una por cliente
+
+Formato (little-endian):
+    '<4sBBHIQ'  magic b'AMWF', versión, formato (0=float32, 1=int16),
+                nº de canales, frames por canal, sample_position
+    '<{n}H'     canales, en el orden del payload
+    payload     frames × canales intercalados (fila = instante)
+"""
+
+import struct
+import logging
+
+import numpy as np
+
+import config
+
+logger = logging.getLogger(__name__)
+
+FRAME_MAGIC = b'AMWF'
+FRAME_VERSION = 1
+FORMAT_FLOAT32 = 0
+FORMAT_INT16 = 1
+FORMATS = {'float32': FORMAT_FLOAT32, 'int16': FORMAT_INT16}
+
+_header_struct = struct.Struct('<4sBBHIQ')
+HEADER_SIZE = _header_struct.size
+
+
+def pack_audio_frame(sample_position: int, channels, samples: np.ndarray, fmt: int = FORMAT_INT16) -> bytes:
+    """Trama binaria de `samples` (frames × len(channels), float32 en [-1, 1])"""
+    if fmt == FORMAT_INT16:
+        payload = np.clip(samples, -1.0, 1.0)
+        payload *= 32767.0
+        payload = payload.astype('<i2')
+    else:
+        payload = samples.astype('<f4', copy=False)
+    header = _header_struct.pack(FRAME_MAGIC, FRAME_VERSION, fmt, len(channels),
+                                 samples.shape[0], sample_position)
+    channel_list = struct.pack(f'<{len(channels)}H', *channels)
+    return header + channel_list + payload.tobytes()
+
+
+def unpack_audio_frame(data: bytes):
+    """(sample_position, canales, samples frames × canales float32) - pruebas y herramientas"""
+    magic, version, fmt, num_channels, frames, sample_position = _header_struct.unpack_from(data)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION:
+        raise ValueError("Trama de audio web no reconocida")
+    channels = list(struct.unpack_from(f'<{num_channels}H', data, HEADER_SIZE))
+    offset = HEADER_SIZE + 2 * num_channels
+    dtype = '<i2' if fmt == FORMAT_INT16 else '<f4'
+    samples = np.frombuffer(data, dtype=dtype, offset=offset).reshape(frames, num_channels)
+    if fmt == FORMAT_INT16:
+        samples = samples.astype(np.float32) / 32767.0
+    return sample_position, channels, samples
+
+
+class WebFrameAccumulator:
+    """
+    Acumula bloques de captura (frames × canales) hasta completar un periodo.
+
+    `push(block)` devuelve [(sample_position, periodo)] con cada periodo
+    completado: un array nuevo que ya no se toca, así que los workers pueden
+    leerlo mientras se llena el siguiente. Solo lo usa el hilo de captura.
+    """
+
+    def __init__(self, num_channels: int, period_ms: float = None, sample_rate: int = None):
+        sample_rate = sample_rate or config.SAMPLE_RATE
+        period_ms = getattr(config, 'WEB_AUDIO_FRAME_MS', 20) if period_ms is None else period_ms
+        self.num_channels = num_channels
+        self.period_frames = max(1, int(round(sample_rate * period_ms / 1000.0)))
+        self.sample_position = 0       # Posición del primer frame del periodo en curso
+        self._buffer = np.empty((self.period_frames, num_channels), dtype=np.float32)
+        self._fill = 0
+
+    def push(self, block: np.ndarray) -> list:
+        completed = []
+        frames = block.shape[0]
+        offset = 0
+        while offset < frames:
+            n = min(frames - offset, self.period_frames - self._fill)
+            self._buffer[self._fill:self._fill + n] = block[offset:offset + n, :self.num_channels]
+            self._fill += n
+            offset += n
+            if self._fill == self.period_frames:
+                completed.append((self.sample_position, self._buffer))
+                self.sample_position += self.period_frames
+                self._buffer = np.empty((self.period_frames, self.num_channels), dtype=np.float32)
+                self._fill = 0
+        return completed
+
+
+def build_client_frame(sample_position: int, period: np.ndarray, channels, gains: dict,
+                       fmt: int = FORMAT_INT16):
+    """Trama de un cliente: sus canales del periodo con su ganancia (None si no hay canales)"""
+    num_channels = period.shape[1]
+    selected = [ch for ch in channels if 0 <= ch < num_channels]
+    if not selected:
+        return None
+    samples = period[:, selected]      # Una copia (indexado avanzado) para todos los canales
+    gain_vector = np.array([gains.get(ch, 1.0) for ch in selected], dtype=np.float32)
+    if np.any(gain_vector != 1.0):
+        samples *= gain_vector
+    return pack_audio_frame(sample_position, selected, samples, fmt)
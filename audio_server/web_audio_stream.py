@@ -0,0 +1,221 @@
+"""
+web_audio_stream.py - Audio a navegadores por WebSocket binario puro (ruta /ws/audio)
+✅ El control sigue en Socket.IO; este canal solo lleva tramas 'audio_frame' sin sobre
+✅ Suscripción en dos pasos: Socket.IO 'open_audio_stream' da un token de un solo uso
+✅ Cola acotada por conexión con política de descarte ('oldest' | 'newest')
+✅ Bucle de envío mínimo: un hilo por conexión (el de la petición HTTP)
+"""
+
+import time
+import secrets
+import threading
+import logging
+from collections import deque
+
+import config
+
+try:
+    from simple_websocket import Server as WebSocketServer, ConnectionClosed
+except ImportError:  # simple-websocket viene con Flask-SocketIO; sin él no hay ruta binaria
+    WebSocketServer = None
+    ConnectionClosed = Exception
+
+logger = logging.getLogger(__name__)
+
+DROP_POLICIES = ('oldest', 'newest')
+
+_hub_instance = None
+_hub_lock = threading.Lock()
+
+
+class AudioStreamConnection:
+    """Cola acotada de tramas de un navegador; la vacía su propio bucle de envío"""
+
+    def __init__(self, client_id: str, max_queue: int, drop_policy: str):
+        self.client_id = client_id
+        self.max_queue = max(1, max_queue)
+        self.drop_policy = drop_policy if drop_policy in DROP_POLICIES else 'oldest'
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self.closed = False
+        self.connected_at = time.time()
+
+        # Métricas
+        self.frames_queued = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.bytes_sent = 0
+
+    def offer(self, frame: bytes):
+        """Productor (workers de audio): nunca bloquea"""
+        with self._cond:
+            if self.closed:
+                return
+            if len(self._queue) >= self.max_queue:
+                self.frames_dropped += 1
+                if self.drop_policy == 'newest':
+                    return
+                self._queue.popleft()
+            self._queue.append(frame)
+            self.frames_queued += 1
+            self._cond.notify()
+
+    def next_frame(self, timeout: float):
+        """Consumidor (bucle de envío): siguiente trama o None (timeout/cerrada)"""
+        with self._cond:
+            if not self._queue and not self.closed:
+                self._cond.wait(timeout)
+            if self.closed or not self._queue:
+                return None
+            return self._queue.popleft()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._queue.clear()
+            self._cond.notify_all()
+
+    def get_stats(self) -> dict:
+        return {
+            'queued': len(self._queue),
+            'max_queue': self.max_queue,
+            'drop_policy': self.drop_policy,
+            'frames_queued': self.frames_queued,
+            'frames_sent': self.frames_sent,
+            'frames_dropped': self.frames_dropped,
+            'bytes_sent': self.bytes_sent,
+            'uptime_s': round(time.time() - self.connected_at, 1)
+        }
+
+
+class AudioStreamHub:
+    """
+    Conexiones binarias activas por client_id (sid de Socket.IO).
+
+    `offer(client_id, frame)` devuelve True si el cliente tiene canal binario
+    (la trama va a su cola); si devuelve False el emisor usa Socket.IO.
+    """
+
+    def __init__(self):
+        self.max_queue = getattr(config, 'WEB_AUDIO_WS_QUEUE_FRAMES', 8)
+        self.drop_policy = getattr(config, 'WEB_AUDIO_WS_DROP_POLICY', 'oldest')
+        self.token_ttl = getattr(config, 'WEB_AUDIO_WS_TOKEN_TTL', 30.0)
+        self._connections = {}
+        self._tokens = {}        # token -> (client_id, expira)
+        self._lock = threading.Lock()
+        self.connections_total = 0
+        self.rejected = 0
+
+    @property
+    def available(self) -> bool:
+        return WebSocketServer is not None and getattr(config, 'WEB_AUDIO_WS_ENABLED', True)
+
+    # ------------------------------------------------------------------
+    # Tokens (emitidos por Socket.IO, consumidos por la ruta /ws/audio)
+    # ------------------------------------------------------------------
+
+    def issue_token(self, client_id: str) -> str:
+        token = secrets.token_urlsafe(16)
+        now = time.monotonic()
+        with self._lock:
+            # Tokens caducados: pocos (uno por petición de navegador), barrido lineal
+            for stale in [t for t, (_, expires) in self._tokens.items() if expires < now]:
+                del self._tokens[stale]
+            self._tokens[token] = (client_id, now + self.token_ttl)
+        return token
+
+    def redeem_token(self, token: str):
+        with self._lock:
+            entry = self._tokens.pop(token, None)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    # ------------------------------------------------------------------
+    # Conexiones
+    # ------------------------------------------------------------------
+
+    def offer(self, client_id: str, frame: bytes) -> bool:
+        connection = self._connections.get(client_id)
+        if connection is None:
+            return False
+        connection.offer(frame)
+        return True
+
+    def has(self, client_id: str) -> bool:
+        return client_id in self._connections
+
+    def close(self, client_id: str):
+        """Cerrar el canal binario de un cliente (p.ej. al desconectar su Socket.IO)"""
+        with self._lock:
+            connection = self._connections.pop(client_id, None)
+        if connection is not None:
+            connection.close()
+
+    def serve(self, environ: dict, client_id: str):
+        """Aceptar el WebSocket y enviar tramas hasta que se cierre (hilo de la petición)"""
+        ws = WebSocketServer.accept(environ)
+        connection = AudioStreamConnection(client_id, self.max_queue, self.drop_policy)
+        with self._lock:
+            previous = self._connections.get(client_id)
+            self._connections[client_id] = connection
+            self.connections_total += 1
+        if previous is not None:
+            previous.close()  # Un solo canal binario por cliente: el nuevo reemplaza al viejo
+        logger.info(f"[AudioStream] 🔊 Canal binario abierto: {client_id[:8]}")
+
+        try:
+            while ws.connected:
+                frame = connection.next_frame(timeout=1.0)
+                if frame is None:
+                    if connection.closed:
+                        break
+                    continue
+                ws.send(frame)
+                connection.frames_sent += 1
+                connection.bytes_sent += len(frame)
+        except ConnectionClosed:
+            pass
+        except Exception as e:
+            logger.debug(f"[AudioStream] Error enviando a {client_id[:8]}: {e}")
+        finally:
+            with self._lock:
+                if self._connections.get(client_id) is connection:
+                    del self._connections[client_id]
+            connection.close()
+            try:
+                ws.close()
+            except Exception:
+                pass
+            logger.info(f"[AudioStream] 🔇 Canal binario cerrado: {client_id[:8]} "
+                        f"({connection.frames_sent} tramas, {connection.frames_dropped} descartadas)")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            connections = dict(self._connections)
+            pending_tokens = len(self._tokens)
+        return {
+            'available': self.available,
+            'connections': len(connections),
+            'connections_total': self.connections_total,
+            'rejected': self.rejected,
+            'pending_tokens': pending_tokens,
+            'per_client': {cid[:8]: conn.get_stats() for cid, conn in connections.items()}
+        }
+
+
+def init_audio_stream_hub() -> AudioStreamHub:
+    """Inicializar instancia única del hub de audio binario"""
+    global _hub_instance
+
+    with _hub_lock:
+        if _hub_instance is None:
+            _hub_instance = AudioStreamHub()
+        return _hub_instance
+
+
+def get_audio_stream_hub() -> AudioStreamHub:
+    """Obtener instancia del hub (se crea si aún no existe)"""
+    if _hub_instance is None:
+        return init_audio_stream_hub()
+    return _hub_instance
@@ -7,7 +7,7 @@ WebSocket Server - COMPLETE & FIXED
 ✅ NUEVO: Streaming de audio para cliente maestro
 """
 
-from flask import Flask, send_from_directory, request
+from flask import Flask, send_from_directory, request, Response
 from flask_socketio import SocketIO, emit, disconnect
 import time
 import os
@@ -20,6 +20,10 @@ import engineio.server
 import math
 import uuid  # ✅ NUEVO: Para generar device_uuid únicos
 from audio_server.audio_mixer import get_audio_mixer
+from audio_server.persistence import get_persistence_service
+from audio_server.ttl_cache import TTLCache
+from audio_server.web_audio_stream import get_audio_stream_hub
+from audio_server.latency_optimizer import get_optimizer, timed_handler
 
 # Configurar logging PRIMERO (antes de usarlo)
 logger = logging.getLogger(__name__)
@@ -66,22 +70,18 @@ def _load_ui_state_from_disk():
         logger.debug(f"[WebSocket] UI state load failed: {e}")
 
 
-def _save_ui_state_to_disk():
-    """Guardar estado global de UI a disco."""
-    try:
-        os.makedirs(os.path.dirname(UI_STATE_FILE) or '.', exist_ok=True)
-        with ui_state_lock:
-            payload = {
-                'client_order': ui_state.get('client_order', []),
-                'updated_at': ui_state.get('updated_at', 0)
-            }
+def _ui_state_snapshot() -> dict:
+    """Copia serializable del estado global de UI (hilo de persistencia)."""
+    with ui_state_lock:
+        return {
+            'client_order': list(ui_state.get('client_order', [])),
+            'updated_at': ui_state.get('updated_at', 0)
+        }
 
-        tmp_path = UI_STATE_FILE + '.tmp'
-        with open(tmp_path, 'w', encoding='utf-8') as f:
-            json.dump(payload, f, ensure_ascii=False, indent=2)
-        os.replace(tmp_path, UI_STATE_FILE)
-    except Exception as e:
-        logger.debug(f"[WebSocket] UI state save failed: {e}")
+
+def _save_ui_state_to_disk():
+    """Guardar estado global de UI a disco (write-behind, sin E/S en el handler)."""
+    get_persistence_service().mark_dirty('web_ui_state')
 
 
 def _get_client_order() -> list:
@@ -122,6 +122,7 @@ def _set_client_order(order: list, known_device_uuids: list) -> list:
 
 
 # Cargar estado al importar
+get_persistence_service().register_file('web_ui_state', UI_STATE_FILE, _ui_state_snapshot, indent=2)
 _load_ui_state_from_disk()
 
 # ✅ SUPRIMIR logs innecesarios
@@ -160,14 +161,27 @@ native_server_instance = None
 web_clients = {}  # ✅ NUEVO: Tracking de clientes web
 web_clients_lock = __import__('threading').Lock()
 
-# ✅ Estado persistente para clientes web (auto-reconexión)
-web_persistent_state = {}
-web_persistent_lock = __import__('threading').Lock()
+# ✅ NUEVO: Última lista de clientes emitida (base de los deltas de 'clients_update')
+_clients_view = {}          # client_id -> info tal como la tiene el navegador
+_clients_view_order = None  # último 'order' emitido
+_clients_view_version = 0
+_clients_view_uuids = {}    # device_uuid (o id) -> client_id en la vista (deduplicación)
+_clients_view_lock = threading.Lock()
+
+CLIENT_ACTIVITY_TIMEOUT = 10.0  # Segundos sin actividad = considerado desconectado
+
+# Campos que cambian con cada heartbeat: solo viajan junto a un cambio real
+_VOLATILE_CLIENT_FIELDS = frozenset(('last_activity', 'last_update', 'congestion'))
 
 # ✅ Configuración de limpieza de estados persistentes
 WEB_STATE_CACHE_TIMEOUT = 604800  # 7 días (1 semana)
 WEB_MAX_PERSISTENT_STATES = 200  # Máximo 200 estados (más para músicos recurrentes)
 
+# ✅ Estado persistente para clientes web (auto-reconexión)
+# ✅ OPTIMIZACIÓN: TTL/LRU con heap; set(pid, state, stamp=saved_at) al guardar
+web_persistent_state = TTLCache(ttl=WEB_STATE_CACHE_TIMEOUT, max_entries=WEB_MAX_PERSISTENT_STATES)
+web_persistent_lock = __import__('threading').Lock()
+
 # ✅ NUEVO: Callback para VU Levels
 def broadcast_audio_levels(levels):
     """
@@ -331,30 +345,13 @@ def push_master_gain_to_native(gainDb: float):
 
 
 def cleanup_expired_web_states():
-    """Limpiar estados persistentes expirados para web clients"""
-    current_time = time.time()
-    
+    """Limpiar estados persistentes expirados para web clients (solo los que caducan)"""
     with web_persistent_lock:
-        expired = [
-            pid for pid, state in web_persistent_state.items()
-            if current_time - state.get('saved_at', 0) > WEB_STATE_CACHE_TIMEOUT
-        ]
-        
-        for pid in expired:
-            logger.info(f"🗑️ Limpiando estado web expirado: {pid[:20]}")
-            del web_persistent_state[pid]
-        
-        # Limitar cantidad máxima de estados
-        if len(web_persistent_state) > WEB_MAX_PERSISTENT_STATES:
-            # Eliminar los más antiguos
-            sorted_states = sorted(
-                web_persistent_state.items(),
-                key=lambda x: x[1].get('saved_at', 0)
-            )
-            to_remove = len(web_persistent_state) - WEB_MAX_PERSISTENT_STATES
-            for pid, _ in sorted_states[:to_remove]:
+        for pid, _, reason in web_persistent_state.expire():
+            if reason == 'expired':
+                logger.info(f"🗑️ Limpiando estado web expirado: {pid[:20]}")
+            else:
                 logger.info(f"🗑️ Limpiando estado web por límite: {pid[:20]}")
-                del web_persistent_state[pid]
 
 
 def init_server(manager, native_server=None):
@@ -362,6 +359,9 @@ def init_server(manager, native_server=None):
     channel_manager = manager
     native_server_instance = native_server
     
+    # ✅ NUEVO: Salida agrupada de faders (web y Android)
+    get_optimizer().add_flush_handler(_flush_param_updates)
+    
     # ✅ Inyectar socketio en channel_manager para broadcasts
     if hasattr(channel_manager, 'set_socketio'):
         channel_manager.set_socketio(socketio)
@@ -413,6 +413,36 @@ def index():
     return response
 
 
+class _ClosedWebSocketResponse(Response):
+    """Respuesta tras un WebSocket ya cerrado: no hay HTTP que escribir"""
+    def __call__(self, *args, **kwargs):
+        # Werkzeug trata ConnectionError como desconexión del cliente (sin traza)
+        raise ConnectionError()
+
+
+@app.route('/ws/audio')
+def audio_stream_socket():
+    """
+    ✅ NUEVO: WebSocket binario de audio (sin sobre Socket.IO).
+    El navegador pide antes un token con 'open_audio_stream' y conecta a /ws/audio?token=...
+    """
+    hub = get_audio_stream_hub()
+    if not hub.available:
+        return "Audio stream disabled", 404
+    client_id = hub.redeem_token(request.args.get('token', ''))
+    if not client_id:
+        hub.rejected += 1
+        return "Invalid token", 403
+    with web_clients_lock:
+        subscribed = client_id in web_clients
+    if not subscribed:
+        hub.rejected += 1
+        return "Unknown client", 403
+
+    hub.serve(request.environ, client_id)
+    return _ClosedWebSocketResponse()
+
+
 @app.route('/<path:path>')
 def static_files(path):
     """Archivos estáticos"""
@@ -459,6 +489,7 @@ def _restore_client_channels_state(client_id: str, channel_manager) -> dict:
 
 
 @socketio.on('connect')
+@timed_handler('connect')
 def handle_connect(auth=None):
     """Cliente web conectado"""
     client_id = request.sid
@@ -556,8 +587,7 @@ def handle_connect(auth=None):
 
 
         # ✅ Enviar lista de clientes conectados (nativos + web)
-        clients_info = get_all_clients_info()
-        emit('clients_update', {'clients': clients_info})
+        clients_info = emit_clients_snapshot('clients_update')
 
         # ✅ Enviar estadísticas del servidor
         server_stats = get_server_stats()
@@ -584,6 +614,7 @@ def handle_connect(auth=None):
 
 
 @socketio.on('disconnect')
+@timed_handler('disconnect')
 def handle_disconnect():
     """Cliente web desconectado"""
     client_id = request.sid
@@ -594,6 +625,9 @@ def handle_disconnect():
     # ✅ NUEVO: Desregistrar listener de audio maestro si estaba activo
     unregister_master_audio_listener(client_id)
     
+    # ✅ NUEVO: Cerrar su canal binario de audio (si lo abrió)
+    get_audio_stream_hub().close(client_id)
+    
     # ✅ Remover de tracking
     with web_clients_lock:
         client_info = web_clients.pop(client_id, None)
@@ -612,7 +646,7 @@ def handle_disconnect():
     
     # ✅ Notificar a otros clientes
     try:
-        broadcast_clients_update()
+        broadcast_clients_update([client_id])
     except:
         pass
 
@@ -622,6 +656,7 @@ def handle_disconnect():
 # ============================================================================
 
 @socketio.on('subscribe')
+@timed_handler('subscribe')
 def handle_subscribe(data):
     """
     Suscribir cliente web a canales
@@ -701,7 +736,7 @@ def handle_subscribe(data):
         # Las configuraciones solo persisten en memoria durante la sesión actual
         
         # ✅ Notificar a otros clientes
-        broadcast_clients_update()
+        broadcast_clients_update([client_id])
         
     except Exception as e:
         logger.error(f"[WebSocket] ❌ Error en subscribe: {e}")
@@ -709,6 +744,7 @@ def handle_subscribe(data):
 
 
 @socketio.on('update_client_mix')
+@timed_handler('update_client_mix')
 def handle_update_client_mix(data):
     """
     ✅ Actualizar mezcla de un cliente específico (nativo o web)
@@ -812,7 +848,7 @@ def handle_update_client_mix(data):
             _save_client_config_to_registry(target_client_id)
             
             # ✅ Broadcast a todos (incluye el cambio completo)
-            broadcast_clients_update()
+            broadcast_clients_update([target_client_id])
 
             # ✅ Si el target es un cliente nativo conectado, empujar mix_state en tiempo real
             try:
@@ -835,6 +871,7 @@ def handle_update_client_mix(data):
 
 
 @socketio.on('get_clients')
+@timed_handler('get_clients')
 def handle_get_clients():
     """
     ✅ Obtener lista completa de clientes ACTIVOS (sin duplicados)
@@ -842,24 +879,8 @@ def handle_get_clients():
     update_client_activity(request.sid)
     
     try:
-        clients_info = get_all_clients_info()
-        
-        # ✅ NUEVO: Deduplicar por ID
-        seen_ids = set()
-        unique_clients = []
-        
-        for client in clients_info:
-            client_id = client.get('id')
-            if client_id not in seen_ids:
-                seen_ids.add(client_id)
-                unique_clients.append(client)
-        
-        emit('clients_list', {
-            'clients': unique_clients,
-            'order': _get_client_order(),
-            'timestamp': int(time.time() * 1000),
-            'total': len(unique_clients)
-        })
+        # ✅ NUEVO: Misma vista (y versión) sobre la que se calculan los deltas
+        unique_clients = emit_clients_snapshot('clients_list')
         
         logger.debug(f"[WebSocket] ✅ Lista de clientes enviada: {len(unique_clients)} activos")
         
@@ -869,6 +890,7 @@ def handle_get_clients():
 
 
 @socketio.on('set_client_order')
+@timed_handler('set_client_order')
 def handle_set_client_order(data):
     """✅ NUEVO: Setear orden global de clientes para TODOS los navegadores."""
     update_client_activity(request.sid)
@@ -903,7 +925,7 @@ def handle_set_client_order(data):
             'timestamp': int(time.time() * 1000)
         })
 
-        broadcast_clients_update()
+        broadcast_clients_update(())  # Solo cambia el orden
 
     except Exception as e:
         logger.error(f"[WebSocket] ❌ Error en set_client_order: {e}")
@@ -911,6 +933,7 @@ def handle_set_client_order(data):
 
 
 @socketio.on('set_client_name')
+@timed_handler('set_client_name')
 def handle_set_client_name(data):
     """
     ✅ NUEVO: Guardar nombre personalizado de cliente
@@ -972,7 +995,7 @@ def handle_set_client_name(data):
                 })
                 
                 # Notificar a todos los clientes de la actualización
-                broadcast_clients_update()
+                broadcast_clients_update([resolved_client_id])
             else:
                 emit('error', {'message': 'Failed to save custom name'})
         else:
@@ -984,6 +1007,7 @@ def handle_set_client_name(data):
 
 
 @socketio.on('update_gain')
+@timed_handler('update_gain')
 def handle_update_gain(data):
     """
     ✅ OPTIMIZADO + SINCRONIZADO: Actualizar ganancia (respuesta inmediata + sync a Android/otros web)
@@ -1015,6 +1039,7 @@ def handle_update_gain(data):
             channel_manager.update_client_mix(
                 client_id,
                 gains={channel: gain},
+                publish=False,   # Persistencia y mix_updated en el flush
             )
             
             # ✅ Respuesta inmediata al cliente que solicitó
@@ -1025,31 +1050,10 @@ def handle_update_gain(data):
                 'timestamp': int(time.time() * 1000)
             }, to=request.sid)
             
-            # ✅ SINCRONIZACIÓN BIDIRECCIONAL: Propagar a OTROS clientes web (broadcast)
-            socketio.emit('param_sync', {
-                'type': 'gain',
-                'channel': channel,
-                'value': gain,
-                'client_id': client_id,
-                'source': 'web',
-                'timestamp': int(time.time() * 1000)
-            }, skip_sid=request.sid)  # No enviar al que ya lo cambió
-            
-            # ✅ SINCRONIZACIÓN A ANDROID: Empujar estado al cliente nativo objetivo
-            try:
-                subscription = channel_manager.get_client_subscription(client_id)
-                if subscription and subscription.get('client_type') == 'native':
-                    if native_server_instance is not None:
-                        native_server_instance.push_mix_state_to_client(client_id)
-            except Exception as e:
-                if config.DEBUG:
-                    logger.debug(f"[WebSocket] Android sync failed: {e}")
-            
-            # ✅ NUEVO: Guardar estado de canales para persistencia
-            _save_client_config_to_registry(client_id)
-            
-            # Broadcast para actualizar estado en todos los clientes web
-            broadcast_clients_update()
+            # ✅ NUEVO: param_sync a otros web, push a Android, persistencia y broadcast
+            # agrupados por ventana (el fader ya sonó: ChannelManager está actualizado)
+            get_optimizer().queue_parameter_update(client_id, 'gain', channel, gain,
+                                                   source='web', skip_sid=request.sid)
             
             if config.DEBUG:
                 logger.debug(f"[WebSocket] ⚡ Gain CH{channel}: {gain:.2f} ({client_id[:8]}) [synced]")
@@ -1061,6 +1065,7 @@ def handle_update_gain(data):
 
 
 @socketio.on('update_pan')
+@timed_handler('update_pan')
 def handle_update_pan(data):
     """
     ✅ OPTIMIZADO + SINCRONIZADO: Actualizar panorama (respuesta inmediata + sync a Android/otros web)
@@ -1092,6 +1097,7 @@ def handle_update_pan(data):
             channel_manager.update_client_mix(
                 client_id,
                 pans={channel: pan},
+                publish=False,   # Persistencia y mix_updated en el flush
             )
             
             # ✅ Respuesta inmediata al cliente que solicitó
@@ -1102,31 +1108,10 @@ def handle_update_pan(data):
                 'timestamp': int(time.time() * 1000)
             }, to=request.sid)
             
-            # ✅ SINCRONIZACIÓN BIDIRECCIONAL: Propagar a OTROS clientes web (broadcast)
-            socketio.emit('param_sync', {
-                'type': 'pan',
-                'channel': channel,
-                'value': pan,
-                'client_id': client_id,
-                'source': 'web',
-                'timestamp': int(time.time() * 1000)
-            }, skip_sid=request.sid)  # No enviar al que ya lo cambió
-            
-            # ✅ SINCRONIZACIÓN A ANDROID: Empujar estado al cliente nativo objetivo
-            try:
-                subscription = channel_manager.get_client_subscription(client_id)
-                if subscription and subscription.get('client_type') == 'native':
-                    if native_server_instance is not None:
-                        native_server_instance.push_mix_state_to_client(client_id)
-            except Exception as e:
-                if config.DEBUG:
-                    logger.debug(f"[WebSocket] Android sync failed: {e}")
-            
-            # ✅ NUEVO: Guardar estado de canales para persistencia
-            _save_client_config_to_registry(client_id)
-            
-            # Broadcast para actualizar estado en todos los clientes web
-            broadcast_clients_update()
+            # ✅ NUEVO: param_sync a otros web, push a Android, persistencia y broadcast
+            # agrupados por ventana (el fader ya sonó: ChannelManager está actualizado)
+            get_optimizer().queue_parameter_update(client_id, 'pan', channel, pan,
+                                                   source='web', skip_sid=request.sid)
             
             if config.DEBUG:
                 logger.debug(f"[WebSocket] ⚡ Pan CH{channel}: {pan:.2f} ({client_id[:8]}) [synced]")
@@ -1138,6 +1123,7 @@ def handle_update_pan(data):
 
 
 @socketio.on('toggle_mute')
+@timed_handler('toggle_mute')
 def handle_toggle_mute(data):
     """
     ✅ NUEVO: Toggle mute de un canal (respuesta ultra-rápida)
@@ -1168,6 +1154,7 @@ def handle_toggle_mute(data):
             channel_manager.update_client_mix(
                 client_id,
                 mutes={channel: muted},
+                publish=False,   # Persistencia y mix_updated en el flush
             )
             
             # ✅ Respuesta inmediata al cliente que solicitó
@@ -1178,31 +1165,10 @@ def handle_toggle_mute(data):
                 'timestamp': int(time.time() * 1000)
             }, to=request.sid)
             
-            # ✅ SINCRONIZACIÓN BIDIRECCIONAL: Propagar a OTROS clientes web
-            socketio.emit('param_sync', {
-                'type': 'mute',
-                'channel': channel,
-                'value': muted,
-                'client_id': client_id,
-                'source': 'web',
-                'timestamp': int(time.time() * 1000)
-            }, skip_sid=request.sid)
-            
-            # ✅ SINCRONIZACIÓN A ANDROID: Enviar mix_state al cliente nativo objetivo
-            try:
-                subscription = channel_manager.get_client_subscription(client_id)
-                if subscription and subscription.get('client_type') == 'native':
-                    if native_server_instance is not None:
-                        native_server_instance.push_mix_state_to_client(client_id)
-            except Exception as e:
-                if config.DEBUG:
-                    logger.debug(f"[WebSocket] Android sync failed: {e}")
-            
-            # ✅ NUEVO: Guardar estado de canales para persistencia
-            _save_client_config_to_registry(client_id)
-            
-            # Broadcast para actualizar estado en todos los clientes web
-            broadcast_clients_update()
+            # ✅ NUEVO: param_sync a otros web, push a Android, persistencia y broadcast
+            # agrupados por ventana (el fader ya sonó: ChannelManager está actualizado)
+            get_optimizer().queue_parameter_update(client_id, 'mute', channel, muted,
+                                                   source='web', skip_sid=request.sid)
             
             if config.DEBUG:
                 logger.debug(f"[WebSocket] 🔇 Mute CH{channel}: {muted} ({client_id[:8]}) [synced]")
@@ -1213,23 +1179,78 @@ def handle_toggle_mute(data):
         emit('mute_toggled', {'status': 'error', 'channel': data.get('channel')})
 
 
-def validate_channels(channels, operational_channels):
+@socketio.on('set_client_mix_mode')
+@timed_handler('set_client_mix_mode')
+def handle_set_client_mix_mode(data):
+    """✅ NUEVO: Elegir por cliente nativo entre N canales o mezcla estéreo hecha en el servidor"""
+    client_id = data.get('target_client_id')
+    mix_mode = data.get('mix_mode')
+    update_client_activity(request.sid)
+    
+    if not channel_manager or not client_id:
+        emit('mix_mode_updated', {'status': 'error', 'client_id': client_id})
+        return
+    
+    try:
+        subscription = channel_manager.get_client_subscription(client_id)
+        if not subscription or subscription.get('client_type') != 'native':
+            emit('mix_mode_updated', {'status': 'error', 'client_id': client_id, 'error': 'not_native'})
+            return
+        
+        # ✅ Sin 'stereo' en los mix_modes del handshake el teléfono seguiría recibiendo canales
+        supports_mixdown = (native_server_instance is not None and
+                            native_server_instance.client_supports_mixdown(client_id))
+        if mix_mode == 'stereo' and not supports_mixdown:
+            emit('mix_mode_updated', {'status': 'error', 'client_id': client_id, 'error': 'unsupported'})
+            return
+        
+        if not channel_manager.set_client_mix_mode(client_id, mix_mode):
+            emit('mix_mode_updated', {'status': 'error', 'client_id': client_id, 'error': 'invalid_mode'})
+            return
+        
+        # ✅ El teléfono necesita saber si recibe canales o la mezcla
+        if native_server_instance is not None:
+            native_server_instance.push_mix_state_to_client(client_id)
+        
+        _save_client_config_to_registry(client_id)
+        
+        socketio.emit('mix_mode_updated', {
+            'status': 'ok',
+            'client_id': client_id,
+            'mix_mode': mix_mode,
+            'timestamp': int(time.time() * 1000)
+        })
+        broadcast_clients_update([client_id])
+        
+        logger.info(f"[WebSocket] 🎛️ Modo de mezcla {client_id[:8]}: {mix_mode}")
+    
+    except Exception as e:
+        logger.error(f"[WebSocket] Error set_client_mix_mode: {e}")
+        emit('mix_mode_updated', {'status': 'error', 'client_id': client_id})
+
+
+def validate_channels(channels, operational_channels=None):
     """✅ NUEVO: Validar canales contra los operacionales"""
     if not channels:
         return []
-    try:
-        channels = [int(ch) for ch in channels]
-    except (ValueError, TypeError):
-        return []
-    
-    valid = [ch for ch in channels if ch in operational_channels]
-    invalid = set(channels) - set(valid)
+    if operational_channels is None and channel_manager:
+        # ✅ OPTIMIZACIÓN: Máscara cacheada del ChannelManager (vectorizado)
+        valid, invalid = channel_manager.validate_channels(channels)
+    else:
+        try:
+            channels = [int(ch) for ch in channels]
+        except (ValueError, TypeError):
+            return []
+        operational_channels = operational_channels or frozenset()
+        valid = [ch for ch in channels if ch in operational_channels]
+        invalid = set(channels) - set(valid)
     if invalid:
         logger.warning(f"[WebSocket] ⚠️ Canales inválidos ignorados: {invalid}")
     return valid
 
 
 @socketio.on('sync_to_android')
+@timed_handler('sync_to_android')
 def handle_sync_to_android(data):
     """
     ✅ NUEVO: Sincronizar cambios web → Android
@@ -1259,9 +1280,8 @@ def handle_sync_to_android(data):
         if not subscription:
             return
         
-        # Validar canal contra operacionales
-        operational = channel_manager.get_operational_channels()
-        if channel not in operational:
+        # Validar canal contra operacionales (set cacheado, O(1))
+        if not channel_manager.is_operational(channel):
             logger.warning(f"[WebSocket] ⚠️ Canal {channel} no operacional")
             return
         
@@ -1294,6 +1314,9 @@ def handle_sync_to_android(data):
                 subscription['mutes'] = {}
             subscription['mutes'][channel] = bool(value)
             logger.debug(f"[WebSocket] 📊 Sync Web→Android: mute ch{channel}={value}")
+
+        # ✅ NUEVO: La suscripción se modificó directamente: refrescar motor de mezcla
+        channel_manager.notify_subscription_changed(target_client_id)
         
         # Empujar estado al cliente nativo si está conectado
         if subscription.get('client_type') == 'native':
@@ -1311,6 +1334,7 @@ def handle_sync_to_android(data):
 
 
 @socketio.on('disconnect_client')
+@timed_handler('disconnect_client')
 def handle_disconnect_client(data):
     """
     ✅ NUEVO: Forzar desconexión de un cliente
@@ -1338,7 +1362,7 @@ def handle_disconnect_client(data):
             disconnect(sid=target_client_id)
         
         # ✅ Broadcast actualización
-        broadcast_clients_update()
+        broadcast_clients_update([target_client_id])
         
         emit('client_disconnected', {
             'client_id': target_client_id,
@@ -1354,6 +1378,7 @@ def handle_disconnect_client(data):
 # ============================================================================
 
 @socketio.on('ping')
+@timed_handler('ping')
 def handle_ping(data):
     """
     Medir latencia de red
@@ -1368,6 +1393,7 @@ def handle_ping(data):
 
 
 @socketio.on('get_server_stats')
+@timed_handler('get_server_stats')
 def handle_get_server_stats():
     """
     ✅ NUEVO: Obtener estadísticas del servidor
@@ -1382,7 +1408,27 @@ def handle_get_server_stats():
         logger.error(f"[WebSocket] Error get_server_stats: {e}")
 
 
+@socketio.on('get_latency_stats')
+@timed_handler('get_latency_stats')
+def handle_get_latency_stats(data=None):
+    """
+    ✅ NUEVO: Latencia de los handlers de control por evento (p50/p90/p99 en ms)
+    data: {'reset': bool (opcional, empezar medición nueva tras responder)}
+    """
+    update_client_activity(request.sid)
+    
+    optimizer = get_optimizer()
+    emit('latency_stats', {
+        'timestamp': int(time.time() * 1000),
+        'since': int(optimizer.latency_since * 1000),
+        'handlers': optimizer.get_latency_stats()
+    })
+    if isinstance(data, dict) and data.get('reset'):
+        optimizer.reset_latency_stats()
+
+
 @socketio.on('heartbeat')
+@timed_handler('heartbeat')
 def handle_heartbeat(data):
     """
     ✅ NUEVO: Heartbeat explícito de cliente web (respuesta ultra-rápida)
@@ -1403,7 +1449,33 @@ def handle_heartbeat(data):
 # EVENTOS SOCKETIO - CLIENTE MAESTRO (AUDIO STREAMING)
 # ============================================================================
 
+@socketio.on('open_audio_stream')
+@timed_handler('open_audio_stream')
+def handle_open_audio_stream():
+    """
+    ✅ NUEVO: Pedir el canal binario de audio.
+    Responde 'audio_stream_ready' con la URL (token de un solo uso); a partir de
+    la conexión, las tramas 'audio_frame' de este cliente van por ahí en vez de por Socket.IO.
+    """
+    client_id = request.sid
+    update_client_activity(client_id)
+
+    hub = get_audio_stream_hub()
+    if not hub.available:
+        emit('error', {'message': 'Audio stream disabled'})
+        return
+
+    token = hub.issue_token(client_id)
+    emit('audio_stream_ready', {
+        'url': f'/ws/audio?token={token}',
+        'expires_in': hub.token_ttl,
+        'format': getattr(config, 'WEB_AUDIO_FRAME_FORMAT', 'int16'),
+        'sample_rate': config.SAMPLE_RATE
+    })
+
+
 @socketio.on('start_master_audio')
+@timed_handler('start_master_audio')
 def handle_start_master_audio():
     """
     ✅ NUEVO: Iniciar recepción de audio del cliente maestro
@@ -1448,6 +1520,7 @@ def handle_start_master_audio():
 
 
 @socketio.on('stop_master_audio')
+@timed_handler('stop_master_audio')
 def handle_stop_master_audio():
     """
     ✅ NUEVO: Detener recepción de audio del cliente maestro
@@ -1470,6 +1543,7 @@ def handle_stop_master_audio():
 
 
 @socketio.on('get_master_client_info')
+@timed_handler('get_master_client_info')
 def handle_get_master_client_info():
     """
     ✅ NUEVO: Obtener información del cliente maestro
@@ -1524,6 +1598,55 @@ def update_client_activity(client_id):
             web_clients[client_id]['last_activity'] = time.time()
 
 
+def _flush_param_updates(client_id, updates):
+    """
+    ✅ NUEVO: Salida agrupada de cambios de parámetros (hilo del LatencyOptimizer).
+    Un param_sync por parámetro distinto de la ventana, un solo mix_state a Android,
+    una escritura de estado, un mix_updated y un broadcast de clientes.
+    """
+    optimizer = get_optimizer()
+    timestamp = int(time.time() * 1000)
+    synced = 0
+    for (param_type, channel), value in updates['params'].items():
+        if param_type == 'mix':
+            continue   # Marcador de flush de update_mix, no es un parámetro
+        source, skip_sid = updates['origins'][(param_type, channel)]
+        socketio.emit('param_sync', {
+            'type': param_type,
+            'channel': channel,
+            'value': value,
+            'client_id': client_id,
+            'source': source,
+            'timestamp': timestamp
+        }, skip_sid=skip_sid)
+        synced += 1
+    optimizer.record_output('param_sync', synced)
+    
+    if 'web' in updates['sources'] and channel_manager:
+        # ✅ SINCRONIZACIÓN A ANDROID: Empujar estado al cliente nativo objetivo
+        try:
+            subscription = channel_manager.get_client_subscription(client_id)
+            if subscription and subscription.get('client_type') == 'native':
+                if native_server_instance is not None:
+                    native_server_instance.push_mix_state_to_client(client_id)
+                    optimizer.record_output('mix_state')
+        except Exception as e:
+            if config.DEBUG:
+                logger.debug(f"[WebSocket] Android sync failed: {e}")
+        
+        # ✅ Guardar estado de canales para persistencia
+        _save_client_config_to_registry(client_id)
+    
+    if channel_manager:
+        # Un mix_updated por ventana (Android ya persiste su configuración en su flush)
+        channel_manager.publish_client_mix(client_id, persist='web' in updates['sources'])
+        optimizer.record_output('mix_updated')
+    
+    # Broadcast para actualizar estado en todos los clientes web
+    broadcast_clients_update([client_id])
+    optimizer.record_output('clients_update')
+
+
 def _save_client_config_to_registry(client_id):
     """
     ✅ NUEVO: Guardar estado de canales de cliente de forma permanente
@@ -1548,6 +1671,7 @@ def _save_client_config_to_registry(client_id):
             'mutes': subscription.get('mutes', {}),
             'solos': list(subscription.get('solos', set())),
             'master_gain': subscription.get('master_gain', 1.0),
+            'mix_mode': subscription.get('mix_mode', 'channels'),
             'timestamp': int(time.time() * 1000)
         }
         
@@ -1564,6 +1688,45 @@ def _save_client_config_to_registry(client_id):
         logger.debug(f"[WebSocket] Error guardando estado de canales: {e}")
 
 
+def _is_visible_client(c, current_time, device_registry=None) -> bool:
+    """
+    ✅ Filtro de get_all_clients_info para un cliente:
+       maestro (si está habilitado) o native/android conectado, con actividad
+       reciente y activo en DeviceRegistry. Web y otros tipos no se muestran.
+    """
+    client_type = c.get('type', 'unknown')
+    is_master = c.get('is_master', False)
+    is_connected = c.get('connected', False)
+    last_activity = c.get('last_activity', 0)
+    device_uuid = c.get('device_uuid')
+    # Verificar activo en DeviceRegistry (✅ cacheado por ChannelManager)
+    is_active_registry = True
+    if device_registry and device_uuid:
+        is_active_registry = c.get('registry_active', False)
+
+    # ✅ MOSTRAR: Cliente maestro si está habilitado
+    if is_master:
+        return bool(getattr(config, 'MASTER_CLIENT_ENABLED', False))
+
+    # ✅ MOSTRAR: Clientes native/android SOLO si:
+    #   1. Están marcados como conectados
+    #   2. Tienen actividad reciente (CLIENT_ACTIVITY_TIMEOUT)
+    #   3. Están activos en DeviceRegistry
+    if client_type in ('native', 'android'):
+        idle = current_time - last_activity
+        if is_connected and idle < CLIENT_ACTIVITY_TIMEOUT and is_active_registry:
+            logger.debug(f"[WebSocket] ✅ Cliente activo mostrado: {c.get('id', 'unknown')[:12]} "
+                       f"(tipo: {client_type}, actividad: {idle:.1f}s, registry: {is_active_registry})")
+            return True
+        reason = "desconectado" if not is_connected else (f"inactivo ({idle:.1f}s)" if idle >= CLIENT_ACTIVITY_TIMEOUT else "no activo en registry")
+        logger.debug(f"[WebSocket] ⊘ Cliente ignorado ({reason}): {c.get('id', 'unknown')[:12]} "
+                   f"(tipo: {client_type}, registry: {is_active_registry})")
+        return False
+
+    # ✅ NO mostrar otros tipos (web, etc)
+    return False
+
+
 def get_all_clients_info():
     """
     ✅ Obtener información de clientes ACTIVOS para mostrar en web
@@ -1577,45 +1740,13 @@ def get_all_clients_info():
     """
     result_clients = []
     current_time = time.time()
-    activity_timeout = 10.0  # 10 segundos sin actividad = considerado desconectado
     
     if channel_manager:
         try:
-            all_info = channel_manager.get_all_clients_info()
             device_registry = getattr(channel_manager, 'device_registry', None)
-            for c in all_info:
-                client_type = c.get('type', 'unknown')
-                is_master = c.get('is_master', False)
-                is_connected = c.get('connected', False)
-                last_activity = c.get('last_activity', 0)
-                device_uuid = c.get('device_uuid')
-                # Verificar activo en DeviceRegistry
-                is_active_registry = True
-                if device_registry and device_uuid:
-                    dev = device_registry.get_device(device_uuid)
-                    is_active_registry = dev.get('active', False) if dev else False
-
-                # ✅ MOSTRAR: Cliente maestro si está habilitado
-                if is_master:
-                    if getattr(config, 'MASTER_CLIENT_ENABLED', False):
-                        result_clients.append(c)
-                    continue
-
-                # ✅ MOSTRAR: Clientes native/android SOLO si:
-                #   1. Están marcados como conectados
-                #   2. Tienen actividad reciente (últimos 3 minutos)
-                #   3. Están activos en DeviceRegistry
-                if client_type in ('native', 'android'):
-                    if is_connected and (current_time - last_activity) < activity_timeout and is_active_registry:
-                        result_clients.append(c)
-                        logger.debug(f"[WebSocket] ✅ Cliente activo mostrado: {c.get('id', 'unknown')[:12]} "
-                                   f"(tipo: {client_type}, actividad: {current_time - last_activity:.1f}s, registry: {is_active_registry})")
-                    else:
-                        reason = "desconectado" if not is_connected else (f"inactivo ({current_time - last_activity:.1f}s)" if (current_time - last_activity) >= activity_timeout else "no activo en registry")
-                        logger.debug(f"[WebSocket] ⊘ Cliente ignorado ({reason}): {c.get('id', 'unknown')[:12]} "
-                                   f"(tipo: {client_type}, registry: {is_active_registry})")
-                    continue
-                # ✅ NO mostrar otros tipos (web, etc)
+            for c in channel_manager.get_all_clients_info():
+                if _is_visible_client(c, current_time, device_registry):
+                    result_clients.append(c)
         except Exception as e:
             logger.error(f"[WebSocket] Error obteniendo clientes activos: {e}")
 
@@ -1679,47 +1810,200 @@ def get_server_stats():
         except:
             pass
         
+        # ✅ NUEVO: Latencia de handlers Socket.IO por evento (p50/p90/p99, ms)
+        stats['handler_latency'] = get_optimizer().get_latency_stats()
+        
+        # ✅ NUEVO: Coalescencia de parámetros (eventos recibidos vs mensajes emitidos)
+        stats['param_coalescing'] = get_optimizer().get_stats()
+        
+        # ✅ NUEVO: Canales binarios de audio (colas, descartes)
+        stats['audio_stream'] = get_audio_stream_hub().get_stats()
+        
+        # ✅ NUEVO: Caché de estados web (tamaño, caducados, desalojados)
+        with web_persistent_lock:
+            stats['web_state_cache'] = web_persistent_state.get_stats()
+        
     except Exception as e:
         logger.error(f"[WebSocket] Error obteniendo stats: {e}")
     
     return stats
 
 
-def broadcast_clients_update():
+def _diff_client(previous: dict, current: dict) -> dict:
+    """Campos distintos entre dos infos de cliente (los volátiles solo si hay otro cambio)"""
+    changed = {k: v for k, v in current.items() if previous.get(k) != v}
+    if changed and all(k in _VOLATILE_CLIENT_FIELDS for k in changed):
+        return {}
+    return changed
+
+
+def _view_key(info) -> str:
+    return info.get('device_uuid') or info.get('id')
+
+
+def _changed_clients_info(client_ids) -> dict:
+    """{client_id: info visible o None} solo para `client_ids` (sin recorrer el resto)"""
+    current = {}
+    now = time.time()
+    device_registry = getattr(channel_manager, 'device_registry', None) if channel_manager else None
+    for client_id in client_ids:
+        info = channel_manager.get_client_info(client_id) if channel_manager else None
+        if info is not None and not _is_visible_client(info, now, device_registry):
+            info = None
+        current[client_id] = info
+    return current
+
+
+def _dedupe_against_view(current: dict):
+    """
+    Con _clients_view_lock: un cliente cuyo device_uuid ya muestra otro cliente
+    de la vista se trata como no visible (misma deduplicación que la pasada completa).
+    """
+    for client_id, info in current.items():
+        if info is None:
+            continue
+        owner = _clients_view_uuids.get(_view_key(info))
+        if owner is not None and owner != client_id and current.get(owner, True) is not None:
+            current[client_id] = None
+
+
+def broadcast_clients_update(client_ids=None):
     """
     ✅ Optimización de la actualización de clientes.
     ✅ MEJORADO: Deduplicación automática y validación de clientes activos
+    ✅ NUEVO: Delta versionado contra la última lista emitida
+       {'delta': True, 'version', 'base_version', 'added': [info], 'removed': [id],
+        'changed': {id: {campo: valor}}, 'order'?}
+       Sin cambios no se emite nada; con WEB_CLIENTS_DELTA_UPDATES=False se envía la lista completa.
+    ✅ NUEVO: client_ids = clientes que cambiaron: solo se recalculan y comparan esos
+       (O(clientes cambiados)). None = pasada completa (conexión de un navegador,
+       get_clients y el hilo de mantenimiento, que detecta los que dejan de tener actividad).
     """
+    global _clients_view, _clients_view_order, _clients_view_version, _clients_view_uuids
     try:
-        clients_info = get_all_clients_info()
+        full = client_ids is None
+        if full:
+            clients_info = get_all_clients_info()
+            
+            # ✅ NUEVO: Deduplicar antes de enviar (por si acaso hay duplicados)
+            unique = {}
+            for client in clients_info:
+                client_id = client.get('id')
+                if client_id not in unique:
+                    unique[client_id] = client
+                else:
+                    logger.warning(f"[WebSocket] ⚠️ Duplicado detectado en broadcast: {client_id[:12]}")
+        else:
+            current = _changed_clients_info(set(client_ids))
         
-        # ✅ NUEVO: Deduplicar antes de enviar (por si acaso hay duplicados)
-        seen_ids = set()
-        unique_clients = []
+        order = _get_client_order()
         
-        for client in clients_info:
-            client_id = client.get('id')
-            if client_id not in seen_ids:
-                seen_ids.add(client_id)
-                unique_clients.append(client)
+        with _clients_view_lock:
+            previous = _clients_view
+            if full:
+                current = dict(unique)
+                current.update((client_id, None) for client_id in previous if client_id not in unique)
             else:
-                logger.warning(f"[WebSocket] ⚠️ Duplicado detectado en broadcast: {client_id[:12]}")
-        
-        socketio.emit('clients_update', {
-            'clients': unique_clients,
-            'order': _get_client_order(),
-            'timestamp': int(time.time() * 1000),
-            'count': len(unique_clients)
-        })
-        
-        if len(unique_clients) != len(clients_info):
-            logger.warning(f"[WebSocket] ⚠️ Se filtraron {len(clients_info) - len(unique_clients)} duplicados")
+                _dedupe_against_view(current)
+            
+            added = []
+            removed = []
+            changed = {}
+            for client_id, info in current.items():
+                before = previous.get(client_id)
+                if info is None:
+                    if before is not None:
+                        removed.append(client_id)
+                elif before is None:
+                    added.append(info)
+                else:
+                    fields = _diff_client(before, info)
+                    if fields:
+                        changed[client_id] = fields
+            order_changed = order != _clients_view_order
+            
+            if not (added or removed or changed or order_changed):
+                return
+            
+            base_version = _clients_view_version
+            _clients_view_version += 1
+            # Lo que el navegador tendrá tras aplicar el delta (volátiles incluidos)
+            if full:
+                view = {}
+                for client_id, info in unique.items():
+                    before = previous.get(client_id)
+                    view[client_id] = info if before is None or client_id in changed else before
+                _clients_view = view
+                _clients_view_uuids = {_view_key(info): client_id for client_id, info in view.items()}
+            else:
+                for client_id in removed:
+                    info = _clients_view.pop(client_id)
+                    if _clients_view_uuids.get(_view_key(info)) == client_id:
+                        del _clients_view_uuids[_view_key(info)]
+                for info in added:
+                    _clients_view[info['id']] = info
+                    _clients_view_uuids[_view_key(info)] = info['id']
+                for client_id in changed:
+                    info = current[client_id]
+                    old_key = _view_key(_clients_view[client_id])
+                    if old_key != _view_key(info) and _clients_view_uuids.get(old_key) == client_id:
+                        del _clients_view_uuids[old_key]
+                    _clients_view[client_id] = info
+                    _clients_view_uuids[_view_key(info)] = client_id
+            _clients_view_order = order
+            
+            if getattr(config, 'WEB_CLIENTS_DELTA_UPDATES', True):
+                payload = {
+                    'delta': True,
+                    'version': _clients_view_version,
+                    'base_version': base_version,
+                    'added': added,
+                    'removed': removed,
+                    'changed': changed,
+                    'timestamp': int(time.time() * 1000),
+                    'count': len(_clients_view)
+                }
+                if order_changed:
+                    payload['order'] = order
+            else:
+                payload = {
+                    'clients': list(_clients_view.values()),
+                    'order': order,
+                    'version': _clients_view_version,
+                    'timestamp': int(time.time() * 1000),
+                    'count': len(_clients_view)
+                }
+            # Emitir bajo el lock: los navegadores reciben las versiones en orden
+            socketio.emit('clients_update', payload)
+            count = len(_clients_view)
         
-        logger.info(f"[WebSocket] 📡 Actualización enviada: {len(unique_clients)} clientes activos")
+        logger.debug(f"[WebSocket] 📡 Actualización enviada: +{len(added)} -{len(removed)} "
+                     f"~{len(changed)} (v{_clients_view_version}, {count} activos)")
     except Exception as e:
         logger.error(f"[WebSocket] ❌ Error en broadcast_clients_update: {e}")
 
 
+def emit_clients_snapshot(event: str) -> list:
+    """
+    ✅ NUEVO: Lista completa para el navegador que la pide (conexión, get_clients).
+
+    Es exactamente la vista base de los deltas con su versión: primero se pone
+    al día (el resto recibe ese delta) y se emite bajo el lock, así ningún delta
+    posterior llega antes que la lista.
+    """
+    broadcast_clients_update()
+    with _clients_view_lock:
+        clients = list(_clients_view.values())
+        emit(event, {
+            'clients': clients,
+            'order': _clients_view_order if _clients_view_order is not None else _get_client_order(),
+            'timestamp': int(time.time() * 1000),
+            'total': len(clients),
+            'version': _clients_view_version
+        })
+    return clients
+
+
 def broadcast_client_disconnected(client_id):
     """
     ✅ NUEVO: Notificar desconexión de cliente específico
@@ -1811,6 +2095,10 @@ def start_maintenance_thread():
                     except Exception as e:
                         logger.debug(f"[WebSocket] Error limpiando nativos inactivos: {e}")
 
+                # ✅ NUEVO: Pasada completa de la lista de clientes (los avisos por evento solo
+                # recalculan el cliente afectado; aquí salen los que dejaron de tener actividad)
+                broadcast_clients_update()
+
                 # ✅ Limpiar estados persistentes expirados
                 cleanup_expired_web_states()
 
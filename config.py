@@ -34,6 +34,19 @@ WEBSOCKET_LATENCY_LOG = False       # Log detallado de latencias
 # ✅ Formato de respuesta rápida
 WEBSOCKET_QUICK_RESPONSE = True  # Respuesta inmediata sin broadcast completo
 
+# ✅ Bus de eventos de suscripción (ChannelManager): eventos recientes que se conservan
+# para que un consumidor se ponga al día por versión sin reconstruir todo
+SUBSCRIPTION_EVENT_LOG_SIZE = 512
+
+# ✅ 'clients_update' como delta versionado (added/removed/changed) en vez de la lista completa
+WEB_CLIENTS_DELTA_UPDATES = True
+
+# ✅ Faders (update_gain/pan/mute web y update_mix Android): el audio cambia al momento;
+# param_sync, mix_state a Android, persistencia y broadcast salen agrupados por ventana (0 = sin agrupar)
+PARAM_COALESCE_MS = 50
+PARAM_COALESCE_TICK_MS = 5         # Resolución del planificador (timer wheel de un solo hilo)
+PARAM_FLUSH_WORKERS = 4            # Hilos que ejecutan los flushes (envíos bloqueantes fuera de la rueda)
+
 # ============================================================================
 # ✅ FASE 2: CONFIGURACIÓN ASYNC SEND
 # ============================================================================
@@ -48,6 +61,50 @@ SEND_THREAD_COUNT = 1        # 1 hilo de envío por cliente
 # Por defecto: min(10, max(4, num_cpus))
 AUDIO_SEND_POOL_SIZE = 6  # Hilos de envío paralelo (ajusta según tu CPU)
 
+# ✅ Fan-out por shards: clientes TCP repartidos en AUDIO_SEND_POOL_SIZE hilos persistentes.
+# El hilo de captura solo encola (nunca espera); compensa a partir de ~25 clientes.
+NATIVE_SHARDED_FANOUT = False
+NATIVE_SHARD_QUEUE_DEPTH = 4      # Bloques encolados por shard antes de descartar
+NATIVE_SHARD_LAG_WARN_MS = 5.0    # Log de aviso si el lag máximo de un shard lo supera
+
+# ============================================================================
+# ✅ AUDIO UDP UNICAST (opcional, junto al canal de control TCP)
+# ============================================================================
+# El audio viaja por UDP (sin head-of-line blocking de TCP); el control sigue en TCP.
+# Un datagrama perdido = muestras perdidas, nunca un stream bloqueado (tipo RF).
+NATIVE_UDP_ENABLED = False
+NATIVE_UDP_PORT = 5102
+NATIVE_UDP_MAX_DATAGRAM = 1200  # Bytes por datagrama (bajo MTU WiFi 1500 - IP/UDP)
+NATIVE_UDP_SNDBUF = 262144
+
+# ✅ FEC XOR sobre UDP: 1 paquete de paridad cada K datagramas por cliente.
+# Recupera 1 pérdida por grupo sin retransmisión; overhead de ancho de banda = 1/K.
+# Solo se activa para clientes que lo piden en el handshake ('fec': true).
+NATIVE_FEC_ENABLED = False
+NATIVE_FEC_GROUP_SIZE = 8
+
+# ============================================================================
+# ✅ CONTROL DE CONGESTIÓN POR CLIENTE (TCP)
+# ============================================================================
+# Cada N bloques se mide la cola de envío del kernel (SIOCOUTQ, solo Linux; en
+# otras plataformas se usan los drops). Escalera: float32 → int16 → int16+zlib →
+# int16+zlib en lotes de 2 bloques. Zlib y lotes solo si el cliente anuncia
+# 'int16_zlib' en 'encodings' del handshake.
+NATIVE_CONGESTION_CONTROL = True
+NATIVE_CONGESTION_SAMPLE_BLOCKS = 32   # ~85ms con bloques de 128 @ 48kHz
+NATIVE_CONGESTION_HIGH = 0.5           # Ocupación de SO_SNDBUF para bajar un escalón
+NATIVE_CONGESTION_LOW = 0.1            # Ocupación para volver a subir
+NATIVE_CONGESTION_DOWN_SAMPLES = 2     # Muestras seguidas sobre HIGH para bajar
+NATIVE_CONGESTION_UP_SAMPLES = 24      # Muestras seguidas bajo LOW para subir (~2s)
+
+# ============================================================================
+# ✅ SAMPLE RATE REDUCIDO POR CLIENTE (talkback / click / borde de cobertura)
+# ============================================================================
+# El cliente pide 'sample_rate' (24000 o 16000) en el handshake; el servidor
+# decima con un FIR polifásico por grupo de canales (½ o ⅓ del ancho de banda).
+NATIVE_RESAMPLE_ENABLED = True
+NATIVE_RESAMPLE_TAPS_PER_PHASE = 16    # Taps por fase (48 taps a 16 kHz)
+
 # ============================================================================
 # COLAS (MaaDO DIRECTO PARA RF)
 # ============================================================================
@@ -108,6 +165,26 @@ MAINTENANCE_INTERVAL = 5.0  # ⚠️ REDUCIDO: 10s → 5s para limpieza más fre
 NATIVE_HEARTBEAT_INTERVAL = 5000  # ⚠️ AUMENTADO: 3s → 5s para procesar menos en servidor
 NATIVE_HEARTBEAT_TIMEOUT = 60  # Timeout después de 60 segundos sin respuesta
 
+# ✅ Mensajes de control (handshake, heartbeat, update_mix) en workers, no en el hilo de lectura
+NATIVE_CONTROL_WORKERS = 4         # Cada conexión queda fija en un worker (orden preservado)
+NATIVE_CONTROL_QUEUE_DEPTH = 64    # Mensajes pendientes por worker (heartbeats se descartan si está llena)
+
+# ✅ DeviceRegistry: escrituras a disco diferidas y agrupadas (segundos)
+DEVICE_REGISTRY_SAVE_DELAY = 1.0
+# 'json' (devices.json completo) | 'sqlite' (devices.db en WAL, upsert por fila; importa el JSON una vez)
+DEVICE_REGISTRY_BACKEND = 'json'
+
+# ✅ Persistencia write-behind compartida (devices.json, channels_state.json, web_ui_state.json, journal nativo)
+PERSISTENCE_WINDOW_MS = 500        # Ventana de agrupado por defecto de cada archivo
+PERSISTENCE_FSYNC = True           # fsync del temporal antes de os.replace
+PERSISTENCE_MAX_TARGETS = 16       # Destinos registrados como máximo (cola acotada: 1 pendiente por destino)
+
+# ✅ Estado de mezcla nativo: journal write-behind (config/client_states.json + .journal)
+NATIVE_STATE_JOURNAL_WINDOW_MS = 250          # Cambios agrupados por ventana (último valor gana)
+NATIVE_STATE_JOURNAL_FSYNC = 'interval'       # 'always' | 'interval' | 'never'
+NATIVE_STATE_JOURNAL_FSYNC_INTERVAL = 1.0     # Segundos entre fsync con política 'interval'
+NATIVE_STATE_JOURNAL_COMPACT_BYTES = 262144   # Compactar a snapshot al superar este tamaño
+
 # ============================================================================
 # DEBUG Y LOGS
 # ============================================================================
@@ -136,6 +213,15 @@ WEB_COMPRESSION = False
 WEB_ASYNC_SEND = True
 WEB_MAX_WORKERS = 4
 WEB_BINARY_MODE = True
+# ✅ Tramas 'audio_frame': todos los canales de un cliente en un mensaje binario por periodo
+WEB_AUDIO_FRAMES_ENABLED = True    # False = legado, un 'audio_channel' por canal y bloque
+WEB_AUDIO_FRAME_MS = 20            # Periodo de agregación (ms); 20ms = 960 muestras @ 48kHz
+WEB_AUDIO_FRAME_FORMAT = 'int16'   # 'int16' | 'float32'
+# ✅ WebSocket binario /ws/audio: las tramas van sin sobre Socket.IO a quien lo abra
+WEB_AUDIO_WS_ENABLED = True
+WEB_AUDIO_WS_QUEUE_FRAMES = 8      # Tramas en cola por conexión (8 × 20ms = 160ms)
+WEB_AUDIO_WS_DROP_POLICY = 'oldest'  # 'oldest' (prioriza latencia) | 'newest'
+WEB_AUDIO_WS_TOKEN_TTL = 30.0      # Segundos de validez del token de 'open_audio_stream'
 
 # ============================================================================
 # SEGURIDAD Y LÍMITES
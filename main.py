@@ -58,8 +58,18 @@ from audio_server.websocket_server import app, socketio, init_server
 
 from audio_server.device_registry import init_device_registry
 
+from audio_server.persistence import get_persistence_service
+
+from audio_server.latency_optimizer import get_optimizer
+
+from audio_server.web_audio_stream import get_audio_stream_hub
+
+from audio_server.web_audio_frames import WebFrameAccumulator, build_client_frame, FORMATS as FRAME_FORMATS, FORMAT_INT16
+
 from audio_server.audio_mixer import init_audio_mixer
 
+from audio_server.mix_engine import init_mix_engine, get_mix_engine
+
 import config
 
 from gui_monitor import AudioMonitorGUI
@@ -284,6 +294,13 @@ class AudioServerApp:
                 # Conectar mixer con audio capture
                 self.audio_capture.set_audio_mixer(audio_mixer)
             self.audio_capture.set_channel_manager(self.channel_manager)
+
+            # ✅ NUEVO: Motor de mezcla matricial (maestro + clientes con mixdown estéreo)
+            mix_engine = init_mix_engine(num_channels)
+            mix_engine.set_mix_arrays(self.channel_manager.mix_arrays)
+            self.channel_manager.add_event_listener(mix_engine.on_subscription_event)
+            mix_engine.sync_all(self.channel_manager.subscriptions)
+            self.audio_capture.set_mix_engine(mix_engine)
             
             if audio_mixer:
                 logger.info("[MAIN] ✅ AudioMixer conectado y configurado")
@@ -295,6 +312,9 @@ class AudioServerApp:
             # ✅ NUEVO: Pasar información del dispositivo físico
             self.native_server.set_physical_channels(self.audio_capture.physical_channels)
 
+            # ✅ NUEVO: Paquetes sellados con el instante ADC de cada bloque
+            self.native_server.set_clock_source(self.audio_capture)
+
             self.native_server.start()
 
             
@@ -484,6 +504,12 @@ class AudioServerApp:
                 
                 # ✅ NUEVO: Referencia al websocket_server para streaming de audio maestro
                 self.websocket_server_ref = None
+                # ✅ NUEVO: Tramas 'audio_frame' (todos los canales de un cliente por periodo)
+                self.frames_enabled = getattr(config, 'WEB_AUDIO_FRAMES_ENABLED', True)
+                self.frame_format = FRAME_FORMATS.get(getattr(config, 'WEB_AUDIO_FRAME_FORMAT', 'int16'), FORMAT_INT16)
+                self.frame_accumulator = None
+                self.frames_sent = 0
+                self.audio_stream_hub = get_audio_stream_hub()
 
                 
 
@@ -495,7 +521,7 @@ class AudioServerApp:
 
                 
 
-                if not self.channel_manager or not hasattr(self.channel_manager, 'subscriptions'):
+                if not self.channel_manager or not hasattr(self.channel_manager, 'routing'):
 
                     return
 
@@ -515,9 +541,27 @@ class AudioServerApp:
 
                 
 
-                # Snapshot de clientes
-
-                clients = list(self.channel_manager.subscriptions.items())
+                # ✅ NUEVO: Tabla de rutas inmutable: solo clientes con canales, sin copiar dicts
+                routing = self.channel_manager.routing
+                clients = [(entry.client_id, entry) for entry in routing.active]
+
+                # ✅ NUEVO: Mezcla del maestro tomada aquí (hilo de captura): el buffer
+                # del motor se reutiliza en el bloque siguiente
+                master_mix = self._master_mix_bytes()
+                # ✅ NUEVO: Con tramas por periodo solo el maestro se envía por bloque
+                periods = ()
+                if self.frames_enabled:
+                    periods = self._accumulate_frames(audio_data)
+                    # Solo navegadores: las rutas nativas no tienen sala Socket.IO (reciben por TCP/UDP)
+                    frame_clients = [c for c in clients
+                                     if c[1].client_type == 'web' and not c[1].is_master]
+                    clients = [c for c in clients if c[1].get('is_master', False)]
+                    for sample_position, period in periods:
+                        for client_id, subscription in frame_clients:
+                            if self.executor:
+                                self.executor.submit(self._send_frame, client_id, sample_position, period, subscription)
+                            else:
+                                self._send_frame(client_id, sample_position, period, subscription)
 
                 
 
@@ -535,7 +579,9 @@ class AudioServerApp:
 
                             audio_data,
 
-                            subscription
+                            subscription,
+
+                            master_mix
 
                         )
 
@@ -545,17 +591,31 @@ class AudioServerApp:
 
                     for client_id, subscription in clients:
 
-                        self._send_client_sync(client_id, audio_data, subscription)
+                        self._send_client_sync(client_id, audio_data, subscription, master_mix)
+
+            def _master_mix_bytes(self):
+                """✅ NUEVO: Mezcla estéreo del maestro (int16 intercalado) desde el motor matricial"""
+                engine = get_mix_engine()
+                if not engine or not hasattr(self.channel_manager, 'get_master_client_id'):
+                    return None
+                from audio_server import websocket_server
+                if not websocket_server.master_audio_listeners:
+                    return None
+                mix = engine.get_mix(self.channel_manager.get_master_client_id())
+                if mix is None:
+                    return None
+                # (frames × 2) en orden de filas ya está intercalado L/R
+                return (mix * 32767).astype(np.int16).tobytes()
 
             
 
-            def _send_client_async(self, client_id, audio_data, subscription):
+            def _send_client_async(self, client_id, audio_data, subscription, master_mix=None):
 
                 """✅ Envío asíncrono por cliente"""
 
                 try:
 
-                    if not isinstance(subscription, dict):
+                    if not subscription:
 
                         return
                     
@@ -575,7 +635,7 @@ class AudioServerApp:
                     
                     if is_master:
                         # ✅ Enviar audio mezclado al cliente maestro vía web
-                        self._send_master_audio(audio_data, channels, gains, pans, subscription)
+                        self._send_master_audio(audio_data, channels, gains, pans, subscription, master_mix)
                     else:
                         self._send_audio_optimized(client_id, audio_data, channels, gains)
                 except:
@@ -584,13 +644,13 @@ class AudioServerApp:
 
             
 
-            def _send_client_sync(self, client_id, audio_data, subscription):
+            def _send_client_sync(self, client_id, audio_data, subscription, master_mix=None):
 
                 """Envío síncrono (fallback)"""
 
                 try:
 
-                    if not isinstance(subscription, dict):
+                    if not subscription:
 
                         return
                     
@@ -611,14 +671,14 @@ class AudioServerApp:
                     
                     if is_master:
                         # ✅ Enviar audio mezclado al cliente maestro vía web
-                        self._send_master_audio(audio_data, channels, gains, pans, subscription)
+                        self._send_master_audio(audio_data, channels, gains, pans, subscription, master_mix)
                     else:
                         self._send_audio_optimized(client_id, audio_data, channels, gains)
                 except:
 
                     pass
             
-            def _send_master_audio(self, audio_data, channels, gains, pans, subscription):
+            def _send_master_audio(self, audio_data, channels, gains, pans, subscription, master_mix=None):
                 """✅ NUEVO: Enviar audio mezclado para el cliente maestro vía WebSocket"""
                 try:
                     from audio_server import websocket_server
@@ -627,8 +687,14 @@ class AudioServerApp:
                     if not websocket_server.master_audio_listeners:
                         return
                     
-                    mutes = {}
-                    master_gain = 1.0
+                    # ✅ NUEVO: Mezcla ya calculada por el motor matricial
+                    if master_mix is not None:
+                        websocket_server.broadcast_master_audio(master_mix, config.SAMPLE_RATE, 2)
+                        return
+                    
+                    # Fallback sin motor: mezcla canal a canal
+                    mutes = subscription.get('mutes', {})
+                    master_gain = subscription.get('master_gain', 1.0)
                     
                     # Determinar canales activos (no muteados)
                     active_channels = [ch for ch in channels if not mutes.get(ch, False)]
@@ -690,9 +756,35 @@ class AudioServerApp:
 
             
 
+            def _accumulate_frames(self, audio_data):
+                """✅ NUEVO: Copiar el bloque al periodo en curso; devuelve los periodos completados"""
+                accumulator = self.frame_accumulator
+                if accumulator is None or accumulator.num_channels != audio_data.shape[1]:
+                    accumulator = WebFrameAccumulator(audio_data.shape[1])
+                    self.frame_accumulator = accumulator
+                return accumulator.push(audio_data)
+            
+            def _send_frame(self, client_id, sample_position, period, subscription):
+                """✅ NUEVO: Un solo mensaje binario con todos los canales del cliente en el periodo"""
+                try:
+                    frame = build_client_frame(
+                        sample_position, period,
+                        subscription.get('channels', []), subscription.get('gains', {}),
+                        self.frame_format
+                    )
+                    if frame is None:
+                        return
+                    # ✅ NUEVO: Canal binario puro si el navegador lo abrió; si no, Socket.IO
+                    if not self.audio_stream_hub.offer(client_id, frame):
+                        socketio.emit('audio_frame', frame, to=client_id)
+                    self.frames_sent += 1
+                except Exception as e:
+                    if config.DEBUG:
+                        print(f"[WEB] Error envío trama: {e}")
+            
             def _send_audio_optimized(self, client_id, audio_data, channels, gains):
 
-                """✅ OPTIMIZADO: Envío por canal sin batch"""
+                """Envío por canal sin batch (legado, WEB_AUDIO_FRAMES_ENABLED = False)"""
 
                 try:
 
@@ -908,6 +1000,23 @@ class AudioServerApp:
 
         
 
+        # ✅ NUEVO: Volcar a disco lo pendiente del escritor write-behind
+
+        try:
+
+            get_optimizer().flush_all()
+
+
+            print("[Main] 💾 Volcando estado persistente...")
+
+            get_persistence_service().stop()
+
+        except Exception as e:
+
+            print(f"[Main] ⚠️ Error al volcar estado persistente: {e}")
+
+        
+
         self.server_running = False
 
         
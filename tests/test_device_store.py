@@ -0,0 +1,50 @@
+"""
+test_device_store.py - SqliteDeviceStore: un lote que falla vuelve a lo pendiente
+"""
+
+import sqlite3
+
+from audio_server.device_store import SqliteDeviceStore
+
+
+class _LockedConnection:
+    """Conexión cuya transacción falla como con la base de datos bloqueada"""
+
+    def __enter__(self):
+        raise sqlite3.OperationalError('database is locked')
+
+    def __exit__(self, *exc):
+        return False
+
+
+def _device(uuid, name):
+    return {'uuid': uuid, 'type': 'android', 'name': name, 'device_info': {}}
+
+
+def test_failed_batch_is_requeued_without_overwriting_newer_rows(tmp_path):
+    store = SqliteDeviceStore(str(tmp_path / 'devices.db'))
+    store.upsert_device(_device('a', 'old name'))
+    store.upsert_device(_device('b', 'kept'))
+    store.upsert_configuration('a', {'master_gain': 0.5})
+
+    store._write_pending(_LockedConnection())
+    assert store.write_errors == 1
+    assert store._committed == 0
+    assert len(store._pending) == 3
+
+    # Llegan cambios nuevos antes del reintento: ganan al lote fallido
+    store.upsert_device(_device('a', 'new name'))
+    store.delete_device('b')
+
+    conn = store._connect()
+    try:
+        store._write_pending(conn)
+    finally:
+        conn.close()
+    assert store._pending == {}
+    assert store._committed == store._enqueued
+
+    devices = store.load()
+    assert sorted(devices) == ['a']
+    assert devices['a']['name'] == 'new name'
+    assert devices['a']['configuration'] == {'master_gain': 0.5}
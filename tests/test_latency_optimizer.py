@@ -0,0 +1,59 @@
+"""
+test_latency_optimizer.py - Flushes agrupados: un handler lento no frena a los demás clientes
+"""
+
+import threading
+import time
+
+from audio_server.latency_optimizer import LatencyOptimizer
+
+
+def test_slow_flush_does_not_delay_other_clients():
+    optimizer = LatencyOptimizer(debounce_ms=10)
+    release = threading.Event()
+    flushed = {}
+
+    def handler(client_id, updates):
+        flushed[client_id] = time.perf_counter()
+        if client_id == 'congested':
+            release.wait(2.0)   # sendall bloqueado contra un teléfono congestionado
+
+    optimizer.add_flush_handler(handler)
+    start = time.perf_counter()
+    optimizer.queue_parameter_update('congested', 'gain', 0, 0.5, source='android')
+    time.sleep(0.03)
+    for i in range(3):
+        optimizer.queue_parameter_update(f'web-{i}', 'gain', 0, 0.5)
+    time.sleep(0.1)
+    try:
+        for i in range(3):
+            assert flushed[f'web-{i}'] - start < 0.1
+        assert optimizer.scheduler.get_stats()['max_lag_ms'] < 50
+    finally:
+        release.set()
+
+
+def test_flushes_of_one_client_stay_in_order():
+    optimizer = LatencyOptimizer(debounce_ms=5)
+    running = threading.Lock()
+    seen = []
+    overlaps = []
+
+    def handler(client_id, updates):
+        if not running.acquire(blocking=False):
+            overlaps.append(client_id)
+            return
+        try:
+            seen.append(updates['params'][('gain', 0)])
+            time.sleep(0.02)   # Más largo que la ventana: la siguiente vence durante el flush
+        finally:
+            running.release()
+
+    optimizer.add_flush_handler(handler)
+    for value in range(5):
+        optimizer.queue_parameter_update('phone', 'gain', 0, value, source='android')
+        time.sleep(0.012)
+    time.sleep(0.2)
+
+    assert overlaps == []
+    assert seen == sorted(seen) and seen[-1] == 4
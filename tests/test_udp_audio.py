@@ -0,0 +1,92 @@
+"""
+test_udp_audio.py - Transporte UDP por loopback: contadores de secuencia del receptor
+"""
+
+import socket
+
+import numpy as np
+import pytest
+
+from audio_server.native_protocol import NativeAndroidProtocol
+from audio_server.udp_audio import UdpAudioSender, UdpSequenceTracker
+
+
+def _template():
+    """Un datagrama UDP de audio (2 canales, 32 muestras) sin secuencia"""
+    audio = np.zeros((32, 2), dtype=np.float32)
+    datagrams = NativeAndroidProtocol.create_udp_audio_datagrams(audio, [0, 1], sample_position=0)
+    assert len(datagrams) == 1
+    return datagrams[0]
+
+
+@pytest.fixture
+def loopback():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    receiver.settimeout(1.0)
+    sender = UdpAudioSender.create('127.0.0.1', 0)
+    yield sender, receiver
+    sender.close()
+    receiver.close()
+
+
+def _send_and_track(sender, receiver, sequences, tracker):
+    template = _template()
+    addr = receiver.getsockname()
+    for seq in sequences:
+        sender.queue(NativeAndroidProtocol.stamp_udp_sequence(template, seq), addr)
+    sent, dropped, _ = sender.flush()
+    assert (sent, dropped) == (len(sequences), 0)
+
+    header_size = NativeAndroidProtocol.HEADER_SIZE
+    for _ in sequences:
+        data = receiver.recv(2048)
+        header = NativeAndroidProtocol.decode_header(data[:header_size])
+        assert header['msg_type'] == NativeAndroidProtocol.MSG_TYPE_AUDIO_UDP
+        payload = NativeAndroidProtocol.decode_udp_audio_payload(data[header_size:])
+        tracker.on_datagram(payload['sequence'])
+
+
+def test_loopback_loss_reorder_duplicate(loopback):
+    sender, receiver = loopback
+    sequences = [s for s in range(100) if s not in (10, 20, 21)]   # 3 perdidos
+    i = sequences.index(30)
+    sequences[i], sequences[i + 1] = sequences[i + 1], sequences[i]  # 31 antes que 30
+    sequences.remove(50)
+    sequences.insert(sequences.index(55) + 1, 50)                   # 50 llega tarde
+    sequences.insert(sequences.index(70) + 1, 70)                   # 70 duplicado
+
+    tracker = UdpSequenceTracker()
+    _send_and_track(sender, receiver, sequences, tracker)
+
+    stats = tracker.get_stats()
+    assert stats['received'] == len(sequences)
+    assert stats['lost'] == 3
+    assert stats['reordered'] == 2
+    assert stats['duplicates'] == 1
+    assert stats['highest_sequence'] == 99
+
+
+def test_loopback_sequence_wraparound(loopback):
+    sender, receiver = loopback
+    start = (1 << 32) - 4
+    sequences = [(start + i) & 0xFFFFFFFF for i in range(8)]       # ..., 2^32-1, 0, 1, 2, 3
+    late = sequences.pop(5)                                         # 1 llega al final
+    del sequences[2]                                                # 2^32-2 se pierde
+    sequences.append(late)
+
+    tracker = UdpSequenceTracker()
+    _send_and_track(sender, receiver, sequences, tracker)
+
+    stats = tracker.get_stats()
+    assert stats['lost'] == 1
+    assert stats['reordered'] == 1
+    assert stats['duplicates'] == 0
+    assert stats['highest_sequence'] == 3
+
+
+def test_gap_beyond_window_counts_as_expired_loss():
+    tracker = UdpSequenceTracker(window=16)
+    tracker.on_datagram(0)
+    assert tracker.on_datagram(100) == 'gap'
+    assert tracker.lost == 99
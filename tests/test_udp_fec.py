@@ -0,0 +1,76 @@
+"""
+test_udp_fec.py - FEC XOR: FecEncoder -> pérdidas -> FecDecoder
+"""
+
+import numpy as np
+
+from audio_server.native_protocol import NativeAndroidProtocol
+from audio_server.udp_audio import FecEncoder, FecDecoder
+
+HEADER_SIZE = NativeAndroidProtocol.HEADER_SIZE
+
+
+def _stamped_datagrams(count, samples_per_datagram=40):
+    """`count` datagramas con audio distinto y secuencia 0..count-1 (el último más corto)"""
+    rng = np.random.default_rng(1234)
+    frames = samples_per_datagram * count - samples_per_datagram // 2
+    audio = rng.uniform(-0.9, 0.9, size=(frames, 2)).astype(np.float32)
+    max_datagram = HEADER_SIZE + NativeAndroidProtocol.UDP_PAYLOAD_HEADER_SIZE + samples_per_datagram * 2 * 2
+    templates = NativeAndroidProtocol.create_udp_audio_datagrams(audio, [0, 1], 0, max_datagram=max_datagram)
+    assert len(templates) == count
+    return [NativeAndroidProtocol.stamp_udp_sequence(t, seq) for seq, t in enumerate(templates)]
+
+
+def _encode(datagrams, k):
+    """Secuencia en el cable: cada grupo de K seguido de su paquete de paridad"""
+    encoder = FecEncoder(k)
+    wire = []
+    for seq, datagram in enumerate(datagrams):
+        wire.append((seq, datagram))
+        fec = encoder.add(datagram, seq)
+        if fec is not None:
+            wire.append((None, fec))
+    return encoder, wire
+
+
+def test_single_loss_per_group_is_recovered_byte_identical():
+    datagrams = _stamped_datagrams(12)
+    encoder, wire = _encode(datagrams, k=4)
+    assert encoder.packets_emitted == 3
+
+    dropped = {1, 4, 11}   # Una por grupo, incluido el datagrama corto del final
+    decoder = FecDecoder()
+    recovered = {}
+    for seq, packet in wire:
+        if seq in dropped:
+            continue
+        for datagram in decoder.on_datagram(packet):
+            payload = NativeAndroidProtocol.decode_udp_audio_payload(datagram[HEADER_SIZE:])
+            recovered[payload['sequence']] = datagram
+
+    assert sorted(recovered) == sorted(dropped)
+    for seq in dropped:
+        original = bytes(datagrams[seq])
+        # El timestamp no viaja en la paridad; el resto del header y el payload sí
+        assert recovered[seq][:8] == original[:8]
+        assert recovered[seq][12:] == original[12:]
+    assert decoder.get_stats() == {'recovered': 3, 'unrecoverable': 0, 'pending_groups': 0}
+
+
+def test_two_losses_in_a_group_are_unrecoverable():
+    groups = 10
+    datagrams = _stamped_datagrams(4 * groups)
+    _, wire = _encode(datagrams, k=4)
+
+    decoder = FecDecoder()
+    recovered = []
+    for seq, packet in wire:
+        if seq is not None and seq % 4 in (0, 2):   # Dos pérdidas en cada grupo
+            continue
+        recovered.extend(decoder.on_datagram(packet))
+
+    assert recovered == []
+    stats = decoder.get_stats()
+    # Solo los últimos 8 grupos esperan llegadas tardías; los anteriores se dan por perdidos
+    assert stats['pending_groups'] == 8
+    assert stats['unrecoverable'] == groups - 8